@@ -0,0 +1,73 @@
+"""多图合并识别性能测试：比较逐张识别和多图合并为一次请求的调用次数、token用量和耗时
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_batching <笔记链接> [<笔记链接> ...] --api-key <豆包API Key> --model <模型ID>
+    python -m benchmarks.bench_batching <笔记链接> ... --batch-size 6 --workers 4
+
+每篇笔记分别用两种方式识别一次（不使用缓存），输出每篇笔记的调用次数、输入/输出token和识别耗时，
+以及合并识别中解析失败、退回单张识别的图片数。
+"""
+import argparse
+import os
+import time
+
+import ocr_core
+
+
+# 识别一篇笔记的全部图片
+def run_note(images, client, model_id, workers, batch_size):
+    """返回 (耗时统计列表, 识别耗时秒数)"""
+    ocr_timings = [None] * len(images)
+    started = time.perf_counter()
+    for event, idx, data in ocr_core.extract_texts_concurrently(images, client, model_id, workers,
+                                                                batch_size=batch_size):
+        if event == "done":
+            ocr_timings[idx] = data[1]
+    return ocr_timings, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较逐张识别和多图合并识别的调用次数、token用量和耗时")
+    parser.add_argument("urls", nargs="+", help="小红书笔记链接")
+    parser.add_argument("--batch-size", type=int, default=ocr_core.OCR_BATCH_SIZE, help="每次请求合并的图片数")
+    parser.add_argument("--workers", type=int, default=4, help="同时进行的识别请求数量")
+    parser.add_argument("--api-key", default=os.environ.get("ARK_API_KEY"), help="豆包API Key")
+    parser.add_argument("--model", default=os.environ.get("ARK_MODEL_ID"), help="豆包模型ID")
+    args = parser.parse_args(argv)
+
+    if not args.api_key or not args.model:
+        parser.error("请通过 --api-key/--model 或环境变量 ARK_API_KEY/ARK_MODEL_ID 提供豆包API Key和模型ID")
+
+    client = ocr_core.create_doubao_client(args.api_key)
+    modes = [("逐张", 1), (f"合并{args.batch_size}张", args.batch_size)]
+    totals = {name: {"api_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0} for name, _ in modes}
+
+    print(f"{'笔记':<26}{'图片':>6}{'方式':>10}{'调用次数':>10}{'输入tokens':>12}{'输出tokens':>12}{'耗时(s)':>10}{'单张重试':>10}")
+    for url in args.urls:
+        content = ocr_core.fetch_xhs_content(url)
+        if "error" in content:
+            print(f"{url[-24:]:<26} 抓取失败: {content['error']}")
+            continue
+        images = content.get("images", [])
+        if not images:
+            continue
+
+        for name, batch_size in modes:
+            ocr_timings, seconds = run_note(images, client, args.model, args.workers, batch_size)
+            usage = ocr_core.summarize_ocr_usage(ocr_timings)
+            fallbacks = sum(1 for timings in ocr_timings if timings.get("batch_fallback"))
+            for field, value in usage.items():
+                totals[name][field] += value
+            totals[name]["seconds"] += seconds
+            print(f"{url[-24:]:<26}{len(images):>6}{name:>10}{usage['api_calls']:>10}{usage['prompt_tokens']:>12}"
+                  f"{usage['completion_tokens']:>12}{seconds:>10.1f}{fallbacks:>10}")
+
+    print()
+    for name, _ in modes:
+        total = totals[name]
+        print(f"{name}：调用 {total['api_calls']} 次，输入 {total['prompt_tokens']} tokens，"
+              f"输出 {total['completion_tokens']} tokens，识别耗时 {total['seconds']:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""术语表索引的建立和查找性能测试，使用随机生成的术语，不调用模型
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_glossary
+    python -m benchmarks.bench_glossary --terms 50000 --texts 2000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fanyi_glossary import Glossary
+
+
+def random_chinese(rng, length):
+    return "".join(chr(rng.randint(0x4e00, 0x62ff)) for _ in range(length))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测试术语表自动机的建立耗时和每条文字的查找耗时")
+    parser.add_argument("--terms", type=int, default=20000, help="术语数")
+    parser.add_argument("--texts", type=int, default=1000, help="查找的文字条数")
+    parser.add_argument("--length", type=int, default=40, help="每条文字的字数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    pairs = [(random_chinese(rng, rng.randint(2, 6)), f"Term {number}") for number in range(args.terms)]
+    started = time.perf_counter()
+    glossary = Glossary(pairs)
+    print(f"建立 {len(glossary)} 条术语的索引耗时 {time.perf_counter() - started:.2f} 秒")
+
+    # 每条文字中插入几个术语
+    texts = []
+    for _ in range(args.texts):
+        parts = [random_chinese(rng, args.length // 4) for _ in range(4)]
+        for position in rng.sample(range(4), rng.randint(0, 3)):
+            parts[position] += rng.choice(pairs)[0]
+        texts.append("".join(parts))
+
+    timings = []
+    found = []
+    for text in texts:
+        started = time.perf_counter()
+        matches = glossary.find(text)
+        timings.append((time.perf_counter() - started) * 1000)
+        found.append(len(matches))
+    timings.sort()
+    p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    print(f"查找 p50 {statistics.median(timings):.3f} ms ｜ p95 {p95:.3f} ms ｜ 平均命中 {statistics.mean(found):.2f} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""笔记全文索引的写入和查询性能测试，使用随机生成的笔记，不访问网络
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_index
+    python -m benchmarks.bench_index --notes 300000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from ocr_index import NoteIndex
+
+
+# 查询用的词，生成的文字中按 KEYWORD_RATE 的比例出现，其余为随机汉字
+KEYWORD_RATE = 0.02
+WORDS = ("包邮", "优惠", "注册", "账号", "立即", "领取", "新品", "上市", "成都", "美食", "攻略", "周末",
+         "护肤", "防晒", "敏感肌", "测评", "口红", "色号", "穿搭", "通勤", "显瘦", "健身", "减脂", "食谱",
+         "租房", "避坑", "指南", "旅行", "酒店", "民宿", "咖啡", "探店", "宝宝", "辅食", "数码", "耳机",
+         "iPhone15", "MacBook", "SPF50", "2024", "限时", "折扣", "会员", "积分", "兑换", "教程", "干货")
+
+
+def random_text(rng, words):
+    return "".join(rng.choice(WORDS) if rng.random() < KEYWORD_RATE else chr(rng.randint(0x4e00, 0x62ff))
+                   for _ in range(words))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测试笔记全文索引的写入速度和查询耗时")
+    parser.add_argument("--notes", type=int, default=50000, help="写入的笔记数")
+    parser.add_argument("--images", type=int, default=6, help="每篇笔记的图片数")
+    parser.add_argument("--queries", type=int, default=100, help="查询次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    fd, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    os.unlink(path)
+    try:
+        index = NoteIndex(path)
+        started = time.perf_counter()
+        for number in range(args.notes):
+            image_texts = {f"图片{i + 1}": random_text(rng, 60) for i in range(args.images)}
+            index.add(f"{number:024x}", f"https://www.xiaohongshu.com/explore/{number:024x}",
+                      random_text(rng, 8), random_text(rng, 40), image_texts)
+        write_seconds = time.perf_counter() - started
+        print(f"写入 {args.notes} 篇笔记耗时 {write_seconds:.1f} 秒（{args.notes / write_seconds:.0f} 篇/秒），"
+              f"索引文件 {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+
+        print(f"{'查询':<20}{'p50(ms)':>10}{'p95(ms)':>10}{'匹配笔记数':>12}")
+        samples = [rng.choice(WORDS) for _ in range(args.queries // 2)]
+        samples += [f"{rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(args.queries - len(samples))]
+        for label, queries in (("单个词", samples[:args.queries // 2]), ("两个词", samples[args.queries // 2:]),
+                               ("单个字", [rng.choice(WORDS)[0] for _ in range(20)])):
+            timings = []
+            matches = []
+            for query in queries:
+                started = time.perf_counter()
+                results = index.search(query, limit=20)
+                matches.append(index.count_matches(query))
+                timings.append((time.perf_counter() - started) * 1000)
+                assert len(results) <= 20
+            timings.sort()
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            print(f"{label:<20}{statistics.median(timings):>10.1f}{p95:>10.1f}{statistics.median(matches):>12.0f}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
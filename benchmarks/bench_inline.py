@@ -0,0 +1,148 @@
+"""图片内联提交性能测试：比较直接提交图片URL和本地压缩后内联提交
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_inline <图片URL> [<图片URL> ...]
+    python -m benchmarks.bench_inline <图片URL> ... --api-key <豆包API Key> --model <模型ID>
+
+不提供图片URL时，使用本地HTTP服务提供的生成图片，只测试下载、压缩耗时和请求体大小。
+提供API Key和模型ID时，额外测量两种方式调用豆包模型的端到端耗时。
+"""
+import argparse
+import http.server
+import io
+import json
+import os
+import statistics
+import threading
+import time
+
+import ocr_core
+
+
+# 生成示例图片
+def build_sample_images(count=4, size=(3024, 4032)):
+    """生成带文字的大尺寸示例图片（PNG），模拟手机拍摄的笔记图片"""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i in range(count):
+        image = Image.new('RGB', size, (250, 246, 238))
+        draw = ImageDraw.Draw(image)
+        for line in range(60):
+            y = 80 + line * 64
+            draw.text((120, y), f"Sample note {i} line {line}: 0123456789 ABCDEFGHIJ", fill=(30, 30, 30))
+            draw.rectangle((120, y + 40, 120 + (line * 37) % 2600, y + 44), fill=(200, 120, 90))
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        images.append(buffer.getvalue())
+    return images
+
+
+# 启动本地图片服务
+def serve_images(images):
+    """在本地端口提供示例图片，返回 (服务对象, 图片URL列表)"""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            index = int(self.path.strip('/').split('.')[0])
+            body = images[index]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, [f"{base_url}/{i}.png" for i in range(len(images))]
+
+
+# 请求体大小
+def request_payload_size(image_url, model_id):
+    """按照 extract_text_from_image_doubao 的消息格式计算请求体字节数"""
+    body = {
+        "model": model_id,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url}},
+                {"type": "text", "text": ocr_core.OCR_PROMPT},
+            ],
+        }],
+    }
+    return len(json.dumps(body, ensure_ascii=False).encode('utf-8'))
+
+
+# 测量端到端耗时
+def time_ocr_call(image_url, client, model_id, inline_max_edge):
+    started = time.perf_counter()
+    text = ocr_core.extract_text_with_cache(image_url, client, model_id, inline_max_edge=inline_max_edge)
+    return (time.perf_counter() - started) * 1000, text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较图片URL提交和本地压缩内联提交的耗时与请求体大小")
+    parser.add_argument("urls", nargs="*", help="图片URL")
+    parser.add_argument("--max-edge", type=int, default=ocr_core.INLINE_IMAGE_MAX_EDGE, help="压缩后的最长边像素")
+    parser.add_argument("--api-key", default=os.environ.get("ARK_API_KEY"), help="豆包API Key（可选）")
+    parser.add_argument("--model", default=os.environ.get("ARK_MODEL_ID"), help="豆包模型ID（可选）")
+    args = parser.parse_args(argv)
+
+    if ocr_core.Image is None:
+        parser.error("需要安装Pillow才能测试内联提交")
+
+    server = None
+    urls = args.urls
+    if not urls:
+        server, urls = serve_images(build_sample_images())
+
+    model_id = args.model or "model"
+    client = ocr_core.create_doubao_client(args.api_key) if args.api_key and args.model else None
+
+    rows = []
+    for url in urls:
+        started = time.perf_counter()
+        original = ocr_core.download_image(url)
+        download_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        data_url = ocr_core.encode_inline_image(original, args.max_edge)
+        encode_ms = (time.perf_counter() - started) * 1000
+
+        row = {
+            "url": url,
+            "original_kb": len(original) / 1024,
+            "url_payload_kb": request_payload_size(url, model_id) / 1024,
+            "inline_payload_kb": request_payload_size(data_url, model_id) / 1024,
+            "download_ms": download_ms,
+            "encode_ms": encode_ms,
+        }
+        if client is not None:
+            row["url_e2e_ms"], _ = time_ocr_call(url, client, args.model, None)
+            row["inline_e2e_ms"], _ = time_ocr_call(url, client, args.model, args.max_edge)
+        rows.append(row)
+
+    if server is not None:
+        server.shutdown()
+
+    print(f"{'图片':<40}{'原图(KB)':>10}{'URL请求(KB)':>13}{'内联请求(KB)':>14}{'下载(ms)':>10}{'压缩(ms)':>10}", end="")
+    print(f"{'URL端到端(ms)':>16}{'内联端到端(ms)':>16}" if client else "")
+    for row in rows:
+        print(f"{row['url'][-38:]:<40}{row['original_kb']:>10.1f}{row['url_payload_kb']:>13.2f}"
+              f"{row['inline_payload_kb']:>14.1f}{row['download_ms']:>10.1f}{row['encode_ms']:>10.1f}", end="")
+        print(f"{row['url_e2e_ms']:>16.0f}{row['inline_e2e_ms']:>16.0f}" if client else "")
+
+    print()
+    print(f"原图合计 {sum(r['original_kb'] for r in rows):.1f} KB，"
+          f"内联请求合计 {sum(r['inline_payload_kb'] for r in rows):.1f} KB，"
+          f"本地预处理中位数 {statistics.median(r['download_ms'] + r['encode_ms'] for r in rows):.1f} ms/张")
+    if client:
+        print(f"端到端中位数：URL方式 {statistics.median(r['url_e2e_ms'] for r in rows):.0f} ms，"
+              f"内联方式 {statistics.median(r['inline_e2e_ms'] for r in rows):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""翻译记忆库的写入和查询性能测试，使用随机生成的界面文字，不调用模型
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_memory
+    python -m benchmarks.bench_memory --entries 300000 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from fanyi_memory import TranslationMemory
+
+
+# 界面文字中常见的词，随机组合成 2~12 个字的原文
+WORDS = ("注册", "登录", "立即", "账号", "密码", "忘记", "确认", "取消", "保存", "删除", "编辑", "设置",
+         "会员", "标准", "高级", "订单", "支付", "成功", "失败", "重试", "加载", "更多", "分享", "收藏")
+
+
+def random_source(rng):
+    length = rng.randint(2, 12)
+    text = ""
+    while len(text) < length:
+        text += rng.choice(WORDS) if rng.random() < 0.3 else chr(rng.randint(0x4e00, 0x62ff))
+    return text[:length]
+
+
+def percentiles(timings):
+    timings.sort()
+    p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    return statistics.median(timings), p95
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测试翻译记忆库的写入速度和精确/相似查询耗时")
+    parser.add_argument("--entries", type=int, default=100000, help="写入的条目数")
+    parser.add_argument("--queries", type=int, default=200, help="查询次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    fd, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    os.unlink(path)
+    try:
+        memory = TranslationMemory(path)
+        sources = [random_source(rng) for _ in range(args.entries)]
+        started = time.perf_counter()
+        for start in range(0, len(sources), 1000):
+            memory.store_many({source: ["Translation 1", "Translation 2", "Translation 3"]
+                               for source in sources[start:start + 1000]})
+        write_seconds = time.perf_counter() - started
+        print(f"写入 {memory.size()} 条耗时 {write_seconds:.1f} 秒，"
+              f"记忆库文件 {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+
+        print(f"{'查询':<20}{'p50(ms)':>10}{'p95(ms)':>10}{'平均结果数':>12}")
+        samples = rng.sample(sources, min(args.queries, len(sources)))
+        # 精确查询带上空白和标点，相似查询替换最后一个字
+        for label, lookup, queries in (
+                ("精确（命中）", memory.lookup, [f" {source}！" for source in samples]),
+                ("精确（未命中）", memory.lookup, [random_source(rng) + "字" for _ in samples]),
+                ("相似", memory.fuzzy, [source[:-1] + "字" for source in samples])):
+            timings = []
+            found = []
+            for query in queries:
+                started = time.perf_counter()
+                result = lookup(query)
+                timings.append((time.perf_counter() - started) * 1000)
+                found.append(len(result) if isinstance(result, list) and lookup == memory.fuzzy
+                             else int(result is not None))
+            p50, p95 = percentiles(timings)
+            print(f"{label:<20}{p50:>10.3f}{p95:>10.3f}{statistics.mean(found):>12.2f}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
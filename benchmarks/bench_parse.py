@@ -0,0 +1,138 @@
+"""页面解析性能测试
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_parse saved_pages/*.html
+    python -m benchmarks.bench_parse saved_pages/ --repeat 20
+
+参数为保存下来的小红书笔记页面HTML文件或目录；不提供时使用内置生成的示例页面。
+对每个页面分别使用可用的HTML解析器运行 parse_xhs_page，输出每页解析耗时。
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+import ocr_core
+
+
+# 生成示例页面
+def build_sample_page(image_count=9, comment_count=2000):
+    """生成一个带有较大 __INITIAL_STATE__ 的示例笔记页面"""
+    note_id = "64a1b2c3d4e5f6a7b8c9d0e1"
+    image_list = [
+        {
+            "urlDefault": f"http://sns-webpic-qc.xhscdn.com/202401/img{i:03d}!nd_dft_wlteh_webp_3",
+            "urlPre": f"http://sns-webpic-qc.xhscdn.com/202401/img{i:03d}!nd_prv_wlteh_webp_3",
+            "width": 1080,
+            "height": 1440,
+            "infoList": [
+                {"imageScene": "WB_PRV", "url": f"http://sns-webpic-qc.xhscdn.com/202401/img{i:03d}!nd_prv_wlteh_webp_3"},
+                {"imageScene": "WB_DFT", "url": f"http://sns-webpic-qc.xhscdn.com/202401/img{i:03d}!nd_dft_wlteh_webp_3"},
+            ],
+        }
+        for i in range(image_count)
+    ]
+    comments = [
+        {
+            "id": f"c{i}",
+            "content": "评论内容 " * 10,
+            "userInfo": {"avatar": f"https://sns-avatar-qc.xhscdn.com/avatar/{i}.jpg", "nickname": f"用户{i}"},
+            "pictures": [{"urlDefault": f"http://sns-webpic-qc.xhscdn.com/comment/{i}.jpg"}],
+        }
+        for i in range(comment_count)
+    ]
+    state = {
+        "note": {
+            "noteDetailMap": {
+                note_id: {
+                    "note": {"noteId": note_id, "title": "示例笔记", "desc": "示例描述", "imageList": image_list},
+                    "comments": {"list": comments},
+                }
+            }
+        },
+        "feed": {"items": [{"cover": {"urlDefault": f"http://sns-webpic-qc.xhscdn.com/feed/{i}.jpg"}} for i in range(200)]},
+    }
+    state_js = json.dumps(state, ensure_ascii=False).replace('"nickname"', '"extra":undefined,"nickname"')
+    slides = "".join(
+        f'<div class="swiper-slide"><img src="{image["urlDefault"]}"></div>' for image in image_list
+    )
+    filler = "".join(f'<div class="item"><span>文本{i}</span><a href="/x/{i}">链接</a></div>' for i in range(3000))
+    return (
+        "<html><head><title>示例笔记 - 小红书</title>"
+        '<meta property="og:title" content="示例笔记">'
+        '<meta name="description" content="示例描述">'
+        f'<meta property="og:image" content="{image_list[0]["urlDefault"]}">'
+        f"</head><body>{slides}{filler}"
+        "<script>window.__SSR__=true;</script>"
+        f"<script>window.__INITIAL_STATE__={state_js}</script>"
+        "</body></html>"
+    )
+
+
+# 收集页面文件
+def collect_pages(paths):
+    """展开目录和通配符，返回 (名称, HTML内容) 列表"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.htm*"))))
+        else:
+            files.extend(sorted(glob.glob(path)))
+    pages = []
+    for file_path in files:
+        with open(file_path, encoding="utf-8", errors="replace") as f:
+            pages.append((os.path.basename(file_path), f.read()))
+    return pages
+
+
+# 可用的解析器
+def available_parsers():
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        parsers.insert(0, "lxml")
+    except ImportError:
+        pass
+    return parsers
+
+
+# 测量单个页面的解析耗时
+def time_parse(html, parser, repeat):
+    """返回每次解析的耗时（毫秒）和解析结果"""
+    ocr_core.HTML_PARSER = parser
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = ocr_core.parse_xhs_page(html)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测试 parse_xhs_page 的单页解析耗时")
+    parser.add_argument("pages", nargs="*", help="保存的笔记页面HTML文件或目录")
+    parser.add_argument("--repeat", type=int, default=10, help="每个页面重复解析的次数")
+    args = parser.parse_args(argv)
+
+    pages = collect_pages(args.pages) if args.pages else [("sample.html", build_sample_page())]
+    if not pages:
+        parser.error("未找到页面文件")
+
+    default_parser = ocr_core.HTML_PARSER
+    print(f"{'页面':<32}{'大小(KB)':>10}{'解析器':>14}{'图片数':>8}{'平均(ms)':>12}{'中位数(ms)':>12}{'最快(ms)':>12}")
+    try:
+        for name, html in pages:
+            for html_parser in available_parsers():
+                timings, result = time_parse(html, html_parser, args.repeat)
+                print(f"{name[:30]:<32}{len(html.encode('utf-8')) / 1024:>10.1f}{html_parser:>14}"
+                      f"{len(result.get('images', [])):>8}{statistics.mean(timings):>12.2f}"
+                      f"{statistics.median(timings):>12.2f}{min(timings):>12.2f}")
+    finally:
+        ocr_core.HTML_PARSER = default_parser
+
+
+if __name__ == "__main__":
+    main()
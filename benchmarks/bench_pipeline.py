@@ -0,0 +1,222 @@
+"""离线端到端性能测试：抓取→解析→识别 全流程，不访问小红书和豆包API
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline saved_pages/ --notes 200 --levels 1 4 8 16
+    python -m benchmarks.bench_pipeline --latency 0.8 --jitter 0.3 --error-rate 0.02 --throttle-rate 0.05
+
+笔记页面由本地HTTP代理提供：参数为保存下来的笔记页面HTML文件或目录，不提供时使用内置生成的示例页面。
+图片识别请求发给本地的OpenAI兼容服务，按设置的延迟、错误率（500）和限流率（429）返回模拟结果。
+在每个并发级别下用批量模式（ocr_batch.run_batch）处理全部笔记，输出每分钟笔记数、
+单篇笔记耗时的p50/p95、识别请求数和Python内存峰值。
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import ocr_batch
+import ocr_core
+from benchmarks.bench_parse import build_sample_page, collect_pages
+
+
+# 示例页面中的笔记ID，提供页面时替换为请求的笔记ID
+SAMPLE_NOTE_ID = "64a1b2c3d4e5f6a7b8c9d0e1"
+
+
+# 启动本地页面代理
+def serve_pages(pages):
+    """以HTTP代理方式提供笔记页面：第k篇笔记返回第 k % len(pages) 个页面，返回 (服务对象, 代理地址)"""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            note_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+            index = int(note_id[-8:], 16) if "/explore/" in self.path else 0
+            body = pages[index % len(pages)].replace(SAMPLE_NOTE_ID, note_id).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# 启动本地模拟识别服务
+def serve_fake_ocr(latency=0.5, jitter=0.2, per_image=0.1, error_rate=0.0, throttle_rate=0.0, seed=None):
+    """OpenAI兼容的 /chat/completions 模拟服务，返回 (服务对象, base_url, 请求统计)"""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"requests": 0, "errors": 0, "throttled": 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            image_count = sum(1 for part in body["messages"][0]["content"] if part.get("type") == "image_url")
+            with rng_lock:
+                stats["requests"] += 1
+                roll = rng.random()
+                delay = max(0.0, rng.gauss(latency + per_image * image_count, jitter))
+
+            if roll < throttle_rate:
+                with rng_lock:
+                    stats["throttled"] += 1
+                self._send_json(429, {"error": {"code": "RateLimitExceeded.EndpointRPMExceeded",
+                                                "message": "Too many requests", "type": "TooManyRequests"}})
+                return
+            time.sleep(delay)
+            if roll < throttle_rate + error_rate:
+                with rng_lock:
+                    stats["errors"] += 1
+                self._send_json(500, {"error": {"code": "InternalServiceError", "message": "模拟服务错误"}})
+                return
+
+            if image_count > 1:
+                text = "\n".join(f"<image_{i}>\n模拟识别文字 {i}\n</image_{i}>" for i in range(1, image_count + 1))
+            else:
+                text = "模拟识别文字\n第二行"
+            usage = {"prompt_tokens": 60 + 800 * image_count, "completion_tokens": 20 * image_count,
+                     "total_tokens": 60 + 820 * image_count}
+            if body.get("stream"):
+                self._send_stream(body["model"], text, usage)
+            else:
+                self._send_json(200, {
+                    "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": usage,
+                })
+
+        def _send_json(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, model, text, usage):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+            for offset in range(0, len(text), 4):
+                chunk = dict(base, choices=[{"index": 0, "delta": {"content": text[offset:offset + 4]}}])
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v3", stats
+
+
+# 运行一个并发级别
+def run_level(urls, client, proxy_url, level, batch_size, max_rps):
+    """用 level 个笔记线程、2*level 个识别线程处理全部笔记，返回统计结果"""
+    ocr_core.configure_http_session(max_connections_per_host=level * 2)
+    ocr_core.get_http_session().proxies.update({'http': proxy_url})
+    ocr_core.configure_rate_limiter(rate=max_rps, max_rate=max_rps)
+
+    fd, output_path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    os.unlink(output_path)
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        ocr_batch.run_batch(urls, output_path, client, "bench-model", note_workers=level, ocr_workers=level * 2,
+                            cache=None, page_cache=None, dedupe_images=False, batch_size=batch_size,
+                            log=lambda message: None)
+        elapsed = time.perf_counter() - started
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    with open(output_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    os.unlink(output_path)
+
+    latencies = sorted(record.get("elapsed_seconds", 0) for record in records if "error" not in record)
+    failed_images = sum(1 for record in records for image in record.get("images", []) if image["status"] == "error")
+    return {
+        "notes_per_minute": len(records) / elapsed * 60,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else sum(latencies),
+        "failed_notes": sum(1 for record in records if "error" in record),
+        "failed_images": failed_images,
+        "peak_mb": peak_bytes / (1024 * 1024),
+        "elapsed": elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线测试 抓取→解析→识别 全流程在不同并发级别下的吞吐、延迟和内存")
+    parser.add_argument("pages", nargs="*", help="保存的笔记页面HTML文件或目录")
+    parser.add_argument("--notes", type=int, default=60, help="每个并发级别处理的笔记数")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8], help="并发级别（同时处理的笔记数）")
+    parser.add_argument("--batch-size", type=int, default=1, help="每次识别请求合并的图片数")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟识别服务的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="模拟延迟的标准差（秒）")
+    parser.add_argument("--per-image", type=float, default=0.1, help="每张图片额外增加的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回500的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="模拟服务返回429的比例")
+    parser.add_argument("--max-rps", type=float, default=1000.0, help="限速器的请求速率上限（次/秒）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args(argv)
+
+    pages = [html for _, html in collect_pages(args.pages)] if args.pages else [build_sample_page()]
+    if not pages:
+        parser.error("未找到页面文件")
+
+    page_server, proxy_url = serve_pages(pages)
+    ocr_server, base_url, ocr_stats = serve_fake_ocr(args.latency, args.jitter, args.per_image,
+                                                     args.error_rate, args.throttle_rate, args.seed)
+    client = ocr_core.create_doubao_client("bench-key", base_url=base_url)
+    # 代理只处理http请求，链接使用http协议
+    urls = [f"http://www.xiaohongshu.com/explore/{index:024x}" for index in range(args.notes)]
+
+    print(f"页面 {len(pages)} 个，每级 {args.notes} 篇笔记，模拟延迟 {args.latency}±{args.jitter} 秒，"
+          f"错误率 {args.error_rate:.0%}，限流率 {args.throttle_rate:.0%}，每次请求 {args.batch_size} 张图片")
+    print(f"{'并发':>6}{'笔记/分钟':>12}{'p50(s)':>10}{'p95(s)':>10}{'识别请求':>10}{'500':>6}{'429':>6}"
+          f"{'失败笔记':>10}{'失败图片':>10}{'内存峰值(MB)':>14}{'总耗时(s)':>11}")
+    try:
+        for level in args.levels:
+            before = dict(ocr_stats)
+            result = run_level(urls, client, proxy_url, level, args.batch_size, args.max_rps)
+            print(f"{level:>6}{result['notes_per_minute']:>12.1f}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+                  f"{ocr_stats['requests'] - before['requests']:>10}{ocr_stats['errors'] - before['errors']:>6}"
+                  f"{ocr_stats['throttled'] - before['throttled']:>6}{result['failed_notes']:>10}"
+                  f"{result['failed_images']:>10}{result['peak_mb']:>14.1f}{result['elapsed']:>11.1f}")
+    finally:
+        page_server.shutdown()
+        ocr_server.shutdown()
+
+    print()
+    print(f"进程最大常驻内存 {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
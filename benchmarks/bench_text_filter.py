@@ -0,0 +1,98 @@
+"""无文字图片预筛选的阈值调整：在标注样本上计算不同阈值下的精确率和召回率
+
+用法（在仓库根目录运行）:
+    python -m benchmarks.bench_text_filter samples/
+    python -m benchmarks.bench_text_filter --log .cache/text_filter.jsonl
+
+标注样本目录下分为 text/（有文字）和 notext/（无文字）两个子目录，放入对应的图片文件。
+也可以使用运行时的判定记录：未被跳过的图片以“识别是否找到文字”作为标注（被跳过的图片没有标注，不参与统计）。
+以“无文字”为正类：精确率 = 跳过的图片中确实无文字的比例，召回率 = 无文字图片中被跳过的比例。
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+import ocr_textfilter
+
+
+THRESHOLDS = (0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.08, 0.12)
+
+
+# 读取标注样本
+def load_samples(directory):
+    """返回 [(文件名, 是否有文字, 评分), ...] 和单张评分耗时（毫秒）列表"""
+    samples = []
+    timings = []
+    for label, has_text in (("text", True), ("notext", False)):
+        for path in sorted(glob.glob(os.path.join(directory, label, "*"))):
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            started = time.perf_counter()
+            try:
+                score = ocr_textfilter.text_presence_score(image_bytes)["score"]
+            except Exception:
+                continue
+            timings.append((time.perf_counter() - started) * 1000)
+            samples.append((os.path.basename(path), has_text, score))
+    return samples, timings
+
+
+# 读取判定记录
+def load_decision_log(path):
+    """判定记录中已知识别结果的图片，返回 [(URL, 是否有文字, 评分), ...]"""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("ocr_found_text") is not None:
+                samples.append((entry["url"], entry["ocr_found_text"], entry["score"]))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在标注样本上评估无文字图片预筛选的阈值")
+    parser.add_argument("samples", nargs="?", help="标注样本目录（含 text/ 和 notext/ 子目录）")
+    parser.add_argument("--log", help="使用运行时的判定记录（JSONL）代替标注样本")
+    parser.add_argument("--show-errors", action="store_true", help="列出当前默认阈值下误判的样本")
+    args = parser.parse_args(argv)
+
+    if ocr_textfilter.Image is None:
+        parser.error("需要安装Pillow")
+    if args.log:
+        samples, timings = load_decision_log(args.log), []
+    elif args.samples:
+        samples, timings = load_samples(args.samples)
+    else:
+        parser.error("请提供标注样本目录或 --log 判定记录")
+    if not samples:
+        parser.error("没有可用的样本")
+
+    textless = sum(1 for _, has_text, _ in samples if not has_text)
+    print(f"样本 {len(samples)} 张（无文字 {textless} 张）", end="")
+    print(f"，评分中位数耗时 {statistics.median(timings):.1f} ms/张" if timings else "")
+    print(f"{'阈值':>8}{'跳过':>8}{'精确率':>10}{'召回率':>10}{'漏识别有文字图片':>18}")
+    for threshold in sorted(set(THRESHOLDS) | {ocr_textfilter.TEXT_FILTER_MIN_SCORE}):
+        skipped = [(name, has_text) for name, has_text, score in samples if score < threshold]
+        true_skips = sum(1 for _, has_text in skipped if not has_text)
+        precision = true_skips / len(skipped) if skipped else 1.0
+        recall = true_skips / textless if textless else 0.0
+        marker = " *" if threshold == ocr_textfilter.TEXT_FILTER_MIN_SCORE else ""
+        print(f"{threshold:>8.3f}{len(skipped):>8}{precision:>10.1%}{recall:>10.1%}"
+              f"{len(skipped) - true_skips:>18}{marker}")
+
+    if args.show_errors:
+        print()
+        print(f"默认阈值 {ocr_textfilter.TEXT_FILTER_MIN_SCORE} 下的误判：")
+        for name, has_text, score in samples:
+            if (score < ocr_textfilter.TEXT_FILTER_MIN_SCORE) == has_text:
+                print(f"  {'有文字被跳过' if has_text else '无文字未跳过'}  {score:.4f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import streamlit as st
 import anthropic
+from prompt_cache import format_usage, stream_message
+from tag_stream import TagStreamParser
 
 st.title("简历优化")
 
@@ -23,22 +25,10 @@ if st.button("优化简历"):
         
     client = anthropic.Anthropic(api_key=api_key)
     
-    prompt = f"""你是一位专业的简历优化顾问，擅长根据特定职位需求来优化求职者的简历内容。你的任务是根据给定的职位和简历部分，对简历内容进行优化和改进。请仔细阅读以下信息，并按照指示进行操作。
+    # 固定的说明放在 system 中（短于最小缓存长度，目前不会缓存），职位和简历内容放在用户消息中
+    system_prompt = """你是一位专业的简历优化顾问，擅长根据特定职位需求来优化求职者的简历内容。你的任务是根据给定的职位和简历部分，对简历内容进行优化和改进。请仔细阅读以下信息，并按照指示进行操作。
 
-职位名称：
-<job_title>
-{job_title}
-</job_title>
-
-简历部分：
-<resume_section>
-{selected_section}
-</resume_section>
-
-原始简历内容：
-<resume_content>
-{resume_content}
-</resume_content>
+用户会在<job_title>标签中给出职位名称，在<resume_section>标签中给出简历部分，在<resume_content>标签中给出原始简历内容。
 
 请按照以下步骤优化简历内容：
 
@@ -73,28 +63,49 @@ if st.button("优化简历"):
 在这里写下优化后的简历内容。
 </optimized_content>"""
 
+    user_prompt = f"""职位名称：
+<job_title>
+{job_title}
+</job_title>
+
+简历部分：
+<resume_section>
+{selected_section}
+</resume_section>
+
+原始简历内容：
+<resume_content>
+{resume_content}
+</resume_content>"""
+
     try:
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        response = message.content[0].text
-        
-        # Extract sections using string manipulation
-        analysis = response[response.find("<analysis>")+10:response.find("</analysis>")].strip()
-        optimization = response[response.find("<optimization_ideas>")+19:response.find("</optimization_ideas>")].strip()
-        optimized = response[response.find("<optimized_content>")+18:response.find("</optimized_content>")].strip()
-        
-        # Display results in expandable sections
+        # Display results in expandable sections, filled in as the response streams
+        slots = {}
         with st.expander("🔍分析", expanded=True):
-            st.write(analysis)
+            slots["analysis"] = st.empty()
         with st.expander("🤔优化建议", expanded=True):
-            st.write(optimization)
+            slots["optimization_ideas"] = st.empty()
         with st.expander("✨️优化后的内容", expanded=True):
-            st.write(optimized)
+            slots["optimized_content"] = st.empty()
+        parser = TagStreamParser(slots)
+
+        call_timings = {}
+        for chunk in stream_message(
+            client,
+            system_prompt,
+            user_prompt,
+            timings=call_timings,
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=1000,
+            temperature=0
+        ):
+            for kind, tag, _ in parser.feed(chunk):
+                if kind == "text":
+                    slots[tag].write(parser.sections[tag].strip())
+        # 没有结束标签的分段也显示已输出的全部文字
+        for _, tag, _ in parser.close():
+            slots[tag].write(parser.sections[tag].strip())
+        st.caption(format_usage(call_timings))
             
     except Exception as e:
         st.error(f"发生错误: {str(e)}")
@@ -1,6 +1,9 @@
 import streamlit as st
 from google import genai
 from google.genai import types
+import time
+from prompt_cache import GEMINI_MIN_CACHEABLE_TOKENS, format_usage, gemini_cached_content, record_gemini_usage
+from tag_stream import TagStreamParser
 
 st.title("简历优化")
 
@@ -24,22 +27,10 @@ if st.button("优化简历"):
         
     client = genai.Client(api_key=api_key)
     
-    prompt = f"""你是一位专业的简历优化顾问，擅长根据特定职位需求来优化求职者的简历内容。你的任务是根据给定的职位和简历部分，对简历内容进行优化和改进。请仔细阅读以下信息，并按照指示进行操作。
+    # 固定的说明放在 system 中（短于最小缓存长度，目前不会缓存），职位和简历内容放在用户消息中
+    system_prompt = """你是一位专业的简历优化顾问，擅长根据特定职位需求来优化求职者的简历内容。你的任务是根据给定的职位和简历部分，对简历内容进行优化和改进。请仔细阅读以下信息，并按照指示进行操作。
 
-职位名称：
-<job_title>
-{job_title}
-</job_title>
-
-简历部分：
-<resume_section>
-{selected_section}
-</resume_section>
-
-原始简历内容：
-<resume_content>
-{resume_content}
-</resume_content>
+用户会在<job_title>标签中给出职位名称，在<resume_section>标签中给出简历部分，在<resume_content>标签中给出原始简历内容。
 
 请按照以下步骤优化简历内容：
 
@@ -74,45 +65,72 @@ if st.button("优化简历"):
 在这里写下优化后的简历内容。
 </optimized_content>"""
 
+    user_prompt = f"""职位名称：
+<job_title>
+{job_title}
+</job_title>
+
+简历部分：
+<resume_section>
+{selected_section}
+</resume_section>
+
+原始简历内容：
+<resume_content>
+{resume_content}
+</resume_content>"""
+
     try:
         model = "gemini-2.5-pro-preview-06-05"
         contents = [
             types.Content(
                 role="user",
                 parts=[
-                    types.Part.from_text(text=prompt),
+                    types.Part.from_text(text=user_prompt),
                 ],
             ),
         ]
+        # 前缀达到最小缓存长度时引用显式缓存，否则直接发送（目前的说明较短，不会创建缓存）
+        call_timings = {}
+        cached_content = gemini_cached_content(client, api_key, model, system_prompt, call_timings)
         generate_content_config = types.GenerateContentConfig(
             thinking_config = types.ThinkingConfig(
                 thinking_budget=-1,
             ),
             response_mime_type="text/plain",
+            **({"cached_content": cached_content} if cached_content else {"system_instruction": system_prompt}),
         )
 
-        response_chunks = []
+        # Display results in expandable sections, filled in as the response streams
+        slots = {}
+        with st.expander("🔍分析", expanded=True):
+            slots["analysis"] = st.empty()
+        with st.expander("🤔优化建议", expanded=True):
+            slots["optimization_ideas"] = st.empty()
+        with st.expander("✨️优化后的内容", expanded=True):
+            slots["optimized_content"] = st.empty()
+        parser = TagStreamParser(slots)
+
+        started = time.perf_counter()
+        first_token_at = None
+        usage_metadata = None
         for chunk in client.models.generate_content_stream(
             model=model,
             contents=contents,
             config=generate_content_config,
         ):
-            response_chunks.append(chunk.text)
-        
-        response = "".join(response_chunks)
-        
-        # Extract sections using string manipulation
-        analysis = response[response.find("<analysis>")+10:response.find("</analysis>")].strip()
-        optimization = response[response.find("<optimization_ideas>")+19:response.find("</optimization_ideas>")].strip()
-        optimized = response[response.find("<optimized_content>")+18:response.find("</optimized_content>")].strip()
-        
-        # Display results in expandable sections
-        with st.expander("🔍分析", expanded=True):
-            st.write(analysis)
-        with st.expander("🤔优化建议", expanded=True):
-            st.write(optimization)
-        with st.expander("✨️优化后的内容", expanded=True):
-            st.write(optimized)
+            if chunk.text and first_token_at is None:
+                first_token_at = time.perf_counter()
+            for kind, tag, _ in parser.feed(chunk.text):
+                if kind == "text":
+                    slots[tag].write(parser.sections[tag].strip())
+            if chunk.usage_metadata is not None:
+                usage_metadata = chunk.usage_metadata
+        # 没有结束标签的分段也显示已输出的全部文字
+        for _, tag, _ in parser.close():
+            slots[tag].write(parser.sections[tag].strip())
+        record_gemini_usage(call_timings, started, usage_metadata, first_token_at)
+        st.caption(format_usage(call_timings, GEMINI_MIN_CACHEABLE_TOKENS))
             
     except Exception as e:
         st.error(f"发生错误: {str(e)}")
@@ -1,36 +1,94 @@
 import streamlit as st
 import anthropic
+from fanyi_core import DEFAULT_CONCURRENCY, BATCH_MAX_ITEMS, MODEL, TranslationCheckpoint, translate_texts
+from fanyi_formats import FormatError, detect_format, dump_entries, load_entries
+from fanyi_glossary import (Glossary, check_translation, follows_glossary, format_violations, glossary_prompt,
+                            load_glossary)
+from fanyi_memory import FUZZY_MIN_SIMILARITY, TranslationMemory
+from prompt_cache import format_usage, stream_message
+from tag_stream import TagStreamParser
+
+# 获取翻译记忆库
+@st.cache_resource
+def get_translation_memory():
+    """获取本地翻译记忆库，所有会话共用"""
+    return TranslationMemory()
+
+translation_memory = get_translation_memory()
+
+# 解析术语表并建立索引，同一文件只解析一次
+@st.cache_resource
+def get_glossary(filename, data):
+    """按上传的术语表文件建立术语索引"""
+    return Glossary(load_glossary(filename, data))
 
 with st.sidebar:
     anthropic_api_key = st.text_input("Anthropic API Key", key="translator_api_key", type="password")
+    use_memory = st.checkbox("使用翻译记忆", value=True,
+                             help="翻译过的中文（忽略空白和标点）直接使用保存的译文，不再调用模型")
+    fuzzy_threshold = st.slider("相似译文阈值", min_value=0.3, max_value=0.95, value=FUZZY_MIN_SIMILARITY, step=0.05,
+                                help="显示相似度不低于该值的历史翻译供参考")
+    st.caption(f"📚 翻译记忆中共 {translation_memory.size()} 条")
+    glossary_file = st.file_uploader("术语表（选填）", type=["csv", "tsv", "txt", "json"],
+                                     help="每行 \"中文,英文\"，或JSON {\"中文\": \"英文\"}；多种可接受的译法用 | 分隔。"
+                                          "只把原文中出现的术语加入提示词，并检查译文是否使用了规定的译法")
+    glossary = None
+    if glossary_file is not None:
+        try:
+            glossary = get_glossary(glossary_file.name, glossary_file.getvalue())
+            st.caption(f"📖 术语表共 {len(glossary)} 条")
+        except FormatError as e:
+            st.error(f"❌ 术语表解析失败: {str(e)}")
 
 st.title("🌐 中英文翻译助手")
 
-chinese_text = st.text_area(
-    "请输入要翻译的中文",
-    placeholder="在这里输入中文文本...",
-    height=150
-)
+mode = st.radio("翻译模式", ["单条翻译", "文件批量翻译"], horizontal=True)
 
-context_text = st.text_area(
-    "补充说明（选填）",
-    placeholder="在这里输入额外的上下文信息,以帮助更准确的翻译...",
-    height=100
-)
+if mode == "单条翻译":
+    chinese_text = st.text_area(
+        "请输入要翻译的中文",
+        placeholder="在这里输入中文文本...",
+        height=150
+    )
 
-if chinese_text and not anthropic_api_key:
-    st.info("请先输入您的 Anthropic API Key 以继续使用")
+    context_text = st.text_area(
+        "补充说明（选填）",
+        placeholder="在这里输入额外的上下文信息,以帮助更准确的翻译...",
+        height=100
+    )
 
-if st.button("翻译") and chinese_text and anthropic_api_key:
-    prompt = f"""You are a professional translator specializing in software localization. Your task is to translate Chinese user interface text into three potential English translations. These translations should be suitable for use in software interfaces and reflect natural language usage in English-speaking countries.
+    if chinese_text and not anthropic_api_key:
+        st.info("请先输入您的 Anthropic API Key 以继续使用")
 
-Here is the Chinese text to translate:
-<chinese_text>
-{chinese_text}
-</chinese_text>
+    if st.button("翻译") and chinese_text and anthropic_api_key:
+        if use_memory:
+            # 相近的历史翻译立即显示，供参考
+            similar = translation_memory.fuzzy(chinese_text, fuzzy_threshold)
+            if similar:
+                with st.expander(f"📚 相似的历史翻译（{len(similar)} 条）"):
+                    for item in similar:
+                        st.markdown(f"**{item['source']}**（相似度 {item['similarity']:.0%}）")
+                        st.text("\n".join(item['translations']))
 
-Additional context information:
-{context_text if context_text else "No additional context provided."}
+        # 原文中出现的术语
+        terms = glossary.find(chinese_text) if glossary is not None else []
+        if terms:
+            st.caption(f"📖 命中术语: {format_violations(terms)}")
+
+        # 规范化后与之前翻译过的原文相同时直接使用保存的译文
+        versions = translation_memory.lookup(chinese_text) if use_memory else None
+        if versions is not None and not follows_glossary(versions, terms):
+            # 术语表更新后，记忆中的旧译文可能不符合规定译法，重新翻译
+            st.caption("📚 翻译记忆中的译文未使用术语表译法，重新翻译")
+            versions = None
+        if versions is not None:
+            st.caption("📚 来自翻译记忆，未调用模型")
+        else:
+            # 固定的说明和示例放在 system 中（短于最小缓存长度，目前不会缓存），
+            # 待翻译的文字和补充说明放在用户消息中
+            system_prompt = """You are a professional translator specializing in software localization. Your task is to translate Chinese user interface text into three potential English translations. These translations should be suitable for use in software interfaces and reflect natural language usage in English-speaking countries.
+
+The user will send the Chinese text to translate in <chinese_text> tags, followed by additional context information in <context> tags.
 
 Please provide three different English translations for this text. Each translation should:
 1. Accurately convey the meaning of the original Chinese text
@@ -76,35 +134,167 @@ Here are some example：
 <translation3>Create Account</translation3>
 </ideal_output>
 </example>
+</examples>"""
+
+            user_prompt = f"""<chinese_text>
+{chinese_text}
+</chinese_text>
+
+<context>
+{context_text if context_text else "No additional context provided."}
+</context>{glossary_prompt(terms)}"""
+
+            client = anthropic.Client(api_key=anthropic_api_key)
 
-"""
-
-    client = anthropic.Client(api_key=anthropic_api_key)
-    response = client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=1000,
-        messages=[
-            {
-                "role": "user", 
-                "content": prompt
-            }
-        ]
+        st.write("### 翻译结果")
+
+        slots = []
+        notes = []
+        for i in range(1, 4):
+            st.write(f"**版本 {i}:**")
+            slots.append(st.empty())
+            notes.append(st.empty())
+            if st.button(f"复制版本 {i}", key=f"copy_btn_{i}"):
+                st.write(f"已复制版本 {i}")
+            st.divider()
+
+        if versions is None:
+            # 流式输出，每个版本一开始输出就显示在对应位置
+            call_timings = {}
+            parser = TagStreamParser(["translation1", "translation2", "translation3"])
+            for chunk in stream_message(
+                client,
+                system_prompt,
+                user_prompt,
+                timings=call_timings,
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=1000
+            ):
+                for kind, tag, _ in parser.feed(chunk):
+                    if kind == "text":
+                        slots[int(tag[-1]) - 1].text(parser.sections[tag].strip())
+            parser.close()
+            st.caption(format_usage(call_timings))
+
+            results = [parser.result(f"translation{i}") for i in range(1, 4)]
+            versions = [translation for translation in results if translation is not None]
+            if use_memory and len(versions) == 3:
+                translation_memory.store(chinese_text, versions)
+        else:
+            results = versions
+            for slot, translation in zip(slots, versions):
+                slot.text(translation)
+
+        # 检查每个版本是否使用了术语表规定的译法
+        for note, translation in zip(notes, results):
+            violations = check_translation(translation, terms) if translation is not None else []
+            if violations:
+                note.warning(f"⚠️ 未使用术语表译法: {format_violations(violations)}")
+
+else:
+    uploaded_file = st.file_uploader(
+        "上传本地化资源文件",
+        type=["csv", "json", "po", "pot", "strings"],
+        help="支持 CSV（键列 + 中文列）、JSON（键: 中文，可嵌套）、gettext .po 和 iOS .strings"
+    )
+
+    context_text = st.text_area(
+        "补充说明（选填）",
+        placeholder="在这里输入额外的上下文信息,以帮助更准确的翻译...",
+        height=100
     )
-    
-    st.write("### 翻译结果")
-    text = response.content[0].text
-    
-    import re
-    versions = []
-    for i in range(1, 4):
-        pattern = f"<translation{i}>(.*?)</translation{i}>"
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            versions.append(match.group(1).strip())
-    
-    for i, translation in enumerate(versions, 1):
-        st.write(f"**版本 {i}:**")
-        st.text(translation)
-        if st.button(f"复制版本 {i}", key=f"copy_btn_{i}"):
-            st.write(f"已复制版本 {i}")
-        st.divider()
+
+    col1, col2 = st.columns(2)
+    with col1:
+        max_concurrency = st.slider("同时进行的请求数", min_value=1, max_value=16, value=DEFAULT_CONCURRENCY)
+    with col2:
+        batch_items = st.slider("每次请求合并的字符串数", min_value=1, max_value=100, value=BATCH_MAX_ITEMS,
+                                help="短字符串合并在一次请求中翻译，减少请求次数和重复的提示词")
+
+    if uploaded_file is not None:
+        file_bytes = uploaded_file.getvalue()
+        try:
+            entries = load_entries(uploaded_file.name, file_bytes)
+        except FormatError as e:
+            st.error(f"❌ 文件解析失败: {str(e)}")
+            entries = []
+
+        if entries:
+            # 相同的中文只翻译一次，已完成的译文从断点记录读取
+            checkpoint = TranslationCheckpoint(TranslationCheckpoint.path_for(file_bytes, context_text, MODEL,
+                                                                              glossary=glossary))
+            translations = checkpoint.load()
+            texts = list(dict.fromkeys(entry["text"] for entry in entries))
+            # 翻译记忆中已有的中文不再调用模型；不符合术语表的旧译文仍交给模型翻译
+            remembered = {}
+            if use_memory:
+                remembered = translation_memory.lookup_many(text for text in texts if text not in translations)
+                if glossary is not None:
+                    remembered = {text: candidates for text, candidates in remembered.items()
+                                  if follows_glossary(candidates, glossary.find(text))}
+                translations.update(remembered)
+            pending = [text for text in texts if text not in translations]
+            st.caption(f"📄 {detect_format(uploaded_file.name)} 文件，{len(entries)} 个键，"
+                       f"去重后 {len(texts)} 条中文，已完成 {len(texts) - len(pending)} 条"
+                       + (f"（其中翻译记忆 {len(remembered)} 条）" if remembered else ""))
+
+            output_name = uploaded_file.name.rsplit(".", 1)
+            output_name = f"{output_name[0]}.en.{output_name[1]}"
+
+            if pending and not anthropic_api_key:
+                st.info("请先输入您的 Anthropic API Key 以继续使用")
+
+            if pending and anthropic_api_key and st.button("开始翻译" if len(pending) == len(texts) else "继续翻译"):
+                client = anthropic.Client(api_key=anthropic_api_key)
+                progress_bar = st.progress((len(texts) - len(pending)) / len(texts))
+                status_text = st.empty()
+                preview = st.empty()
+                failed = []
+                recent = []
+                call_timings = {}
+                for text, candidates in translate_texts(client, pending, context_text, max_concurrency, batch_items,
+                                                        timings=call_timings, glossary=glossary):
+                    if candidates is None:
+                        failed.append(text)
+                        continue
+                    translations[text] = candidates
+                    checkpoint.append(text, candidates)
+                    if use_memory:
+                        translation_memory.store(text, candidates)
+                    recent = ([{"中文": text, "版本 1": candidates[0], "版本 2": candidates[1],
+                                "版本 3": candidates[2]}] + recent)[:10]
+                    done = len(translations.keys() & set(texts))
+                    progress_bar.progress(done / len(texts))
+                    status_text.text(f"已完成 {done}/{len(texts)} 条...")
+                    preview.table(recent)
+                status_text.empty()
+                st.caption(format_usage(call_timings))
+                if failed:
+                    st.warning(f"⚠️ {len(failed)} 条翻译失败，可点击“继续翻译”重试")
+                else:
+                    st.success("✅ 全部翻译完成")
+
+            done = sum(1 for text in texts if text in translations)
+            if done:
+                st.download_button(
+                    f"下载翻译结果（{done}/{len(texts)} 条）",
+                    data=dump_entries(uploaded_file.name, entries, translations),
+                    file_name=output_name,
+                    help="与上传文件格式相同，每个键带三个候选译文；未完成的条目译文为空"
+                )
+
+            if done and glossary is not None:
+                # 检查已完成的译文（包括来自断点记录和翻译记忆的）是否使用了术语表规定的译法
+                issues = []
+                for text in texts:
+                    if text not in translations:
+                        continue
+                    terms = glossary.find(text)
+                    for number, candidate in enumerate(translations[text], 1):
+                        violations = check_translation(candidate, terms)
+                        if violations:
+                            issues.append({"中文": text, "版本": number, "译文": candidate,
+                                           "未使用的术语": format_violations(violations)})
+                if issues:
+                    with st.expander(f"⚠️ {len(issues)} 个候选译文未使用术语表译法"):
+                        st.dataframe(issues)
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fanyi_glossary import glossary_prompt
+from prompt_cache import create_message, merge_usage
+
+
+# 翻译使用的模型
+MODEL = "claude-3-5-sonnet-20241022"
+
+# 批量翻译：每次请求最多合并的字符串数和中文字数，以及输出token上限
+BATCH_MAX_ITEMS = 30
+BATCH_MAX_CHARS = 1500
+BATCH_MAX_TOKENS = 8000
+
+# 默认同时进行的请求数
+DEFAULT_CONCURRENCY = 4
+
+# 默认断点记录位置
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "fanyi")
+
+# 多条字符串合并翻译的提示词：固定的说明和示例放在 system 中（短于最小缓存长度，目前不会缓存），
+# 每次请求只有用户消息不同
+BATCH_SYSTEM_PROMPT = """You are a professional translator specializing in software localization. Your task is to translate a list of Chinese user interface strings, giving three potential English translations for each. These translations should be suitable for use in software interfaces and reflect natural language usage in English-speaking countries.
+
+The user will send the Chinese strings to translate inside <strings> tags, each wrapped in an <item> tag with its id, followed by additional context information in <context> tags.
+
+For every item, provide three different English translations. Each translation should:
+1. Accurately convey the meaning of the original Chinese text
+2. Be appropriate for use in a software user interface
+3. Sound natural and idiomatic to native English speakers
+
+Format your response as follows, one <item> per input item with the same id, in the same order:
+<item id="1">
+<translation1>First English translation</translation1>
+<translation2>Second English translation</translation2>
+<translation3>Third English translation</translation3>
+</item>
+
+There is no need for any note.
+
+Guidelines for high-quality translations:
+- Ensure that each translation is distinct and offers a unique way of expressing the concept
+- Consider the context of software UI when translating (e.g., conciseness, clarity)
+- Avoid literal translations that may sound awkward in English
+- Use standard capitalization and punctuation appropriate for UI text
+- Keep placeholders such as %d, %@, %1$s, {{name}} and {{count}}, HTML tags and line breaks exactly as they appear
+- Translate each item on its own; do not merge, split or skip items
+
+Here are some example：
+<examples>
+<example>
+<strings>
+<item id="1">标准会员</item>
+<item id="2">注册</item>
+</strings>
+<ideal_output>
+<item id="1">
+<translation1>Standard Member</translation1>
+<translation2>Regular Membership</translation2>
+<translation3>Basic Member</translation3>
+</item>
+<item id="2">
+<translation1>Sign Up</translation1>
+<translation2>Register</translation2>
+<translation3>Create Account</translation3>
+</item>
+</ideal_output>
+</example>
+</examples>"""
+
+BATCH_USER_PROMPT = """<strings>
+{items}
+</strings>
+
+<context>
+{context}
+</context>{glossary}
+
+Provide the translations for all {count} items now."""
+
+ITEM_RE = re.compile(r'<item id="(\d+)">(.*?)</item>', re.S)
+TRANSLATION_RE = re.compile(r'<translation([123])>(.*?)</translation\1>', re.S)
+
+
+# 分组
+def pack_batches(texts, max_items=BATCH_MAX_ITEMS, max_chars=BATCH_MAX_CHARS):
+    """按条数和字数上限把字符串分成若干组，每组合并为一次请求"""
+    batches = []
+    current = []
+    size = 0
+    for text in texts:
+        if current and (len(current) >= max_items or size + len(text) > max_chars):
+            batches.append(current)
+            current = []
+            size = 0
+        current.append(text)
+        size += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(texts, context="", glossary=None):
+    """生成合并翻译的用户消息，字符串按1开始编号；提供术语表时只加入这组字符串中出现的术语"""
+    items = "\n".join(f'<item id="{position}">{text}</item>' for position, text in enumerate(texts, 1))
+    terms = glossary.find_many(texts) if glossary is not None else []
+    return BATCH_USER_PROMPT.format(items=items, context=context or "No additional context provided.",
+                                    glossary=glossary_prompt(terms), count=len(texts))
+
+
+# 解析合并翻译的结果
+def parse_batch_response(text, count):
+    """按 <item id="N"> 拆分模型输出，返回长度为count的列表；缺失或不足三个候选的位置为None"""
+    results = [None] * count
+    for match in ITEM_RE.finditer(text or ""):
+        position = int(match.group(1)) - 1
+        if not 0 <= position < count or results[position] is not None:
+            continue
+        candidates = {int(number): value.strip() for number, value in TRANSLATION_RE.findall(match.group(2))}
+        if all(candidates.get(number) for number in (1, 2, 3)):
+            results[position] = [candidates[1], candidates[2], candidates[3]]
+    return results
+
+
+def translate_batch(client, texts, context="", model=MODEL, timings=None, glossary=None):
+    """一次请求翻译一组字符串，返回与texts等长的候选列表，解析失败的位置为None"""
+    response = create_message(client, BATCH_SYSTEM_PROMPT, build_batch_prompt(texts, context, glossary),
+                              timings=timings, model=model, max_tokens=BATCH_MAX_TOKENS)
+    return parse_batch_response(response.content[0].text, len(texts))
+
+
+# 并发批量翻译
+def translate_texts(client, texts, context="", max_workers=DEFAULT_CONCURRENCY, max_items=BATCH_MAX_ITEMS,
+                    model=MODEL, timings=None, glossary=None):
+    """分组并发翻译，在调用方线程中按完成顺序逐条返回 (中文, [候选1, 候选2, 候选3] 或 None)
+
+    texts 应已去重。一组中没有解析出来的字符串（或整组请求失败）会单独再合并重试一次，
+    仍然失败的返回None，下次运行时重新翻译。提供 timings 时累加各次请求的耗时和token用量；
+    提供 glossary 时每次请求只加入该组字符串中出现的术语。
+    """
+    texts = list(texts)
+    if not texts:
+        return
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    def submit(batch, is_retry):
+        batch_timings = {}
+        future = executor.submit(translate_batch, client, batch, context, model, batch_timings, glossary)
+        futures[future] = (batch, is_retry, batch_timings)
+
+    try:
+        futures = {}
+        for batch in pack_batches(texts, max_items):
+            submit(batch, False)
+        while futures:
+            future = next(as_completed(futures))
+            batch, is_retry, batch_timings = futures.pop(future)
+            try:
+                results = future.result()
+            except Exception:
+                results = [None] * len(batch)
+            merge_usage(timings, batch_timings)
+
+            missing = []
+            for text, candidates in zip(batch, results):
+                if candidates is not None:
+                    yield text, candidates
+                elif is_retry:
+                    yield text, None
+                else:
+                    missing.append(text)
+            for retry_batch in pack_batches(missing, max(1, max_items // 2)):
+                submit(retry_batch, True)
+    finally:
+        # 调用方提前停止（如页面刷新）时取消还在排队的请求
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TranslationCheckpoint:
+    """把已完成的译文逐条追加到JSONL文件，中断后重新上传同一文件可以从断点继续"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 上次中断时写了一半的行单独留在一行，不影响之后追加的记录
+        try:
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        except OSError:
+            pass
+
+    @staticmethod
+    def path_for(file_bytes, context="", model=MODEL, directory=DEFAULT_CHECKPOINT_DIR, glossary=None):
+        """同一文件、补充说明、模型和术语表对应同一个断点记录"""
+        parts = [file_bytes, context.encode("utf-8"), model.encode("utf-8")]
+        if glossary is not None:
+            parts.append(glossary.digest.encode("utf-8"))
+        digest = hashlib.sha1(b"\x00".join(parts))
+        return os.path.join(directory, f"{digest.hexdigest()}.jsonl")
+
+    def load(self):
+        """读取已完成的译文 {中文: [候选1, 候选2, 候选3]}，忽略写了一半的行"""
+        done = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    done[record["text"]] = record["translations"]
+        except OSError:
+            pass
+        return done
+
+    def append(self, text, candidates):
+        """追加一条译文并立即写入磁盘"""
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"text": text, "translations": candidates}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
@@ -0,0 +1,286 @@
+"""本地化资源文件的读取和写出：CSV、JSON、gettext .po、iOS .strings
+
+读取得到条目列表，每条是一个待翻译的中文字符串：{"key": 键, "text": 中文, "path": JSON中的路径（元组，
+列表中的位置为整数）, "meta": 写出时需要的原文件信息}；写出时每个键带三个候选译文，文件格式与上传的文件相同。
+"""
+import copy
+import csv
+import io
+import json
+import os
+import re
+
+
+# 支持的文件格式（按扩展名）
+FORMATS = {".csv": "csv", ".json": "json", ".po": "po", ".pot": "po", ".strings": "strings"}
+
+# CSV中可能的键列和中文列名
+CSV_KEY_COLUMNS = ("key", "id", "name", "键")
+CSV_TEXT_COLUMNS = ("zh", "zh-cn", "zh_cn", "zh-hans", "source", "text", "chinese", "中文", "原文")
+
+
+def _entry(key, text, path=(), meta=None):
+    return {"key": key, "text": text, "path": path, "meta": meta or {}}
+
+
+class FormatError(ValueError):
+    """文件内容无法按对应格式解析"""
+
+
+def detect_format(filename):
+    """按扩展名判断文件格式，不支持时返回None"""
+    return FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def _decode(data):
+    """按BOM判断编码（.strings 常为UTF-16），默认UTF-8"""
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    return data.decode("utf-8-sig")
+
+
+# 读取
+def load_entries(filename, data):
+    """解析上传的文件内容（bytes），返回条目列表；同一个键出现多次时只保留第一次"""
+    fmt = detect_format(filename)
+    if fmt is None:
+        raise FormatError(f"不支持的文件格式: {filename}")
+    try:
+        entries = {"csv": _load_csv, "json": _load_json, "po": _load_po, "strings": _load_strings}[fmt](_decode(data))
+    except UnicodeDecodeError as e:
+        raise FormatError(f"文件编码无法识别: {str(e)}")
+
+    unique = {}
+    for entry in entries:
+        if entry["text"].strip() and entry["key"] not in unique:
+            unique[entry["key"]] = entry
+    return list(unique.values())
+
+
+def _load_csv(text):
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [column.strip().lower() for column in rows[0]]
+    key_column = next((header.index(name) for name in CSV_KEY_COLUMNS if name in header), None)
+    text_column = next((header.index(name) for name in CSV_TEXT_COLUMNS if name in header), None)
+    if key_column is None and text_column is None:
+        # 没有表头时第一列为键、第二列为中文
+        key_column, text_column, body = 0, 1, rows
+    else:
+        key_column = 0 if key_column is None else key_column
+        text_column = (1 if key_column == 0 else 0) if text_column is None else text_column
+        body = rows[1:]
+    entries = []
+    for row in body:
+        if len(row) > max(key_column, text_column):
+            entries.append(_entry(row[key_column], row[text_column]))
+    return entries
+
+
+def _load_json(text):
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise FormatError(f"JSON解析失败: {str(e)}")
+    if not isinstance(data, dict):
+        raise FormatError("JSON文件的顶层需要是对象（键: 中文）")
+    entries = []
+    # 写出时以原文件为模板替换字符串，保留数字、布尔值等其他内容
+    meta = {"document": data}
+
+    def walk(node, path):
+        children = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, value in children:
+            if isinstance(value, (dict, list)):
+                walk(value, path + (key,))
+            elif isinstance(value, str):
+                # 键为路径元组：字面上带点的键 "a.b" 与嵌套的 {"a": {"b": …}} 不会混淆
+                entries.append(_entry(path + (key,), value, path=path + (key,), meta=meta))
+    walk(data, ())
+    return entries
+
+
+PO_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\"}
+
+
+def _po_unquote(value):
+    value = value.strip()
+    if not (value.startswith('"') and value.endswith('"')):
+        raise FormatError(f"无法解析的 .po 字符串: {value}")
+    return re.sub(r'\\(.)', lambda match: PO_ESCAPES.get(match.group(1), match.group(1)), value[1:-1])
+
+
+def _po_quote(value):
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\t", "\\t").replace("\r", "\\r")
+    if "\n" not in escaped:
+        return f'"{escaped}"'
+    # 多行字符串按gettext的习惯写成多个片段
+    lines = escaped.split("\n")
+    parts = [line + "\\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+    return '""\n' + "\n".join(f'"{part}"' for part in parts)
+
+
+def _parse_po_blocks(text):
+    """按空行切分 .po 条目，返回 [{"comments": [...], 字段名: 值, ...}, ...]"""
+    blocks = []
+    for raw in re.split(r'\n\s*\n', text.replace("\r\n", "\n")):
+        block = {"comments": [], "raw": raw.strip("\n")}
+        current = None
+        for line in raw.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                block["comments"].append(line)
+            elif line.startswith('"'):
+                if current is None:
+                    raise FormatError(f"无法解析的 .po 行: {line}")
+                block[current] += _po_unquote(line)
+            else:
+                match = re.match(r'(msgctxt|msgid_plural|msgid|msgstr(?:\[\d+\])?)\s+(".*")$', line)
+                if not match:
+                    raise FormatError(f"无法解析的 .po 行: {line}")
+                current = match.group(1)
+                block[current] = _po_unquote(match.group(2))
+        if "msgid" in block:
+            blocks.append(block)
+    return blocks
+
+
+def _load_po(text):
+    """复数条目只翻译 msgid：中文的单复数通常相同，复数形式在写出时留给人工校对"""
+    entries = []
+    header = None
+    for block in _parse_po_blocks(text):
+        if block["msgid"] == "":
+            # 文件头（Plural-Forms、Language、charset 等）写出时原样保留
+            header = block
+            continue
+        key = f"{block['msgctxt']}\x04{block['msgid']}" if "msgctxt" in block else block["msgid"]
+        entries.append(_entry(key, block["msgid"], meta={"block": block}))
+    for entry in entries:
+        entry["meta"]["header"] = header
+    return entries
+
+
+# .strings 的词法单元：注释只在引号外识别，值中的 "https://…" 或 "/* */" 原样保留
+STRINGS_TOKEN_RE = re.compile(r'\s+|/\*.*?\*/|//[^\n]*|"((?:[^"\\]|\\.)*)"|([=;])|(.)', re.S)
+
+
+def _strings_unquote(value):
+    return re.sub(r'\\(.)', lambda match: PO_ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def _strings_quote(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _strings_comment(value):
+    return value.replace("*/", "* /").replace("\n", " ")
+
+
+def _load_strings(text):
+    """逐个读取词法单元，按 "键" = "值" ; 的顺序组成条目"""
+    entries = []
+    pending = []
+    for match in STRINGS_TOKEN_RE.finditer(text):
+        string, punctuation, other = match.groups()
+        if string is not None:
+            pending.append(("string", _strings_unquote(string)))
+        elif punctuation is not None:
+            pending.append(("punctuation", punctuation))
+        elif other is not None:
+            raise FormatError(f"无法解析的 .strings 内容: {text[match.start():match.start() + 40]}")
+        else:
+            continue
+        if punctuation == ";":
+            kinds = [kind for kind, _ in pending]
+            if kinds != ["string", "punctuation", "string", "punctuation"] or pending[1][1] != "=":
+                raise FormatError(f"无法解析的 .strings 条目: {text[max(0, match.start() - 40):match.end()]}")
+            entries.append(_entry(pending[0][1], pending[2][1]))
+            pending = []
+    return entries
+
+
+# 写出
+def dump_entries(filename, entries, translations):
+    """按上传文件的格式写出翻译结果（bytes）
+
+    translations 为 {中文: [候选1, 候选2, 候选3]}，还没有译文的字符串写为空。
+    """
+    fmt = detect_format(filename)
+    writer = {"csv": _dump_csv, "json": _dump_json, "po": _dump_po, "strings": _dump_strings}[fmt]
+    return writer(entries, lambda text: (list(translations.get(text) or []) + ["", "", ""])[:3]).encode("utf-8")
+
+
+def _dump_csv(entries, candidates):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["key", "zh", "translation1", "translation2", "translation3"])
+    for entry in entries:
+        writer.writerow([entry["key"], entry["text"], *candidates(entry["text"])])
+    return output.getvalue()
+
+
+def _dump_json(entries, candidates):
+    data = copy.deepcopy(entries[0]["meta"]["document"]) if entries else {}
+    for entry in entries:
+        node = data
+        for part in entry["path"][:-1]:
+            node = node[part]
+        node[entry["path"][-1]] = candidates(entry["text"])
+    return json.dumps(data, ensure_ascii=False, indent=2) + "\n"
+
+
+def _po_flags(comments, flag):
+    """在 "#," 标记行中加入一个标记，没有标记行时新增一行"""
+    for position, comment in enumerate(comments):
+        if comment.startswith("#,"):
+            flags = [item.strip() for item in comment[2:].split(",") if item.strip()]
+            if flag not in flags:
+                comments[position] = "#, " + ", ".join(flags + [flag])
+            return comments
+    return comments + [f"#, {flag}"]
+
+
+def _dump_po(entries, candidates):
+    header = entries[0]["meta"].get("header") if entries else None
+    if header is not None:
+        # 原文件头原样写回
+        lines = [header["raw"], ""]
+    else:
+        lines = ['msgid ""', 'msgstr ""', '"Content-Type: text/plain; charset=UTF-8\\n"', ""]
+    for entry in entries:
+        block = entry["meta"]["block"]
+        first, *others = candidates(entry["text"])
+        comments = [comment for comment in block["comments"] if not comment.startswith("# 备选")]
+        if "msgid_plural" in block and first:
+            # 只有单数形式的译文：标记为 fuzzy，复数形式留空等人工补充
+            comments = _po_flags(comments, "fuzzy")
+        lines += comments
+        lines += [f"# 备选: {other}".replace("\n", " ") for other in others if other]
+        if "msgctxt" in block:
+            lines.append(f"msgctxt {_po_quote(block['msgctxt'])}")
+        lines.append(f"msgid {_po_quote(block['msgid'])}")
+        if "msgid_plural" in block:
+            lines.append(f"msgid_plural {_po_quote(block['msgid_plural'])}")
+            forms = sorted({int(field[7:-1]) for field in block if field.startswith("msgstr[")} | {0, 1})
+            for form in forms:
+                lines.append(f"msgstr[{form}] {_po_quote(first if form == 0 else '')}")
+        else:
+            lines.append(f"msgstr {_po_quote(first)}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _dump_strings(entries, candidates):
+    lines = []
+    for entry in entries:
+        first, *others = candidates(entry["text"])
+        lines.append(f"/* {_strings_comment(entry['text'])} */")
+        if any(others):
+            lines.append(f"/* 备选: {_strings_comment(' | '.join(other for other in others if other))} */")
+        lines.append(f'"{_strings_quote(entry["key"])}" = "{_strings_quote(first)}";')
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,171 @@
+"""术语表：保证产品术语的译法一致
+
+上传中英术语对（CSV/TSV 每行 "中文,英文"，或JSON {"中文": "英文"}；一个中文术语有多种可接受的译法时用 | 分隔）。
+术语表建成 Aho-Corasick 自动机，对每条待翻译的中文只扫描一遍就找出其中出现的全部术语，
+提示词中只加入这些术语，术语表再大提示词也不会变长；翻译完成后检查候选译文是否使用了规定的译法。
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+from collections import deque
+
+from fanyi_formats import FormatError
+
+
+def _decode(data):
+    """术语表常由Excel导出，UTF-8 解码失败时按 GB18030 解码"""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("gb18030")
+
+
+# 读取术语表
+def load_glossary(filename, data):
+    """解析上传的术语表（bytes），返回 [(中文, 英文), ...]"""
+    try:
+        text = _decode(data)
+    except UnicodeDecodeError as e:
+        raise FormatError(f"术语表编码无法识别: {str(e)}")
+
+    if os.path.splitext(filename)[1].lower() == ".json":
+        try:
+            terms = json.loads(text)
+        except ValueError as e:
+            raise FormatError(f"JSON解析失败: {str(e)}")
+        if isinstance(terms, dict):
+            return [(str(zh), str(en)) for zh, en in terms.items()]
+        if isinstance(terms, list) and all(isinstance(pair, list) and len(pair) >= 2 for pair in terms):
+            return [(str(pair[0]), str(pair[1])) for pair in terms]
+        raise FormatError("JSON术语表需要是 {\"中文\": \"英文\"} 或 [[\"中文\", \"英文\"], ...]")
+
+    delimiter = "\t" if "\t" in text.split("\n", 1)[0] else ","
+    pairs = []
+    for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+        if len(row) < 2 or not row[0].strip() or not row[1].strip():
+            continue
+        # 表头（如 "zh,en"、"中文,英文"）不含中文术语，跳过
+        if not pairs and row[0].strip().lower() in ("zh", "中文", "term", "source", "术语", "原文"):
+            continue
+        pairs.append((row[0], row[1]))
+    return pairs
+
+
+class Glossary:
+    """中英术语表，用 Aho-Corasick 自动机在一遍扫描中查找文本中出现的全部术语"""
+
+    def __init__(self, pairs):
+        # 中文术语 -> 可接受的英文译法列表
+        self.terms = {}
+        for zh, en in pairs:
+            zh = zh.strip()
+            variants = [variant.strip() for variant in en.split("|") if variant.strip()]
+            if zh and variants:
+                self.terms[zh] = variants
+        self.digest = hashlib.sha1(json.dumps(sorted(self.terms.items()), ensure_ascii=False)
+                                   .encode("utf-8")).hexdigest()
+
+        # 每个节点：转移表、失败指针、以该节点结尾的术语、沿失败指针最近的一个术语节点
+        self._goto = [{}]
+        self._fail = [0]
+        self._term = [None]
+        self._output = [0]
+        for zh in self.terms:
+            node = 0
+            for char in zh:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._term.append(None)
+                    self._output.append(0)
+                node = next_node
+            self._term[node] = zh
+
+        # 按层（广度优先）计算失败指针
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                target = self._fail[child]
+                self._output[child] = target if self._term[target] is not None else self._output[target]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def find(self, text):
+        """返回文本中出现的术语 [{"zh", "en"}, ...]，按出现顺序、每个术语一次
+
+        重叠时取从左起最长的术语（"注册账号"中只取"注册账号"，不再单独取"注册"），
+        避免较短术语的译法与较长术语冲突。
+        """
+        matches = []
+        node = 0
+        for end, char in enumerate(text or "", 1):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            hit = node if self._term[node] is not None else self._output[node]
+            while hit:
+                term = self._term[hit]
+                matches.append((end - len(term), -len(term), term))
+                hit = self._output[hit]
+
+        found = {}
+        covered_until = 0
+        for start, negative_length, term in sorted(matches):
+            if start < covered_until:
+                continue
+            covered_until = start - negative_length
+            found.setdefault(term, {"zh": term, "en": self.terms[term]})
+        return list(found.values())
+
+    def find_many(self, texts):
+        """多条文本中出现的术语（合并去重）"""
+        found = {}
+        for text in texts:
+            for match in self.find(text):
+                found.setdefault(match["zh"], match)
+        return list(found.values())
+
+
+# 生成提示词中的术语部分
+def glossary_prompt(matches):
+    """把命中的术语写成加在用户消息末尾的说明，没有命中时返回空字符串"""
+    if not matches:
+        return ""
+    lines = "\n".join(f"{match['zh']} => {' | '.join(match['en'])}" for match in matches)
+    return ("\n\nGlossary (required terminology): whenever a Chinese term below appears, every translation must use "
+            "the given English term (any one of the alternatives separated by |):\n"
+            f"<glossary>\n{lines}\n</glossary>")
+
+
+# 检查译文
+def check_translation(translation, matches):
+    """返回译文中没有使用规定译法的术语列表（不区分大小写，允许复数等词尾变化）"""
+    violations = []
+    for match in matches:
+        if not any(re.search(r'(?<![A-Za-z])' + re.escape(variant), translation or "", re.I)
+                   for variant in match["en"]):
+            violations.append(match)
+    return violations
+
+
+def follows_glossary(candidates, matches):
+    """全部候选译文都使用了规定译法（没有命中术语时为True），用于判断翻译记忆中的译文能否直接使用"""
+    return not any(check_translation(candidate, matches) for candidate in candidates)
+
+
+def format_violations(violations):
+    """生成提示文字，如：会员 → Member、注册 → Sign Up"""
+    return "、".join(f"{match['zh']} → {' / '.join(match['en'])}" for match in violations)
@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+# 默认翻译记忆库位置
+DEFAULT_MEMORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "translation_memory.sqlite3")
+
+# 默认相似度阈值（二字片段的Dice系数，0~1）
+FUZZY_MIN_SIMILARITY = 0.5
+
+# 规范化时去掉的空白和标点（含全角标点）
+NORMALIZE_STRIP_RE = re.compile(r'[\s\W_]+')
+
+# 格式占位符和标记：printf/iOS（%@、%1$s、%.2f）、Python（%(name)s）、{0}/{name}、<b>、</b>
+PLACEHOLDER_RE = re.compile(
+    r'%(?:\d+\$)?[-+ #0]*\d*(?:\.\d+)?(?:hh|h|ll|l|q|L|z|j|t)?[@dDiuUxXoOfFeEgGcCsSpaA%]'
+    r'|%\([^)]+\)[a-zA-Z]|\{[^{}]*\}|<[^<>]*>'
+)
+
+
+# 规范化
+def normalize(text):
+    """全角转半角、英文转小写，并去掉空白和标点，作为精确匹配的键
+
+    占位符和标记原样保留在键中："欢迎%@" 与 "欢迎" 不是同一条原文。
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    parts = []
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(text):
+        parts.append(NORMALIZE_STRIP_RE.sub("", text[position:match.start()].lower()))
+        parts.append(match.group())
+        position = match.end()
+    parts.append(NORMALIZE_STRIP_RE.sub("", text[position:].lower()))
+    return "".join(parts)
+
+
+def placeholders(text):
+    """原文中的占位符和标记（排序后的列表），译文必须包含同样的一组"""
+    return sorted(PLACEHOLDER_RE.findall(unicodedata.normalize("NFKC", text or "")))
+
+
+def ngrams(normalized):
+    """规范化文字的二字片段集合，只有一个字时为该字本身"""
+    if len(normalized) < 2:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + 2] for i in range(len(normalized) - 1)}
+
+
+class TranslationMemory:
+    """基于SQLite的翻译记忆库：规范化后完全相同的原文直接返回保存的候选译文，
+    相近的原文通过二字片段倒排索引查找，按Dice系数排序"""
+
+    def __init__(self, path=DEFAULT_MEMORY_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory (
+                id INTEGER PRIMARY KEY,
+                normalized TEXT UNIQUE NOT NULL,
+                source TEXT NOT NULL,
+                translations TEXT NOT NULL,
+                gram_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # 倒排索引：二字片段 -> 条目，按条目的片段数排列，查找时在索引内按长度范围过滤
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_grams (
+                gram TEXT NOT NULL,
+                gram_count INTEGER NOT NULL,
+                entry_id INTEGER NOT NULL,
+                PRIMARY KEY (gram, gram_count, entry_id)
+            ) WITHOUT ROWID
+        """)
+        # 每个片段出现在多少条原文中，相似查找时先用最少见的片段筛选候选
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_gram_counts (
+                gram TEXT PRIMARY KEY,
+                entries INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def lookup(self, text):
+        """规范化后完全相同、且占位符相同的原文返回 [候选1, 候选2, 候选3]，否则返回None
+
+        占位符还要与保存时的原文比对：旧版本的键不含占位符，"欢迎%@" 的记录可能保存在 "欢迎" 下。
+        """
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT source, translations FROM memory WHERE normalized = ?",
+                                     (normalized,)).fetchone()
+            if row is None or placeholders(row[0]) != placeholders(text):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[1])
+
+    def lookup_many(self, texts):
+        """批量精确查找，返回 {原文: 候选译文}（只包含命中的原文）"""
+        found = {}
+        for text in texts:
+            translations = self.lookup(text)
+            if translations is not None:
+                found[text] = translations
+        return found
+
+    def fuzzy(self, text, min_similarity=FUZZY_MIN_SIMILARITY, limit=5):
+        """查找相近的原文，返回 [{"source", "translations", "similarity"}, ...]（不含完全相同的原文）
+
+        Dice系数 = 2 × 共同片段数 / (两边片段数之和)。查询有 |A| 个片段、候选有 |B| 个片段时，
+        达到阈值s需要至少 c = ⌈s·(|A|+|B|)/2⌉ 个共同片段，所以候选必然包含查询中最少见的
+        |A| - c + 1 个片段之一。倒排索引按片段数排列，对每个 |B| 只查这些片段，
+        候选越长需要的共同片段越多、要查的片段越少，常见片段（如"注册"）很少被查到。
+        """
+        normalized = normalize(text)
+        grams = ngrams(normalized)
+        if not grams or min_similarity <= 0:
+            return []
+        size = len(grams)
+        with self._lock:
+            placeholders = ",".join("?" * size)
+            counts = dict(self._conn.execute(
+                f"SELECT gram, entries FROM memory_gram_counts WHERE gram IN ({placeholders})", tuple(grams)
+            ).fetchall())
+            # 没有出现过的片段不会带来候选，排在最前面
+            rarest = sorted(grams, key=lambda gram: counts.get(gram, 0))
+
+            # 按候选片段数分段，同一段中要查的片段相同
+            ranges = []
+            low = max(1, math.ceil(size * min_similarity / (2 - min_similarity) - 1e-9))
+            high = math.floor(size * (2 - min_similarity) / min_similarity + 1e-9)
+            for candidate_size in range(low, high + 1):
+                min_overlap = math.ceil(min_similarity * (size + candidate_size) / 2 - 1e-9)
+                prefix = [gram for gram in rarest[:size - min_overlap + 1] if gram in counts]
+                if ranges and ranges[-1][0] == prefix:
+                    ranges[-1][2] = candidate_size
+                elif prefix:
+                    ranges.append([prefix, candidate_size, candidate_size])
+            if not ranges:
+                return []
+
+            subqueries = " UNION ".join(
+                f"SELECT entry_id FROM memory_grams WHERE gram IN ({','.join('?' * len(prefix))}) "
+                f"AND gram_count BETWEEN ? AND ?" for prefix, _, _ in ranges
+            )
+            params = [value for prefix, first, last in ranges for value in (*prefix, first, last)]
+            rows = self._conn.execute(
+                f"SELECT normalized, source, translations, updated_at FROM memory "
+                f"WHERE id IN ({subqueries}) AND normalized != ?", (*params, normalized)
+            ).fetchall()
+
+        matches = []
+        for candidate, source, translations, updated_at in rows:
+            candidate_grams = ngrams(candidate)
+            similarity = 2 * len(grams & candidate_grams) / (size + len(candidate_grams))
+            if similarity >= min_similarity:
+                matches.append((similarity, updated_at, source, translations))
+        matches.sort(reverse=True)
+        return [{"source": source, "translations": json.loads(translations), "similarity": round(similarity, 3)}
+                for similarity, _, source, translations in matches[:limit]]
+
+    def store(self, text, translations):
+        """保存一条原文的候选译文；规范化后相同的原文覆盖旧记录"""
+        self.store_many({text: translations})
+
+    def store_many(self, items):
+        """批量保存 {原文: 候选译文}，在同一个事务中写入"""
+        now = time.time()
+        with self._lock:
+            for text, translations in items.items():
+                normalized = normalize(text)
+                if not normalized:
+                    continue
+                grams = ngrams(normalized)
+                row = self._conn.execute("SELECT id FROM memory WHERE normalized = ?", (normalized,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE memory SET source = ?, translations = ?, updated_at = ? WHERE id = ?",
+                                       (text, json.dumps(translations, ensure_ascii=False), now, row[0]))
+                    continue
+                entry_id = self._conn.execute(
+                    "INSERT INTO memory (normalized, source, translations, gram_count, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (normalized, text, json.dumps(translations, ensure_ascii=False), len(grams), now)
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO memory_grams (gram, gram_count, entry_id) VALUES (?, ?, ?)",
+                    [(gram, len(grams), entry_id) for gram in grams]
+                )
+                self._conn.executemany(
+                    "INSERT INTO memory_gram_counts (gram, entries) VALUES (?, 1) "
+                    "ON CONFLICT (gram) DO UPDATE SET entries = entries + 1",
+                    [(gram,) for gram in grams]
+                )
+            self._conn.commit()
+
+    def size(self):
+        """记忆库中的条目数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
@@ -1,12 +1,35 @@
 import streamlit as st
-import requests
-import re
 import json
-from bs4 import BeautifulSoup
-import time
 import os
-from openai import OpenAI
-import codecs
+import time
+from ocr_cache import OCRCache, NotePageCache
+from ocr_metrics import METRICS
+import ocr_local
+import ocr_textfilter
+from ocr_jobs import JobStore
+from ocr_index import NoteIndex
+from ocr_core import (
+    DEFAULT_USER_AGENT,
+    create_doubao_client,
+    extract_note_id,
+    get_rate_limiter,
+    extract_texts_concurrently,
+    dedupe_similar_images,
+    ocr_cache_contains,
+    is_ocr_error,
+    is_valid_ocr_text,
+    summarize_ocr_usage,
+    summarize_local_ocr,
+    count_skipped_images,
+    count_timed_out_images,
+    make_deadline,
+    NOTE_DEADLINE_SECONDS,
+    fetch_xhs_content,
+    IMAGE_TIERS,
+    DEFAULT_IMAGE_TIER,
+    apply_image_tier,
+    build_summary,
+)
 
 st.set_page_config(page_title="小红书文字提取工具", page_icon="📝", layout="wide")
 
@@ -18,7 +41,7 @@ with st.sidebar:
     st.header("⚙️ 设置")
     user_agent = st.text_input(
         "User-Agent (可选)", 
-        value="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        value=DEFAULT_USER_AGENT,
         help="自定义User-Agent，用于模拟浏览器请求"
     )
     
@@ -40,53 +63,215 @@ with st.sidebar:
         help="豆包推理接入点ID"
     )
 
-# URL清理函数
-def clean_image_url(url):
-    """清理和解码图片URL"""
-    if not url:
-        return ""
+    # 并发设置
+    max_in_flight = st.slider(
+        "最大并发识别数",
+        min_value=1,
+        max_value=16,
+        value=4,
+        help="同时发送给豆包模型的图片识别请求数量上限"
+    )
+    
+    # 单篇笔记时间上限
+    note_deadline = st.number_input(
+        "单篇笔记时间上限（秒）",
+        min_value=0,
+        max_value=1800,
+        value=NOTE_DEADLINE_SECONDS,
+        step=10,
+        help="抓取和识别的总时间上限，到时停止等待未完成的图片并标记为超时，已完成的结果照常汇总；0 表示不限时"
+    )
+    
+    # 流式显示
+    stream_ocr = st.checkbox(
+        "流式显示识别结果",
+        value=True,
+        help="边识别边显示文字，并记录每张图片的首字耗时和总耗时"
+    )
     
+    # 多图合并识别
+    ocr_batch_size = st.number_input(
+        "每次请求合并图片数",
+        min_value=1,
+        max_value=8,
+        value=1,
+        help="大于1时把多张图片放在同一次请求中识别，减少调用次数和重复的提示词token；"
+             "解析失败的图片自动改为单张识别。合并识别时不使用流式显示"
+    )
+    
+    # 相似图片合并
+    dedupe_images = st.checkbox(
+        "合并重复图片",
+        value=True,
+        help="识别前比对图片缩略图，同一张图片以不同链接或尺寸出现多次时只识别一次"
+    )
+    
+    # 识别用图片规格
+    image_tier_labels = {
+        'original': "原图（页面中的链接）",
+        'small': "预览图（CDN预览规格）",
+    }
+    image_tier = st.selectbox(
+        "识别用图片规格",
+        options=list(IMAGE_TIERS),
+        index=list(IMAGE_TIERS).index(DEFAULT_IMAGE_TIER),
+        format_func=lambda tier: image_tier_labels.get(tier, tier),
+        help="把小红书图片链接改写为CDN的预览规格，模型和本地下载的数据量都更小；"
+             "改写后的图片不存在时自动改用原图。小字很多的长图可选择原图"
+    )
+    
+    # 图片预处理设置
+    inline_images = st.checkbox(
+        "本地压缩后提交图片",
+        value=False,
+        help="先在本地并发下载图片并缩小、压缩，再直接提交图片数据，模型无需从CDN下载原图"
+    )
+    inline_max_edge = st.number_input(
+        "压缩后最长边（像素）",
+        min_value=512,
+        max_value=4096,
+        value=1600,
+        step=128,
+        disabled=not inline_images,
+        help="文字识别一般1200~1600像素即可，越小上传越快但小字可能识别不清"
+    )
+    
+    # 无文字图片预筛选
+    skip_textless_images = st.checkbox(
+        "跳过无文字图片",
+        value=ocr_textfilter.Image is not None,
+        disabled=ocr_textfilter.Image is None,
+        help="识别前在缩略图上检测笔画密度，判定为无文字的商品图、风景照等不再调用模型；"
+             "判定记录保存在 .cache/text_filter.jsonl，可用于调整阈值"
+    )
+    text_filter_min_score = st.number_input(
+        "无文字判定阈值",
+        min_value=0.0,
+        max_value=0.5,
+        value=ocr_textfilter.TEXT_FILTER_MIN_SCORE,
+        step=0.005,
+        format="%.3f",
+        disabled=not skip_textless_images,
+        help="缩略图中笔画密集的行所占比例低于该值时判定为无文字，调高会跳过更多图片"
+    )
+    
+    # 本地OCR
+    local_ocr_available = ocr_local.is_available()
+    use_local_ocr = st.checkbox(
+        "先用本地OCR识别",
+        value=False,
+        disabled=not local_ocr_available,
+        help="先用本机的Tesseract识别，置信度足够的图片不再调用豆包模型，只把识别不清的图片交给豆包"
+             if local_ocr_available else "需要安装 pytesseract 和 Tesseract（含 chi_sim 语言包）"
+    )
+    local_ocr_confidence = st.slider(
+        "本地OCR置信度阈值",
+        min_value=0,
+        max_value=100,
+        value=ocr_local.LOCAL_OCR_MIN_CONFIDENCE,
+        disabled=not (local_ocr_available and use_local_ocr),
+        help="本地识别的平均置信度不低于该值时直接采用，否则交给豆包模型"
+    )
+    
+    st.markdown("---")
+    st.subheader("💾 缓存设置")
+    
+    use_ocr_cache = st.checkbox(
+        "使用识别缓存",
+        value=True,
+        help="相同图片、模型和提示词的识别结果直接从本地缓存读取，不再调用豆包模型"
+    )
+    cache_ttl_hours = st.number_input(
+        "缓存有效期（小时）",
+        min_value=1,
+        value=168,
+        help="超过有效期的识别结果会被重新识别"
+    )
+    cache_max_entries = st.number_input(
+        "缓存最大条数",
+        min_value=100,
+        value=5000,
+        step=100,
+        help="超出上限时淘汰最久未使用的识别结果"
+    )
+    page_cache_ttl_minutes = st.number_input(
+        "页面缓存有效期（分钟）",
+        min_value=0,
+        value=10,
+        help="有效期内重复提取同一笔记不再重新下载页面；过期后向服务器确认页面是否有更新"
+    )
+
+# 获取识别结果缓存（进程内共享）
+@st.cache_resource
+def get_ocr_cache():
+    """获取本地SQLite识别结果缓存"""
+    return OCRCache()
+
+ocr_cache = get_ocr_cache()
+ocr_cache.ttl_seconds = int(cache_ttl_hours) * 3600
+ocr_cache.max_entries = int(cache_max_entries)
+
+# 获取笔记页面缓存（进程内共享）
+@st.cache_resource
+def get_page_cache():
+    """获取笔记页面解析结果缓存"""
+    return NotePageCache()
+
+page_cache = get_page_cache()
+page_cache.ttl_seconds = int(page_cache_ttl_minutes) * 60
+
+# 获取提取结果库（进程内共享）
+@st.cache_resource
+def get_job_store():
+    """获取本地提取结果库"""
+    return JobStore()
+
+job_store = get_job_store()
+
+@st.cache_resource
+def get_note_index():
+    """获取本地笔记全文索引"""
+    return NoteIndex()
+
+note_index = get_note_index()
+
+@st.cache_resource
+def get_text_filter_log():
+    """获取无文字预筛选的判定记录"""
+    return ocr_textfilter.DecisionLog()
+
+@st.cache_resource
+def start_metrics_endpoint(port):
+    """设置了环境变量 OCR_METRICS_PORT 时，在该端口提供 /metrics 接口（整个进程只启动一次）"""
+    return METRICS.serve(port)
+
+if os.environ.get("OCR_METRICS_PORT"):
+    start_metrics_endpoint(int(os.environ["OCR_METRICS_PORT"]))
+
+# 写入指标文件
+def export_metrics():
+    """把累计指标写入本地Prometheus文本文件，供采集"""
     try:
-        # 移除URL前的@符号
-        url = url.lstrip('@').strip()
-        
-        # 处理Unicode转义字符
-        if '\\u' in url:
-            url = codecs.decode(url, 'unicode_escape')
-        
-        # 如果是JSON字符串，尝试解析
-        if url.startswith('{') and url.endswith('}'):
-            try:
-                json_obj = json.loads(url)
-                if 'urlDefault' in json_obj:
-                    url = json_obj['urlDefault']
-                elif 'url' in json_obj:
-                    url = json_obj['url']
-                # 再次处理转义字符
-                if '\\u' in url:
-                    url = codecs.decode(url, 'unicode_escape')
-            except:
-                pass
-        
-        # 确保URL是http开头
-        if url.startswith('//'):
-            url = 'http:' + url
-        elif not url.startswith(('http://', 'https://')):
-            url = 'http://' + url
-        
-        return url
-    except:
-        return url
+        METRICS.write()
+    except OSError:
+        pass
+
+with st.sidebar:
+    st.caption(f"缓存条数: {ocr_cache.size()} ｜ 累计命中: {ocr_cache.hits} ｜ 累计未命中: {ocr_cache.misses}")
+    st.caption(f"页面缓存: {page_cache.size()} 篇 ｜ 命中: {page_cache.hits} ｜ 确认未更新: {page_cache.revalidated}")
+    limiter_stats = get_rate_limiter().stats()
+    st.caption(f"🚦 豆包请求限速: {limiter_stats['rate']} 次/秒 ｜ 累计限流: {limiter_stats['throttled']} 次"
+               "（所有会话共享，被限流时自动减速并重试）")
+    if st.button("🗑️ 清空缓存"):
+        ocr_cache.clear()
+        page_cache.clear()
+        st.success("缓存已清空")
 
 # 初始化豆包客户端
 def init_doubao_client(api_key):
     """初始化豆包视觉大模型客户端"""
     try:
-        client = OpenAI(
-            base_url="https://ark.cn-beijing.volces.com/api/v3",
-            api_key=api_key,
-        )
-        return client
+        return create_doubao_client(api_key)
     except Exception as e:
         st.error(f"豆包客户端初始化失败: {str(e)}")
         return None
@@ -99,244 +284,198 @@ xhs_url = st.text_input(
     help="支持小红书笔记链接"
 )
 
-# 提取小红书ID的函数
-def extract_note_id(url):
-    """从小红书链接中提取笔记ID"""
-    patterns = [
-        r'explore/([a-f0-9]+)',
-        r'discovery/item/([a-f0-9]+)',
-        r'/([a-f0-9]{24})',
-    ]
+# 显示基本信息
+def render_basic_info(content):
+    """显示标题、内容描述和统计信息"""
+    st.markdown("---")
+    st.markdown("### 📄 基本信息")
     
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        # 显示标题
+        if content.get('title'):
+            st.markdown("#### 📝 标题")
+            st.write(content['title'])
+        
+        # 显示描述/内容
+        if content.get('description'):
+            st.markdown("#### 📖 内容描述")
+            st.write(content['description'])
+    
+    with col2:
+        st.markdown("#### 📊 统计信息")
+        st.metric("图片数量", len(content.get('images', [])))
+        if content.get('title'):
+            st.metric("标题长度", len(content['title']))
+        if content.get('description'):
+            st.metric("描述长度", len(content['description']))
 
-# 使用豆包API识别图片文字
-def extract_text_from_image_doubao(img_url, client, model_id):
-    """使用豆包视觉大模型从图片中提取文字"""
-    if client is None:
-        return "豆包客户端未初始化"
+# 显示单张图片的识别结果
+def render_ocr_result(idx, ocr_text, timings=None):
+    """显示一张图片的识别状态、文字内容和耗时"""
+    if timings and timings.get('skipped'):
+        st.info(f"⏭️ 预筛选判定为无文字图片，已跳过识别（文字评分 {timings['text_score']:.3f}）")
+        st.markdown("---")
+        return
+    if timings and timings.get('timed_out'):
+        st.warning("⏰ 超过单篇笔记时间上限，已停止识别这张图片")
+        st.markdown("---")
+        return
     
-    try:
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": img_url
-                            },
-                        },
-                        {
-                            "type": "text", 
-                            "text": "请识别并提取这张图片中的所有文字内容，包括中文、英文、数字等。请按照图片中文字的布局顺序，逐行返回识别的文字，保持原有的换行结构。如果没有文字就返回'无文字'。"
-                        },
-                    ],
-                }
-            ],
+    if is_valid_ocr_text(ocr_text):
+        st.success("✅ 识别成功")
+        st.text_area(f"图片{idx+1}文字内容", ocr_text, height=150, key=f"ocr_{idx}")
+    else:
+        st.warning("⚠️ 未识别到文字内容")
+        if is_ocr_error(ocr_text):
+            st.error(f"错误信息: {ocr_text}")
+    
+    if timings:
+        if timings.get('cached'):
+            st.caption("⏱️ 来自缓存")
+        elif timings.get('engine') == 'local':
+            st.caption(f"🖥️ 本地OCR识别（置信度 {timings['local_confidence']:.0f}）｜ 耗时 {timings['local_ms']:.0f} ms")
+        elif timings.get('batched'):
+            note = "，解析失败后单张重试" if timings.get('batch_fallback') else ""
+            st.caption(f"⏱️ {timings['batched']} 张合并识别{note} ｜ 总耗时 {timings['total_ms']:.0f} ms")
+        elif 'total_ms' in timings:
+            st.caption(f"⏱️ 首字 {timings.get('ttft_ms', timings['total_ms']):.0f} ms ｜ 总耗时 {timings['total_ms']:.0f} ms")
+        if timings.get('engine') == 'doubao':
+            st.caption(f"🖥️ 本地OCR置信度 {timings['local_confidence']:.0f}，已转交豆包模型")
+    
+    st.markdown("---")
+
+# 构建文本格式汇总
+def build_text_summary(summary_data):
+    """把汇总数据转换为纯文本格式"""
+    text_summary = f"标题: {summary_data['标题']}\n\n"
+    text_summary += f"笔记内容: {summary_data['笔记内容']}\n\n"
+    if summary_data['图片文字']:
+        text_summary += "图片文字:\n"
+        for img_key, img_text in summary_data['图片文字'].items():
+            text_summary += f"\n【{img_key}】\n{img_text}\n"
+    return text_summary
+
+# 显示文字汇总和导出选项
+def render_summary_and_exports(job):
+    """显示汇总结果并提供下载；数据全部来自已保存的提取结果"""
+    content = job['content']
+    summary_data = job['summary_data']
+    file_key = job.get('note_id') or 'content'
+    
+    if not (summary_data['图片文字'] or content.get('title') or content.get('description')):
+        st.warning("⚠️ 所有图片都未能识别到文字内容，且未获取到基本信息")
+        return
+    
+    st.markdown("### 📝 所有文字汇总")
+    
+    # 显示JSON格式的汇总
+    combined_json = json.dumps(summary_data, ensure_ascii=False, indent=2)
+    st.code(combined_json, language="json")
+    
+    # 也提供文本格式的选项
+    text_summary = build_text_summary(summary_data)
+    with st.expander("查看文本格式汇总"):
+        st.text_area("文本格式汇总", text_summary, height=300)
+    
+    # 导出功能
+    st.markdown("---")
+    st.markdown("### 📥 导出选项")
+    
+    export_col1, export_col2 = st.columns(2)
+    
+    with export_col1:
+        # 导出文字为JSON
+        st.download_button(
+            label="📝 导出汇总JSON",
+            data=combined_json,
+            file_name=f"xiaohongshu_汇总_{file_key}.json",
+            mime="application/json"
         )
         
-        if response.choices and response.choices[0].message:
-            text_content = response.choices[0].message.content.strip()
-            return text_content if text_content and text_content != "无文字" else "未识别到文字"
-        else:
-            return "API响应为空"
-            
-    except Exception as e:
-        return f"豆包API调用错误: {str(e)}"
+        # 导出文字为文本格式
+        st.download_button(
+            label="📄 导出文本格式",
+            data=text_summary,
+            file_name=f"xiaohongshu_文字_{file_key}.txt",
+            mime="text/plain"
+        )
+    
+    with export_col2:
+        # 导出完整JSON
+        st.download_button(
+            label="📄 导出完整数据",
+            data=json.dumps(content, ensure_ascii=False, indent=2),
+            file_name=f"xiaohongshu_完整_{file_key}.json",
+            mime="application/json"
+        )
+
+# 显示各阶段耗时
+def render_stage_timings(stage_timings):
+    """在折叠面板中显示本次提取各阶段的耗时和计数"""
+    if not stage_timings:
+        return
+    
+    rows = [
+        {"阶段": label, "耗时(ms)": stage_timings[field]}
+        for label, field in (
+            ("页面下载", 'fetch_ms'),
+            ("HTML解析", 'html_ms'),
+            ("页面数据解析", 'json_ms'),
+            ("相似图片比对", 'dedupe_ms'),
+            ("本地OCR（累计）", 'local_ms'),
+            ("图片文字识别", 'ocr_ms'),
+            ("合计", 'total_ms'),
+        )
+        if field in stage_timings
+    ]
+    cache_labels = {'hit': "命中缓存", 'revalidated': "服务器确认未更新", 'miss': "重新下载"}
+    with st.expander("⏱️ 耗时分析"):
+        st.table(rows)
+        st.caption(
+            f"页面: {cache_labels.get(stage_timings.get('page_cache'), '未使用缓存')} ｜ "
+            f"下载 {stage_timings.get('bytes_fetched', 0) / 1024:.1f} KB ｜ "
+            f"找到图片 {stage_timings.get('images_found', 0)} 张 ｜ "
+            f"合并重复 {stage_timings.get('images_deduped', 0)} 张 ｜ "
+            f"跳过无文字 {stage_timings.get('images_skipped', 0)} 张 ｜ "
+            f"超时 {stage_timings.get('images_timed_out', 0)} 张 ｜ "
+            f"输入 {stage_timings.get('prompt_tokens', 0)} tokens ｜ 输出 {stage_timings.get('completion_tokens', 0)} tokens"
+        )
+
+# 显示已保存的提取结果
+def render_job(job):
+    """不访问网络和模型，直接显示之前保存的提取结果"""
+    content = job['content']
+    render_basic_info(content)
+    
+    if not content.get('images'):
+        st.warning("⚠️ 未找到任何图片")
+        return
+    
+    st.markdown("---")
+    st.markdown("### 🔍 图片文字提取")
+    ocr_timings = job.get('ocr_timings') or [None] * len(content['images'])
+    for idx, (img_url, ocr_text, timings) in enumerate(zip(content['images'], job['ocr_results'], ocr_timings)):
+        st.markdown(f"#### 图片 {idx+1} 识别结果")
+        st.text(f"URL: {img_url}")
+        render_ocr_result(idx, ocr_text, timings)
+    
+    render_stage_timings(job.get('stage_timings'))
+    render_summary_and_exports(job)
 
-# 抓取小红书内容的函数
-def fetch_xhs_content(url):
-    """抓取小红书内容"""
+# 保存提取结果
+def save_job(job_key, job):
+    """保存到当前会话和本地结果库，并加入全文索引"""
+    st.session_state.setdefault('jobs', {})[job_key] = job
     try:
-        headers = {
-            'User-Agent': user_agent,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0',
-            'sec-ch-ua': '"Google Chrome";v="119", "Chromium";v="119", "Not?A_Brand";v="24"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"macOS"'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        # 解析HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 尝试从不同位置提取内容
-        content_data = {}
-        
-        # 提取标题
-        title_selectors = [
-            'meta[property="og:title"]',
-            'title',
-            '.note-title',
-            'h1'
-        ]
-        
-        for selector in title_selectors:
-            title_element = soup.select_one(selector)
-            if title_element:
-                if selector.startswith('meta'):
-                    content_data['title'] = title_element.get('content', '').strip()
-                else:
-                    content_data['title'] = title_element.get_text().strip()
-                if content_data['title']:
-                    break
-        
-        # 提取描述/内容
-        desc_selectors = [
-            'meta[property="og:description"]',
-            'meta[name="description"]',
-            '.note-content',
-            '.desc'
-        ]
-        
-        for selector in desc_selectors:
-            desc_element = soup.select_one(selector)
-            if desc_element:
-                if selector.startswith('meta'):
-                    content_data['description'] = desc_element.get('content', '').strip()
-                else:
-                    content_data['description'] = desc_element.get_text().strip()
-                if content_data['description']:
-                    break
-        
-        # 提取图片 - 增强版
-        img_selectors = [
-            'meta[property="og:image"]',
-            'meta[name="twitter:image"]',
-            '.note-image img',
-            '.image-container img',
-            '.photo-item img',
-            '.swiper-slide img',
-            'img[src*="ci.xiaohongshu.com"]',
-            'img[src*="sns-webpic-qc.xhscdn.com"]',
-            'img[src*="xhscdn.com"]',
-            'img[data-src*="xhscdn.com"]',
-            'img[data-original*="xhscdn.com"]',
-            'img'  # 作为备选，获取所有img标签
-        ]
-        
-        images = []
-        
-        for selector in img_selectors:
-            if selector.startswith('meta'):
-                img_element = soup.select_one(selector)
-                if img_element:
-                    img_url = img_element.get('content', '')
-                    if img_url and 'xhs' in img_url.lower():
-                        cleaned_url = clean_image_url(img_url)
-                        images.append(cleaned_url)
-            else:
-                img_elements = soup.select(selector)
-                for img in img_elements:
-                    # 尝试多个属性获取图片URL
-                    img_url = (img.get('src', '') or 
-                              img.get('data-src', '') or 
-                              img.get('data-original', '') or
-                              img.get('data-lazy', '') or
-                              img.get('data-url', ''))
-                    
-                    if img_url:
-                        # 过滤掉明显不是内容图片的URL
-                        if ('xhs' in img_url.lower() and
-                            not any(x in img_url.lower() for x in ['avatar', 'head', 'icon', 'logo', 'badge'])):
-                            cleaned_url = clean_image_url(img_url)
-                            if cleaned_url not in images:
-                                images.append(cleaned_url)
-        
-        content_data['images'] = images[:10]  # 限制最多10张图片
-        
-        # 尝试从页面源码中提取JSON数据以获取更多图片
-        script_tags = soup.find_all('script')
-        json_images_found = []
-        
-        for script in script_tags:
-            if script.string:
-                # 尝试多种JSON数据提取方式
-                patterns = [
-                    r'window\.__INITIAL_STATE__\s*=\s*({.+?});',
-                    r'window\.__NUXT__\s*=\s*({.+?});',
-                    r'"imageList"\s*:\s*\[([^\]]+)\]',
-                    r'"urlDefault"\s*:\s*"([^"]+)"',
-                    r'"url"\s*:\s*"(https://[^"]*xhscdn[^"]*)"'
-                ]
-                
-                for pattern in patterns:
-                    matches = re.findall(pattern, script.string)
-                    for match in matches:
-                        if pattern == patterns[0] or pattern == patterns[1]:  # 完整JSON
-                            try:
-                                data = json.loads(match)
-                                # 递归搜索图片URL
-                                def find_images_in_json(obj, path=""):
-                                    if isinstance(obj, dict):
-                                        for key, value in obj.items():
-                                            if key in ['urlDefault', 'url', 'src'] and isinstance(value, str) and 'xhscdn' in value:
-                                                cleaned_url = clean_image_url(value)
-                                                json_images_found.append(cleaned_url)
-                                                if cleaned_url not in content_data['images']:
-                                                    content_data['images'].append(cleaned_url)
-                                            else:
-                                                find_images_in_json(value, f"{path}.{key}")
-                                    elif isinstance(obj, list):
-                                        for i, item in enumerate(obj):
-                                            find_images_in_json(item, f"{path}[{i}]")
-                                
-                                find_images_in_json(data)
-                            except:
-                                continue
-                        else:  # 直接URL匹配
-                            if 'xhscdn' in match:
-                                cleaned_url = clean_image_url(match)
-                                if cleaned_url not in content_data['images']:
-                                    json_images_found.append(cleaned_url)
-                                    content_data['images'].append(cleaned_url)
-        
-        # 最后的备用方案：直接从页面源码中搜索所有可能的图片URL
-        if len(content_data['images']) == 0:
-            backup_images = []
-            # 使用正则表达式搜索所有包含xhscdn的URL
-            url_patterns = [
-                r'https://[^"\s]*xhscdn[^"\s]*\.(?:jpg|jpeg|png|webp|gif)',
-                r'https://[^"\s]*ci\.xiaohongshu[^"\s]*\.(?:jpg|jpeg|png|webp|gif)',
-                r'"(https://[^"]*xhscdn[^"]*)"',
-                r"'(https://[^']*xhscdn[^']*)'"
-            ]
-            
-            page_text = response.text
-            for pattern in url_patterns:
-                matches = re.findall(pattern, page_text, re.IGNORECASE)
-                for match in matches:
-                    cleaned_url = clean_image_url(match)
-                    if cleaned_url not in backup_images and len(backup_images) < 10:
-                        backup_images.append(cleaned_url)
-            
-            if backup_images:
-                content_data['images'].extend(backup_images[:5])  # 添加前5个备用图片
-        
-        return content_data
-        
-    except requests.RequestException as e:
-        return {'error': f'网络请求错误: {str(e)}'}
+        job_store.save(job_key, job)
+    except OSError as e:
+        st.warning(f"提取结果保存失败，刷新页面后需要重新提取: {str(e)}")
+    try:
+        note_index.add_summary(job.get('note_id'), job['url'], job['summary_data'])
     except Exception as e:
-        return {'error': f'解析错误: {str(e)}'}
+        st.warning(f"加入搜索索引失败: {str(e)}")
 
 # 处理链接输入
 if xhs_url:
@@ -352,6 +491,9 @@ if xhs_url:
         if note_id:
             st.info(f"📋 检测到笔记ID: {note_id}")
         
+        # 同一笔记的提取结果按笔记ID保存，没有ID时按链接保存
+        job_key = note_id or xhs_url
+        
         # 开始抓取按钮
         if st.button("🚀 开始提取文字", type="primary"):
             # 检查必要参数
@@ -365,187 +507,193 @@ if xhs_url:
                     doubao_client = init_doubao_client(ark_api_key)
                 
                 if doubao_client:
+                    run_started = time.time()
+                    deadline = make_deadline(note_deadline)
+                    stage_timings = {}
                     with st.spinner("正在抓取内容，请稍候..."):
-                        content = fetch_xhs_content(xhs_url)
+                        content = fetch_xhs_content(xhs_url, user_agent, page_cache, stage_timings, deadline)
+                    
+                    if 'error' in content:
+                        METRICS.inc("xhs_notes_total", labels={"result": "error"}, help_text="处理的笔记数")
+                        export_metrics()
+                        st.error(f"抓取失败: {content['error']}")
+                        st.markdown("""
+                        ### 💡 抓取建议
+                        - 确保链接有效且可访问
+                        - 小红书可能有反爬虫机制，请稍后重试
+                        - 尝试使用不同的User-Agent
+                        - 某些私密内容可能无法访问
+                        """)
+                    else:
+                        st.success("✅ 抓取成功!")
+                        # 显示和导出使用页面中的图片链接，识别使用所选规格的链接
+                        ocr_images = apply_image_tier(content.get('images', []), image_tier)
+                        page_urls = dict(zip(ocr_images, content.get('images', [])))
                         
-                        if 'error' in content:
-                            st.error(f"抓取失败: {content['error']}")
-                            st.markdown("""
-                            ### 💡 抓取建议
-                            - 确保链接有效且可访问
-                            - 小红书可能有反爬虫机制，请稍后重试
-                            - 尝试使用不同的User-Agent
-                            - 某些私密内容可能无法访问
-                            """)
-                        else:
-                            st.success("✅ 抓取成功!")
-                            
-                            # 显示基本信息
+                        # 识别前合并重复图片，比对时下载的图片留给识别使用；已有缓存结果的图片不下载比对
+                        downloaded_images = {}
+                        if dedupe_images and len(ocr_images) > 1:
+                            dedupe_started = time.time()
+                            cached_images = {
+                                img_url for img_url in ocr_images
+                                if use_ocr_cache and ocr_cache_contains(
+                                    ocr_cache, img_url, model_id, int(inline_max_edge) if inline_images else None)
+                            }
+                            with st.spinner("正在比对相似图片..."):
+                                ocr_images, duplicate_images = dedupe_similar_images(
+                                    ocr_images, deadline=deadline, downloads=downloaded_images,
+                                    skip=cached_images)
+                            content['images'] = [page_urls[img_url] for img_url in ocr_images]
+                            stage_timings['dedupe_ms'] = round((time.time() - dedupe_started) * 1000, 1)
+                            stage_timings['images_deduped'] = len(duplicate_images)
+                            if duplicate_images:
+                                content['duplicate_images'] = {
+                                    page_urls[img_url]: page_urls[kept_url]
+                                    for img_url, kept_url in duplicate_images.items()
+                                }
+                                st.caption(f"🧬 合并了 {len(duplicate_images)} 张重复图片，"
+                                           f"节省 {len(duplicate_images)} 次模型调用")
+                        
+                        # 显示基本信息
+                        render_basic_info(content)
+                        
+                        ocr_results = []
+                        ocr_timings = []
+                        
+                        # 图片文字提取
+                        if content.get('images'):
                             st.markdown("---")
-                            st.markdown("### 📄 基本信息")
+                            st.markdown("### 🔍 图片文字提取")
+                            st.write(f"共发现 {len(content['images'])} 张图片，正在提取文字...")
                             
-                            col1, col2 = st.columns([2, 1])
+                            # OCR识别进度条
+                            progress_bar = st.progress(0)
+                            status_text = st.empty()
                             
-                            with col1:
-                                # 显示标题
-                                if content.get('title'):
-                                    st.markdown("#### 📝 标题")
-                                    st.write(content['title'])
-                                
-                                # 显示描述/内容
-                                if content.get('description'):
-                                    st.markdown("#### 📖 内容描述")
-                                    st.write(content['description'])
+                            # 为每张图片预留结果位置，保证显示顺序与图片顺序一致
+                            result_slots = []
+                            for idx, img_url in enumerate(content['images']):
+                                slot = st.container()
+                                with slot:
+                                    st.markdown(f"#### 图片 {idx+1} 识别结果")
+                                    st.text(f"URL: {img_url}")
+                                    pending = st.empty()
+                                    pending.info("⏳ 等待识别...")
+                                result_slots.append((slot, pending))
                             
-                            with col2:
-                                st.markdown("#### 📊 统计信息")
-                                st.metric("图片数量", len(content.get('images', [])))
-                                if content.get('title'):
-                                    st.metric("标题长度", len(content['title']))
-                                if content.get('description'):
-                                    st.metric("描述长度", len(content['description']))
+                            ocr_results = [None] * len(content['images'])
+                            ocr_timings = [None] * len(content['images'])
+                            streamed_texts = [""] * len(content['images'])
+                            last_refresh = [0.0] * len(content['images'])
+                            done_count = 0
+                            active_cache = ocr_cache if use_ocr_cache else None
+                            hits_before, misses_before = ocr_cache.hits, ocr_cache.misses
+                            ocr_started = time.time()
+                            status_text.text(f"正在并发识别 {len(content['images'])} 张图片（最大并发 {max_in_flight}）...")
                             
-                            # 图片文字提取
-                            if content.get('images'):
-                                st.markdown("---")
-                                st.markdown("### 🔍 图片文字提取")
-                                st.write(f"共发现 {len(content['images'])} 张图片，正在提取文字...")
+                            # 并发调用豆包API，流式显示识别中的文字，每张图片完成后立即显示到对应位置
+                            for event, idx, data in extract_texts_concurrently(
+                                    ocr_images, doubao_client, model_id, max_in_flight, active_cache,
+                                    stream=stream_ocr, batch_size=int(ocr_batch_size), deadline=deadline,
+                                    downloads=downloaded_images,
+                                    local_min_confidence=local_ocr_confidence if use_local_ocr else None,
+                                    text_min_score=text_filter_min_score if skip_textless_images else None,
+                                    decision_log=get_text_filter_log() if skip_textless_images else None,
+                                    inline_max_edge=int(inline_max_edge) if inline_images else None):
+                                slot, pending = result_slots[idx]
                                 
-                                # OCR识别进度条
-                                progress_bar = st.progress(0)
-                                status_text = st.empty()
+                                if event == "delta":
+                                    streamed_texts[idx] += data
+                                    # 限制刷新频率，避免每个字都重绘
+                                    if time.time() - last_refresh[idx] >= 0.1:
+                                        pending.text(streamed_texts[idx])
+                                        last_refresh[idx] = time.time()
+                                    continue
                                 
-                                all_ocr_texts = []  # 存储所有OCR识别的文字
+                                ocr_text, timings = data
+                                ocr_results[idx] = ocr_text
+                                ocr_timings[idx] = timings
+                                done_count += 1
                                 
-                                # 处理每张图片
-                                for idx, img_url in enumerate(content['images']):
-                                    # 更新进度
-                                    progress = (idx + 1) / len(content['images'])
-                                    progress_bar.progress(progress)
-                                    status_text.text(f"正在识别图片 {idx+1}/{len(content['images'])}...")
-                                    
-                                    # 使用豆包API进行文字识别
-                                    ocr_text = extract_text_from_image_doubao(img_url, doubao_client, model_id)
-                                    
-                                    # 显示每张图片的识别结果
-                                    with st.container():
-                                        st.markdown(f"#### 图片 {idx+1} 识别结果")
-                                        st.text(f"URL: {img_url}")
-                                        
-                                        # 检查是否是有效的文字识别结果
-                                        is_valid_text = (ocr_text and 
-                                                        ocr_text != "未识别到文字" and 
-                                                        not ocr_text.startswith("豆包API调用错误") and
-                                                        not ocr_text.startswith("API响应为空") and
-                                                        not ocr_text.startswith("豆包客户端未初始化") and
-                                                        ocr_text != "无文字")
-                                        
-                                        if is_valid_text:
-                                            st.success("✅ 识别成功")
-                                            st.text_area(f"图片{idx+1}文字内容", ocr_text, height=150, key=f"ocr_{idx}")
-                                            all_ocr_texts.append(f"【图片{idx+1}】\n{ocr_text}")
-                                        else:
-                                            st.warning("⚠️ 未识别到文字内容")
-                                            if ocr_text and (ocr_text.startswith("豆包API调用错误") or 
-                                                           ocr_text.startswith("API响应为空") or 
-                                                           ocr_text.startswith("豆包客户端未初始化")):
-                                                st.error(f"错误信息: {ocr_text}")
-                                        
-                                        st.markdown("---")
+                                # 更新进度
+                                progress_bar.progress(done_count / len(content['images']))
+                                status_text.text(f"已完成 {done_count}/{len(content['images'])} 张图片...")
                                 
-                                # 清除进度条
-                                progress_bar.empty()
-                                status_text.empty()
-                                
-                                # 显示所有OCR结果汇总
-                                if all_ocr_texts or content.get('title') or content.get('description'):
-                                    st.markdown("### 📝 所有文字汇总")
-                                    
-                                    # 构建JSON格式的汇总内容
-                                    summary_data = {
-                                        "标题": content.get('title', ''),
-                                        "笔记内容": content.get('description', ''),
-                                        "图片文字": {}
-                                    }
-                                    
-                                    # 添加图片文字识别结果
-                                    if all_ocr_texts:
-                                        for idx, ocr_text in enumerate(all_ocr_texts):
-                                            # 提取图片编号和文字内容
-                                            if ocr_text.startswith("【图片"):
-                                                # 分割出图片编号和内容
-                                                lines = ocr_text.split("\n", 1)
-                                                img_key = lines[0].replace("【", "").replace("】", "")
-                                                img_content = lines[1] if len(lines) > 1 else ""
-                                                summary_data["图片文字"][img_key] = img_content
-                                    
-                                    # 显示JSON格式的汇总
-                                    combined_json = json.dumps(summary_data, ensure_ascii=False, indent=2)
-                                    st.code(combined_json, language="json")
-                                    
-                                    # 也提供文本格式的选项
-                                    with st.expander("查看文本格式汇总"):
-                                        text_summary = f"标题: {summary_data['标题']}\n\n"
-                                        text_summary += f"笔记内容: {summary_data['笔记内容']}\n\n"
-                                        if summary_data['图片文字']:
-                                            text_summary += "图片文字:\n"
-                                            for img_key, img_text in summary_data['图片文字'].items():
-                                                text_summary += f"\n【{img_key}】\n{img_text}\n"
-                                        st.text_area("文本格式汇总", text_summary, height=300)
-                                    
-                                    combined_text = combined_json
-                                    
-                                    # 将OCR结果添加到内容数据中
-                                    content['ocr_texts'] = all_ocr_texts
-                                    content['combined_ocr_text'] = combined_text
-                                    content['summary_data'] = summary_data
-                                    
-                                    # 导出功能
-                                    st.markdown("---")
-                                    st.markdown("### 📥 导出选项")
-                                    
-                                    export_col1, export_col2 = st.columns(2)
-                                    
-                                    with export_col1:
-                                        # 导出文字为JSON
-                                        if st.button("📝 导出汇总JSON"):
-                                            st.download_button(
-                                                label="下载JSON汇总文件",
-                                                data=combined_text,
-                                                file_name=f"xiaohongshu_汇总_{note_id or 'content'}.json",
-                                                mime="application/json"
-                                            )
-                                        
-                                        # 导出文字为文本格式
-                                        if st.button("📄 导出文本格式"):
-                                            text_content = f"标题: {summary_data['标题']}\n\n"
-                                            text_content += f"笔记内容: {summary_data['笔记内容']}\n\n"
-                                            if summary_data['图片文字']:
-                                                text_content += "图片文字:\n"
-                                                for img_key, img_text in summary_data['图片文字'].items():
-                                                    text_content += f"\n【{img_key}】\n{img_text}\n"
-                                            
-                                            st.download_button(
-                                                label="下载文字文件",
-                                                data=text_content,
-                                                file_name=f"xiaohongshu_文字_{note_id or 'content'}.txt",
-                                                mime="text/plain"
-                                            )
-                                    
-                                    with export_col2:
-                                        # 导出完整JSON
-                                        if st.button("📄 导出完整数据"):
-                                            json_str = json.dumps(content, ensure_ascii=False, indent=2)
-                                            st.download_button(
-                                                label="下载JSON文件",
-                                                data=json_str,
-                                                file_name=f"xiaohongshu_完整_{note_id or 'content'}.json",
-                                                mime="application/json"
-                                            )
-                                elif not content.get('title') and not content.get('description'):
-                                    st.warning("⚠️ 所有图片都未能识别到文字内容，且未获取到基本信息")
-                            else:
-                                st.warning("⚠️ 未找到任何图片")
+                                # 显示每张图片的识别结果
+                                pending.empty()
+                                with slot:
+                                    render_ocr_result(idx, ocr_text, timings)
+                            
+                            if use_ocr_cache:
+                                st.caption(f"💾 本次缓存命中 {ocr_cache.hits - hits_before} 张，"
+                                           f"未命中 {ocr_cache.misses - misses_before} 张")
+                            usage = summarize_ocr_usage(ocr_timings)
+                            stage_timings['ocr_ms'] = round((time.time() - ocr_started) * 1000, 1)
+                            stage_timings.update(usage)
+                            skipped_count = count_skipped_images(ocr_timings)
+                            if skipped_count:
+                                stage_timings['images_skipped'] = skipped_count
+                                st.caption(f"⏭️ 预筛选跳过 {skipped_count} 张无文字图片")
+                            timed_out_count = count_timed_out_images(ocr_timings)
+                            if timed_out_count:
+                                stage_timings['images_timed_out'] = timed_out_count
+                                st.warning(f"⏰ 超过单篇笔记时间上限（{note_deadline} 秒），{timed_out_count} 张图片未完成识别，"
+                                           f"汇总中只包含已完成的图片")
+                            local_stats = summarize_local_ocr(ocr_timings)
+                            if local_stats['local_attempts']:
+                                stage_timings.update(local_stats)
+                                st.caption(f"🖥️ 本地OCR采用 {local_stats['local_accepted']} 张，转交豆包 "
+                                           f"{local_stats['local_escalated']} 张（转交率 "
+                                           f"{local_stats['local_escalated'] / local_stats['local_attempts']:.0%}），"
+                                           f"本地识别累计 {local_stats['local_ms'] / 1000:.1f} 秒，"
+                                           f"节省 {local_stats['local_accepted']} 次模型调用")
+                            st.caption(f"📊 调用模型 {usage['api_calls']} 次 ｜ 输入 {usage['prompt_tokens']} tokens ｜ "
+                                       f"输出 {usage['completion_tokens']} tokens ｜ 识别耗时 {stage_timings['ocr_ms'] / 1000:.1f} 秒")
+                            
+                            # 清除进度条
+                            progress_bar.empty()
+                            status_text.empty()
+                        
+                        # 按图片顺序汇总识别结果，并将OCR结果添加到内容数据中
+                        summary_data = build_summary(content, ocr_results, ocr_timings)
+                        content['ocr_texts'] = [
+                            f"【图片{idx+1}】\n{ocr_text}"
+                            for idx, ocr_text in enumerate(ocr_results)
+                            if is_valid_ocr_text(ocr_text)
+                        ]
+                        content['combined_ocr_text'] = json.dumps(summary_data, ensure_ascii=False, indent=2)
+                        content['summary_data'] = summary_data
+                        
+                        stage_timings['total_ms'] = round((time.time() - run_started) * 1000, 1)
+                        METRICS.observe("xhs_note_seconds", stage_timings['total_ms'] / 1000, help_text="单篇笔记处理总耗时")
+                        METRICS.inc("xhs_notes_total", labels={"result": "ok"}, help_text="处理的笔记数")
+                        export_metrics()
+                        
+                        # 保存提取结果，之后的导出和页面刷新直接使用
+                        job = {
+                            'url': xhs_url,
+                            'note_id': note_id,
+                            'created_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                            'content': content,
+                            'ocr_results': ocr_results,
+                            'ocr_timings': ocr_timings,
+                            'summary_data': summary_data,
+                            'stage_timings': stage_timings,
+                        }
+                        save_job(job_key, job)
+                        
+                        if content.get('images'):
+                            render_stage_timings(stage_timings)
+                            render_summary_and_exports(job)
+                        else:
+                            st.warning("⚠️ 未找到任何图片")
+        else:
+            # 没有点击提取时，显示之前保存的结果（导出、页面刷新都不会重新抓取和识别）
+            job = st.session_state.get('jobs', {}).get(job_key) or job_store.load(job_key)
+            if job:
+                st.session_state.setdefault('jobs', {})[job_key] = job
+                st.caption(f"📦 显示 {job.get('created_at', '')} 的提取结果，点击“开始提取文字”可重新提取")
+                render_job(job)
 
 # 使用说明
 with st.expander("📚 使用说明"):
@@ -562,8 +710,13 @@ with st.expander("📚 使用说明"):
     - **专业文字提取**: 专门用于提取图片中的文字内容
     - **豆包大模型**: 使用先进的视觉大模型，识别准确率高
     - **批量处理**: 自动处理笔记中的所有图片
+    - **并发识别**: 多张图片同时识别，可在侧边栏调整最大并发数
+    - **识别缓存**: 相同图片的识别结果保存在本地，重复提取无需再次调用模型
+    - **跳过无文字图片**: 识别前快速检测图片是否含有文字，纯商品图、风景照不再调用模型
+    - **本地OCR优先**: 安装Tesseract后可先在本机识别，只把识别不清的图片交给豆包模型
     - **文字汇总**: 将所有图片的文字内容合并展示
     - **多格式导出**: 支持纯文字和JSON格式导出
+    - **结果保存**: 提取结果自动保存，导出和刷新页面不会重新抓取和识别
     
     ### 支持的链接格式
     - https://www.xiaohongshu.com/explore/...
@@ -575,6 +728,10 @@ with st.expander("📚 使用说明"):
     - 支持中英文混合识别
     - 基于云端API，识别速度快
     - 自动处理图片URL编码问题
+    - 默认把图片链接改写为CDN的预览规格再识别，数据量更小；改写后的图片不存在时自动回退到原图
+    - 大批量链接可使用命令行批量模式：`python ocr_batch.py urls.txt -o results.jsonl`
+    - 提取结果自动加入本地全文索引，可用 `streamlit run ocr_search.py` 按关键词查找之前提取过的笔记
+    - 累计耗时和用量指标以Prometheus文本格式写入 `.cache/metrics.prom`；设置环境变量 `OCR_METRICS_PORT` 后也可通过 `/metrics` 接口采集
     
     ### 注意事项
     - 请遵守小红书的使用条款
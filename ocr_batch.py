@@ -0,0 +1,409 @@
+"""小红书文字提取 - 批量模式（无需Streamlit）
+
+用法:
+    python ocr_batch.py urls.txt -o results.jsonl --api-key <豆包API Key> --model <模型ID>
+
+输入文件每行一个小红书链接，空行和以 # 开头的行会被忽略。
+每完成一篇笔记就向输出文件追加一行JSON；输出文件同时作为断点记录，
+中断后使用相同参数重新运行即可跳过已成功的笔记继续处理。抓取失败或全部图片识别失败、超时的笔记
+会重新处理并追加新的记录（同一链接以最后一条记录为准）。
+成功的笔记同时加入本地全文索引，可用 `streamlit run ocr_search.py` 搜索。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ocr_cache import OCRCache, NotePageCache
+from ocr_index import NoteIndex, DEFAULT_INDEX_PATH
+from ocr_metrics import METRICS
+import ocr_local
+import ocr_textfilter
+from ocr_core import (
+    DEFAULT_USER_AGENT,
+    DEFAULT_IMAGE_TIER,
+    NOTE_DEADLINE_SECONDS,
+    DEADLINE_GRACE_SECONDS,
+    make_deadline,
+    remaining_seconds,
+    mark_timed_out,
+    IMAGE_TIERS,
+    apply_image_tier,
+    configure_http_session,
+    configure_rate_limiter,
+    get_rate_limiter,
+    create_doubao_client,
+    extract_note_id,
+    extract_text_with_cache,
+    extract_batch_with_fallback,
+    ocr_cache_lookup,
+    ocr_cache_contains,
+    summarize_ocr_usage,
+    summarize_local_ocr,
+    count_skipped_images,
+    count_timed_out_images,
+    image_status,
+    dedupe_similar_images,
+    fetch_xhs_content,
+    build_summary,
+)
+
+
+# 读取链接列表
+def read_urls(path):
+    """读取链接文件，补全协议并按出现顺序去重"""
+    urls = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            url = line.strip()
+            if not url or url.startswith("#"):
+                continue
+            if not url.startswith(("http://", "https://")):
+                url = "https://" + url
+            if url not in seen:
+                seen.add(url)
+                urls.append(url)
+    return urls
+
+
+# 判断笔记记录是否处理成功
+def is_note_done(record):
+    """抓取成功且至少一张图片得到了识别结果（或笔记没有图片）；抓取失败、全部图片识别失败或超时时为False"""
+    if "error" in record:
+        return False
+    images = record.get("images") or []
+    return not images or any(image.get("status") not in ("error", "timeout") for image in images)
+
+
+# 读取断点
+def load_checkpoint(output_path):
+    """读取已有输出文件中已成功的链接（见 is_note_done），失败的笔记重新处理；末尾不完整的记录会被截断"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        # 上次运行中断时可能只写了半行，截断到最后一个完整的换行
+        last_newline = data.rfind(b"\n")
+        if last_newline + 1 != len(data):
+            f.truncate(last_newline + 1)
+            data = data[:last_newline + 1]
+
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("url") and is_note_done(record):
+            done.add(record["url"])
+    return done
+
+
+# 处理单篇笔记
+def process_note(url, client, model_id, ocr_pool, cache, user_agent, page_cache=None, inline_max_edge=None,
+                 dedupe_images=False, batch_size=1, local_min_confidence=None, text_min_score=None,
+                 decision_log=None, image_tier=None, deadline_seconds=None):
+    """抓取笔记并将所有图片提交到共享识别线程池，返回一条输出记录
+
+    batch_size 大于1时，未命中缓存的图片每 batch_size 张合并为一次请求识别；
+    local_min_confidence 不为空时先用本地OCR识别，置信度不足的图片才调用豆包模型；
+    text_min_score 不为空时先预筛选，判定为无文字的图片不再识别，判定结果写入 decision_log；
+    image_tier 不为空时把图片链接改写为该规格（见 IMAGE_TIERS），识别和下载都使用较小的图片；
+    deadline_seconds 不为空时整篇笔记（抓取和识别）最多处理这么久，到时取消还在排队的图片，
+    已完成的图片照常输出，其余图片的 status 为 timeout。
+    """
+    local_options = {
+        "local_min_confidence": local_min_confidence,
+        "text_min_score": text_min_score,
+        "decision_log": decision_log,
+    }
+    started_at = time.time()
+    deadline = make_deadline(deadline_seconds)
+    record = {"url": url, "note_id": extract_note_id(url)}
+
+    if "xiaohongshu.com" not in url and "xhslink.com" not in url:
+        record["error"] = "无效的小红书链接"
+        return record
+
+    stages = {}
+    content = fetch_xhs_content(url, user_agent, page_cache, stages, deadline)
+    if "error" in content:
+        record["error"] = content["error"]
+        return record
+
+    # 记录中使用页面中的图片链接，识别使用所选规格的链接
+    images = apply_image_tier(content.get("images", []), image_tier)
+    page_urls = dict(zip(images, content.get("images", [])))
+    duplicate_images = {}
+    # 合并重复图片时下载的图片字节留给预筛选、本地OCR和内联提交使用
+    downloads = {}
+    if dedupe_images:
+        dedupe_started = time.time()
+        # 已有缓存结果的图片不下载比对，重新运行已处理过的笔记时不下载图片
+        cached_images = {img_url for img_url in images
+                         if ocr_cache_contains(cache, img_url, model_id, inline_max_edge)}
+        images, duplicate_images = dedupe_similar_images(images, deadline=deadline, downloads=downloads,
+                                                         skip=cached_images)
+        stages["dedupe_ms"] = round((time.time() - dedupe_started) * 1000, 1)
+    ocr_started = time.time()
+    if batch_size > 1:
+        ocr_results, ocr_timings = _ocr_batched(images, client, model_id, ocr_pool, cache, inline_max_edge,
+                                                batch_size, deadline, downloads=downloads, **local_options)
+    else:
+        ocr_timings = [{} for _ in images]
+        futures = [
+            ocr_pool.submit(extract_text_with_cache, img_url, client, model_id, cache, inline_max_edge,
+                            timings=timings, deadline=deadline, image_bytes=downloads.pop(img_url, None),
+                            **local_options)
+            for img_url, timings in zip(images, ocr_timings)
+        ]
+        _wait_for_deadline(futures, deadline)
+        ocr_results = []
+        for idx, future in enumerate(futures):
+            if future.done() and not future.cancelled():
+                ocr_results.append(future.result())
+            else:
+                ocr_timings[idx] = {}
+                ocr_results.append(mark_timed_out(ocr_timings[idx]))
+    stages["ocr_ms"] = round((time.time() - ocr_started) * 1000, 1)
+
+    record.update({
+        "title": content.get("title", ""),
+        "description": content.get("description", ""),
+        "images": [
+            {
+                "index": idx + 1,
+                "url": page_urls[img_url],
+                "text": ocr_text,
+                "status": image_status(ocr_text, timings),
+                **timings,
+            }
+            for idx, (img_url, ocr_text, timings) in enumerate(zip(images, ocr_results, ocr_timings))
+        ],
+        "summary": build_summary(content, ocr_results, ocr_timings),
+        "duplicates_removed": len(duplicate_images),
+        "usage": summarize_ocr_usage(ocr_timings),
+        "local_ocr": summarize_local_ocr(ocr_timings),
+        "images_skipped": count_skipped_images(ocr_timings),
+        "images_timed_out": count_timed_out_images(ocr_timings),
+        "stages": stages,
+        "elapsed_seconds": round(time.time() - started_at, 3),
+    })
+    METRICS.observe("xhs_note_seconds", record["elapsed_seconds"], help_text="单篇笔记处理总耗时")
+    return record
+
+
+# 等待识别任务直到截止时刻
+def _wait_for_deadline(futures, deadline):
+    """等待全部任务完成；截止时刻（加宽限时间）过后取消还在排队的任务，返回时未完成的任务按超时处理"""
+    remaining = remaining_seconds(deadline)
+    _, not_done = wait(futures, timeout=None if remaining is None else max(remaining + DEADLINE_GRACE_SECONDS, 0))
+    for future in not_done:
+        future.cancel()
+
+
+# 合并识别一篇笔记的图片
+def _ocr_batched(images, client, model_id, ocr_pool, cache, inline_max_edge, batch_size, deadline=None,
+                 **local_options):
+    """先查缓存，剩余图片分组提交到共享线程池合并识别，返回 (识别结果列表, 耗时统计列表)"""
+    ocr_results = [None] * len(images)
+    ocr_timings = [{} for _ in images]
+    pending = []
+    for idx, img_url in enumerate(images):
+        cached_text = ocr_cache_lookup(cache, img_url, model_id, inline_max_edge)
+        if cached_text is not None:
+            ocr_results[idx] = cached_text
+            ocr_timings[idx] = {"cached": True, "ttft_ms": 0, "total_ms": 0}
+        else:
+            pending.append((idx, img_url))
+    
+    def on_done(idx, ocr_text, timings):
+        ocr_results[idx] = ocr_text
+        ocr_timings[idx] = timings
+    
+    futures = [
+        ocr_pool.submit(extract_batch_with_fallback, pending[i:i + batch_size], client, model_id, cache,
+                        inline_max_edge, on_done, deadline=deadline, **local_options)
+        for i in range(0, len(pending), batch_size)
+    ]
+    _wait_for_deadline(futures, deadline)
+    # 截止后仍在运行的任务可能继续写入，返回副本
+    ocr_results, ocr_timings = list(ocr_results), [dict(timings) for timings in ocr_timings]
+    for idx, _ in pending:
+        if ocr_results[idx] is None:
+            ocr_timings[idx] = {}
+            ocr_results[idx] = mark_timed_out(ocr_timings[idx])
+    return ocr_results, ocr_timings
+
+
+# 批量处理
+def run_batch(urls, output_path, client, model_id, note_workers=4, ocr_workers=8,
+              cache=None, user_agent=DEFAULT_USER_AGENT, page_cache=None, inline_max_edge=None,
+              dedupe_images=False, batch_size=1, local_min_confidence=None, text_min_score=None,
+              decision_log=None, image_tier=None, deadline_seconds=None, note_index=None, metrics_path=None,
+              log=print):
+    """流水线批量处理：多篇笔记同时抓取，图片识别共享一个有界线程池，完成一篇写一行
+
+    提供 note_index 时把成功的笔记加入全文索引。
+    """
+    done = load_checkpoint(output_path)
+    pending = [url for url in urls if url not in done]
+    log(f"共 {len(urls)} 篇笔记，已完成 {len(urls) - len(pending)} 篇，待处理 {len(pending)} 篇")
+
+    completed = 0
+    failed = 0
+    duplicates_removed = 0
+    images_skipped = 0
+    images_timed_out = 0
+    usage = {"api_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    local_stats = {"local_attempts": 0, "local_accepted": 0, "local_escalated": 0, "local_ms": 0.0}
+    started_at = time.time()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=ocr_workers) as ocr_pool, \
+            ThreadPoolExecutor(max_workers=note_workers) as note_pool:
+        url_iter = iter(pending)
+        in_flight = {}
+
+        # 只保持有限数量的笔记在处理中，避免一次性提交上万个任务
+        def fill():
+            while len(in_flight) < note_workers * 2:
+                url = next(url_iter, None)
+                if url is None:
+                    return
+                future = note_pool.submit(process_note, url, client, model_id, ocr_pool, cache, user_agent,
+                                         page_cache, inline_max_edge, dedupe_images, batch_size,
+                                         local_min_confidence, text_min_score, decision_log, image_tier,
+                                         deadline_seconds)
+                in_flight[future] = url
+
+        fill()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                url = in_flight.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {"url": url, "note_id": extract_note_id(url), "error": f"处理错误: {str(e)}"}
+                record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+                completed += 1
+                METRICS.inc("xhs_notes_total", labels={"result": "error" if "error" in record else "ok"},
+                            help_text="处理的笔记数")
+                if metrics_path:
+                    METRICS.write(metrics_path)
+                if "error" in record:
+                    failed += 1
+                    log(f"[{completed}/{len(pending)}] 失败 {record['url']}: {record['error']}")
+                else:
+                    if note_index is not None:
+                        note_index.add_summary(record["note_id"], record["url"], record["summary"])
+                    duplicates_removed += record.get("duplicates_removed", 0)
+                    images_skipped += record.get("images_skipped", 0)
+                    images_timed_out += record.get("images_timed_out", 0)
+                    for field, value in record.get("usage", {}).items():
+                        usage[field] += value
+                    for field, value in record.get("local_ocr", {}).items():
+                        local_stats[field] += value
+                    log(f"[{completed}/{len(pending)}] 完成 {record['url']} ({len(record['images'])} 张图片)")
+            fill()
+
+    elapsed = time.time() - started_at
+    log(f"处理完成：{completed} 篇（失败 {failed} 篇），合并重复图片 {duplicates_removed} 张，"
+        f"跳过无文字图片 {images_skipped} 张，超时图片 {images_timed_out} 张，耗时 {elapsed:.1f} 秒")
+    log(f"调用模型 {usage['api_calls']} 次，输入 {usage['prompt_tokens']} tokens，输出 {usage['completion_tokens']} tokens")
+    if local_stats["local_attempts"]:
+        log(f"本地OCR采用 {local_stats['local_accepted']} 张，转交豆包 {local_stats['local_escalated']} 张"
+            f"（转交率 {local_stats['local_escalated'] / local_stats['local_attempts']:.0%}），"
+            f"本地识别累计 {local_stats['local_ms'] / 1000:.1f} 秒，节省 {local_stats['local_accepted']} 次模型调用")
+    limiter_stats = get_rate_limiter().stats()
+    log(f"被限流 {limiter_stats['throttled']} 次，结束时请求速率 {limiter_stats['rate']} 次/秒")
+    return completed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量提取小红书笔记图片中的文字，结果以JSONL格式输出")
+    parser.add_argument("url_file", help="链接文件，每行一个小红书链接")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="输出JSONL文件（同时作为断点记录）")
+    parser.add_argument("--api-key", default=os.environ.get("ARK_API_KEY"), help="豆包API Key，默认读取环境变量 ARK_API_KEY")
+    parser.add_argument("--model", default=os.environ.get("ARK_MODEL_ID"), help="豆包模型ID，默认读取环境变量 ARK_MODEL_ID")
+    parser.add_argument("--note-workers", type=int, default=4, help="同时抓取的笔记数量")
+    parser.add_argument("--ocr-workers", type=int, default=8, help="同时进行的图片识别请求数量")
+    parser.add_argument("--user-agent", default=DEFAULT_USER_AGENT, help="抓取页面使用的User-Agent")
+    parser.add_argument("--no-cache", action="store_true", help="不使用本地识别结果缓存")
+    parser.add_argument("--inline-max-edge", type=int, default=0,
+                        help="大于0时先在本地下载图片、缩小到该最长边后内联提交，0表示直接提交图片URL")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="大于1时每次请求合并识别多张图片，解析失败的图片自动改为单张识别")
+    parser.add_argument("--max-rps", type=float, default=20.0,
+                        help="豆包API请求速率上限（次/秒），被限流时自动降速，恢复后逐步提高到该值")
+    parser.add_argument("--no-text-filter", action="store_true", help="不跳过无文字图片（默认识别前预筛选）")
+    parser.add_argument("--text-filter-min-score", type=float, default=ocr_textfilter.TEXT_FILTER_MIN_SCORE,
+                        help="无文字判定阈值：缩略图中笔画密集的行所占比例低于该值时跳过识别")
+    parser.add_argument("--text-filter-log", default=ocr_textfilter.DEFAULT_DECISION_LOG_PATH,
+                        help="预筛选判定记录（JSONL），用于对照标注样本调整阈值")
+    parser.add_argument("--local-ocr", action="store_true",
+                        help="先用本地Tesseract识别，置信度不足的图片才调用豆包模型（需要安装pytesseract）")
+    parser.add_argument("--local-ocr-confidence", type=float, default=ocr_local.LOCAL_OCR_MIN_CONFIDENCE,
+                        help="本地OCR结果的最低平均置信度（0~100）")
+    parser.add_argument("--metrics-file", help="每完成一篇笔记就把累计指标以Prometheus文本格式写入该文件")
+    parser.add_argument("--metrics-port", type=int, help="在该端口提供Prometheus /metrics 接口")
+    parser.add_argument("--image-tier", choices=list(IMAGE_TIERS), default=DEFAULT_IMAGE_TIER,
+                        help="识别使用的图片规格，original 为页面原图，small 为CDN预览规格；改写后的图片不存在时自动改用原图")
+    parser.add_argument("--deadline", type=float, default=NOTE_DEADLINE_SECONDS,
+                        help="单篇笔记的处理时间上限（秒），超时的图片标记为 timeout，0 表示不限时")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="笔记全文索引位置（ocr_search.py 从这里搜索）")
+    parser.add_argument("--no-index", action="store_true", help="不把结果加入笔记全文索引")
+    parser.add_argument("--no-dedupe", action="store_true", help="不合并相似图片（默认按感知哈希合并重复图片）")
+    parser.add_argument("--page-cache-ttl", type=int, default=600, help="笔记页面缓存有效期（秒），同一笔记的不同链接只下载一次")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("请通过 --api-key 或环境变量 ARK_API_KEY 提供豆包API Key")
+    if not args.model:
+        parser.error("请通过 --model 或环境变量 ARK_MODEL_ID 提供豆包模型ID")
+    if args.local_ocr and not ocr_local.is_available():
+        parser.error("本地OCR不可用，请安装 pytesseract 和 Tesseract（含 chi_sim 语言包）")
+
+    urls = read_urls(args.url_file)
+    # 连接池大小与并发数匹配，避免线程等待空闲连接
+    configure_http_session(max_connections_per_host=max(args.note_workers, args.ocr_workers))
+    configure_rate_limiter(max_rate=args.max_rps)
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    client = create_doubao_client(args.api_key)
+    cache = None if args.no_cache else OCRCache()
+    page_cache = NotePageCache(ttl_seconds=args.page_cache_ttl)
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    try:
+        run_batch(urls, args.output, client, args.model,
+                  note_workers=args.note_workers, ocr_workers=args.ocr_workers,
+                  cache=cache, user_agent=args.user_agent, page_cache=page_cache,
+                  inline_max_edge=args.inline_max_edge or None, dedupe_images=not args.no_dedupe,
+                  batch_size=args.batch_size,
+                  local_min_confidence=args.local_ocr_confidence if args.local_ocr else None,
+                  text_min_score=None if args.no_text_filter else args.text_filter_min_score,
+                  decision_log=None if args.no_text_filter else ocr_textfilter.DecisionLog(args.text_filter_log),
+                  image_tier=args.image_tier, deadline_seconds=args.deadline or None,
+                  note_index=None if args.no_index else NoteIndex(args.index),
+                  metrics_path=args.metrics_file, log=log)
+    except KeyboardInterrupt:
+        log("已中断，重新运行相同命令即可从断点继续")
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
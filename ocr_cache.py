@@ -0,0 +1,202 @@
+import sqlite3
+import hashlib
+import threading
+import time
+import os
+from collections import OrderedDict
+
+from ocr_metrics import METRICS
+
+
+# 默认缓存文件位置
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ocr_cache.sqlite3")
+
+
+class OCRCache:
+    """基于SQLite的图片文字识别结果缓存，按最近使用时间(LRU)和有效期淘汰"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=5000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_access ON ocr_cache (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(image_id, model_id, prompt):
+        """由规范化的图片标识、模型ID和提示词生成缓存键"""
+        raw = "\x00".join([image_id or "", model_id or "", prompt or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期返回None"""
+        return self.get_first([key])
+
+    def get_first(self, keys):
+        """按顺序查找多个键，返回第一个命中的结果，全部未命中返回None（只计一次命中或未命中）"""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT text, created_at FROM ocr_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    continue
+
+                text, created_at = row
+                if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                    self._conn.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                    continue
+
+                self._conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                METRICS.inc("xhs_ocr_cache_total", labels={"result": "hit"}, help_text="图片识别缓存查询次数")
+                return text
+
+            self.misses += 1
+            METRICS.inc("xhs_ocr_cache_total", labels={"result": "miss"}, help_text="图片识别缓存查询次数")
+            return None
+
+    def contains_any(self, keys):
+        """是否有任一键存在未过期的记录（不计入命中统计，不更新使用时间）"""
+        keys = list(keys)
+        if not keys:
+            return False
+        min_created_at = time.time() - self.ttl_seconds if self.ttl_seconds else float("-inf")
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT 1 FROM ocr_cache WHERE key IN ({','.join('?' * len(keys))}) AND created_at >= ? LIMIT 1",
+                (*keys, min_created_at)
+            ).fetchone()
+        return row is not None
+
+    def set(self, key, text):
+        """写入缓存，并按条数上限淘汰最久未使用的记录"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, text, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """删除过期记录和超出条数上限的最久未使用记录"""
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM ocr_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            count = self._conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM ocr_cache WHERE key IN "
+                    "(SELECT key FROM ocr_cache ORDER BY last_access LIMIT ?)",
+                    (overflow,)
+                )
+
+    def size(self):
+        """当前缓存条数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+
+    def clear(self):
+        """清空缓存和命中统计"""
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+
+class NotePageCache:
+    """内存中的笔记页面解析结果缓存（带有效期），同时记录短链接跳转后的真实地址"""
+
+    def __init__(self, ttl_seconds=600, max_entries=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = OrderedDict()
+        self._short_links = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回 (缓存记录, 是否仍在有效期内)；没有缓存时返回 (None, False)
+
+        过期的记录仍会返回，其中的 etag / last_modified 可用于向服务器做条件请求。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = time.time() - entry["fetched_at"] < self.ttl_seconds
+            if fresh:
+                self.hits += 1
+            return entry, fresh
+
+    def set(self, key, content, etag=None, last_modified=None):
+        """保存一次完整下载并解析的结果"""
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = {
+                "content": content,
+                "fetched_at": time.time(),
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def revalidate(self, key):
+        """服务器返回304时刷新缓存时间"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["fetched_at"] = time.time()
+                self.revalidated += 1
+
+    def resolve_short_link(self, url):
+        """返回短链接之前跳转到的真实地址，没有记录时返回None"""
+        with self._lock:
+            return self._short_links.get(url)
+
+    def remember_short_link(self, url, resolved_url):
+        """记录短链接跳转后的真实地址"""
+        with self._lock:
+            self._short_links[url] = resolved_url
+
+    def size(self):
+        """当前缓存的页面数"""
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """清空页面缓存、短链接记录和统计"""
+        with self._lock:
+            self._entries.clear()
+            self._short_links.clear()
+            self.hits = 0
+            self.misses = 0
+            self.revalidated = 0
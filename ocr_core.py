@@ -0,0 +1,1745 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+import queue
+import time
+import re
+import json
+from html.parser import HTMLParser
+import openai
+from openai import OpenAI
+import codecs
+import copy
+import base64
+import random
+import io
+from urllib.parse import urlsplit, urlunsplit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ocr_cache import OCRCache
+from ocr_ratelimit import AdaptiveRateLimiter
+from ocr_metrics import METRICS
+import ocr_local
+import ocr_textfilter
+
+# 图片本地预处理依赖Pillow，未安装时只能使用URL方式提交
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# 默认User-Agent
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# 豆包API地址
+DOUBAO_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+
+# HTTP连接设置：连接超时和读取超时分开设置（秒）
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+# 每个域名保持的最大连接数，超出时请求排队等待空闲连接
+HTTP_MAX_CONNECTIONS_PER_HOST = 16
+
+# 可重试的HTTP状态码和重试次数
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_MAX_RETRIES = 3
+
+# 服务器要求的重试等待（Retry-After）最多等待的秒数
+HTTP_MAX_RETRY_AFTER = 10
+
+_http_session = None
+_http_session_lock = threading.RLock()
+
+# 当前线程正在发出的请求的截止时刻，重试等待不超过剩余时间（见 _http_request）
+_request_deadline = threading.local()
+
+class _BoundedRetry(Retry):
+    """Retry-After 最多等待 HTTP_MAX_RETRY_AFTER 秒；请求有截止时刻时，等待超过剩余时间就不再重试"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, HTTP_MAX_RETRY_AFTER)
+
+    def sleep(self, response=None):
+        deadline = getattr(_request_deadline, 'value', None)
+        if deadline is not None:
+            wait = self.get_retry_after(response) if self.respect_retry_after_header and response else None
+            if wait is None:
+                wait = self.get_backoff_time()
+            if wait >= remaining_seconds(deadline):
+                raise OCRDeadlineExceeded("超过单篇笔记时间上限")
+        super().sleep(response)
+
+# 创建共享HTTP会话
+def configure_http_session(max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST, max_retries=HTTP_MAX_RETRIES):
+    """创建进程内共享的HTTP会话：保持长连接、按域名限制连接数、对临时错误做带抖动的指数退避重试"""
+    global _http_session
+    retry_options = dict(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        retry = _BoundedRetry(backoff_jitter=0.5, **retry_options)
+    except TypeError:
+        # 旧版本urllib3不支持 backoff_jitter
+        retry = _BoundedRetry(**retry_options)
+
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=max_connections_per_host,
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    with _http_session_lock:
+        old_session = _http_session
+        _http_session = session
+    if old_session is not None:
+        old_session.close()
+    return session
+
+# 获取共享HTTP会话
+def get_http_session():
+    """获取进程内共享的HTTP会话，页面抓取和图片下载都通过它发出请求"""
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                return configure_http_session()
+    return _http_session
+
+# 豆包API限速设置：初始和最高请求速率（次/秒），被限流或临时错误时单张图片最多重试的次数
+OCR_INITIAL_RATE = 5.0
+OCR_MAX_RATE = 20.0
+OCR_MAX_RETRIES = 6
+
+# 限流错误的特征（HTTP 429 以及方舟平台的限流错误码）
+RATE_LIMIT_MARKERS = ("RateLimit", "TooManyRequests", "RequestBurstTooFast", "ServerOverloaded")
+
+_rate_limiter = None
+_rate_limiter_lock = threading.RLock()
+
+# 创建共享限速器
+def configure_rate_limiter(rate=OCR_INITIAL_RATE, max_rate=OCR_MAX_RATE):
+    """创建进程内共享的豆包API限速器，所有会话和线程的识别请求都经过它"""
+    global _rate_limiter
+    limiter = AdaptiveRateLimiter(rate=min(rate, max_rate), max_rate=max_rate)
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
+    return limiter
+
+# 获取共享限速器
+def get_rate_limiter():
+    """获取进程内共享的豆包API限速器"""
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                return configure_rate_limiter()
+    return _rate_limiter
+
+# 单篇笔记的默认处理时间上限（秒），超时后已完成的图片照常输出，其余图片标记为超时
+NOTE_DEADLINE_SECONDS = 120
+
+# 等待超时图片的识别线程自行结束的宽限时间（秒）
+DEADLINE_GRACE_SECONDS = 1.0
+
+# 超过时间上限的图片的识别结果
+OCR_TIMEOUT_TEXT = "识别超时"
+
+class OCRDeadlineExceeded(TimeoutError):
+    """笔记的处理时间已用完"""
+
+def make_deadline(seconds):
+    """把时间上限（秒）换算为截止时刻，None或0表示不限时"""
+    return time.monotonic() + seconds if seconds else None
+
+def remaining_seconds(deadline):
+    """距截止时刻的剩余秒数，不限时返回None"""
+    return None if deadline is None else deadline - time.monotonic()
+
+def _http_timeout(deadline):
+    """按剩余时间缩短HTTP连接和读取超时"""
+    remaining = remaining_seconds(deadline)
+    if remaining is None:
+        return HTTP_TIMEOUT
+    if remaining <= 0:
+        raise OCRDeadlineExceeded("超过单篇笔记时间上限")
+    return (min(HTTP_CONNECT_TIMEOUT, remaining), min(HTTP_READ_TIMEOUT, remaining))
+
+def _http_request(method, url, deadline=None, **kwargs):
+    """通过共享HTTP会话发出GET/HEAD请求；提供 deadline 时超时和重试等待都不超过剩余时间"""
+    previous = getattr(_request_deadline, 'value', None)
+    _request_deadline.value = deadline
+    try:
+        return getattr(get_http_session(), method)(url, timeout=_http_timeout(deadline), **kwargs)
+    except requests.ConnectionError as e:
+        # requests 会把重试等待中抛出的 OCRDeadlineExceeded 包装成 ConnectionError
+        if e.args and isinstance(e.args[0], OCRDeadlineExceeded):
+            raise e.args[0] from e
+        raise
+    finally:
+        _request_deadline.value = previous
+
+def mark_timed_out(timings=None):
+    """标记图片识别超时，返回超时的识别结果"""
+    METRICS.inc("xhs_ocr_timeouts_total", help_text="超过单篇笔记时间上限的图片数")
+    if timings is not None:
+        timings['timed_out'] = True
+    return OCR_TIMEOUT_TEXT
+
+# URL清理函数
+def clean_image_url(url):
+    """清理和解码图片URL"""
+    if not url:
+        return ""
+    
+    try:
+        # 移除URL前的@符号
+        url = url.lstrip('@').strip()
+        
+        # 处理Unicode转义字符
+        if '\\u' in url:
+            url = codecs.decode(url, 'unicode_escape')
+        
+        # 如果是JSON字符串，尝试解析
+        if url.startswith('{') and url.endswith('}'):
+            try:
+                json_obj = json.loads(url)
+                if 'urlDefault' in json_obj:
+                    url = json_obj['urlDefault']
+                elif 'url' in json_obj:
+                    url = json_obj['url']
+                # 再次处理转义字符
+                if '\\u' in url:
+                    url = codecs.decode(url, 'unicode_escape')
+            except:
+                pass
+        
+        # 确保URL是http开头
+        if url.startswith('//'):
+            url = 'http:' + url
+        elif not url.startswith(('http://', 'https://')):
+            url = 'http://' + url
+        
+        return url
+    except:
+        return url
+
+# 小红书图片CDN域名
+XHS_IMAGE_HOST_RE = re.compile(r'(?:^|\.)(?:xhscdn\.com|xiaohongshu\.com)$')
+
+# 图片URL的规范标识
+def canonical_image_key(url):
+    """同一张图片在不同CDN节点、协议、尺寸后缀和查询参数下得到相同的标识"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if XHS_IMAGE_HOST_RE.search(host):
+        # 形如 /202401011200/签名/1040g...!nd_dft_wlteh_webp_3，最后一段是图片文件ID
+        path = parts.path.split('!', 1)[0].rstrip('/')
+        file_id = path.rsplit('/', 1)[-1]
+        return 'xhs:' + (file_id if len(file_id) >= 16 else path)
+    if parts.query:
+        return f"{host}{parts.path}?{parts.query}"
+    return f"{host}{parts.path}"
+
+class ImageURLSet:
+    """按加入顺序保存图片URL，同一张图片的不同URL变体只保留一个"""
+
+    def __init__(self):
+        self._urls = {}
+
+    def add(self, url):
+        """加入一个已清理的图片URL，返回是否为新图片"""
+        key = canonical_image_key(url)
+        existing = self._urls.get(key)
+        if existing is None:
+            self._urls[key] = url
+            return True
+        # 已有的是缩略预览图时，换成默认尺寸的URL
+        if '!nd_prv' in existing and '!nd_prv' not in url:
+            self._urls[key] = url
+        return False
+
+    def __contains__(self, url):
+        return canonical_image_key(url) in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __iter__(self):
+        return iter(self._urls.values())
+
+    def to_list(self):
+        return list(self._urls.values())
+
+# 识别用的图片规格：名称 -> (CDN样式场景, imageView2最大宽度)，None表示使用页面中的原链接
+# 页面中的签名链接（!nd_dft_…）只能通过样式场景改变尺寸：dft 为页面原图，prv 为CDN预览规格；
+# 不带样式的链接用 imageView2 缩放到指定宽度并转为WebP
+IMAGE_TIERS = {
+    'original': None,
+    'small': ('prv', 720),
+}
+DEFAULT_IMAGE_TIER = 'small'
+
+# 页面原图使用的样式场景，识别结果缓存中不单独区分
+XHS_ORIGINAL_SCENE = 'dft'
+
+# CDN样式后缀，如 nd_dft_wlteh_webp_3：场景、水印标记、格式、版本
+XHS_IMAGE_STYLE_RE = re.compile(r'^nd_([a-z]+)_([a-z0-9]+)_([a-z0-9]+)_(\d+)$')
+
+# 支持 ?imageView2 缩放参数的图片域名
+XHS_IMAGE_VIEW_HOST_RE = re.compile(r'^(?:ci\.xiaohongshu\.com|sns-img-[a-z0-9]+\.xhscdn\.com)$')
+XHS_IMAGE_VIEW_WIDTH_RE = re.compile(r'imageView2/\d+/w/(\d+)')
+
+# 改写后的URL -> 页面中的原链接，改写的规格不存在时回退
+IMAGE_VARIANT_MEMO_SIZE = 4096
+_image_variant_originals = OrderedDict()
+# (图片标识, 规格) -> 改写后的图片是否存在，同一张图片换了CDN节点或签名也不再重复探测
+_image_variant_probes = OrderedDict()
+_image_variant_lock = threading.Lock()
+
+# 改写为指定规格的图片URL
+def image_variant_url(url, tier=DEFAULT_IMAGE_TIER):
+    """把小红书图片URL改写为指定规格，无法识别的URL原样返回"""
+    spec = IMAGE_TIERS.get(tier)
+    if not spec:
+        return url
+    scene, max_width = spec
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if not XHS_IMAGE_HOST_RE.search(host):
+        return url
+    
+    # 签名链接只能替换 ! 后面的样式，保留水印标记和版本
+    if '!' in parts.path:
+        path, style = parts.path.split('!', 1)
+        match = XHS_IMAGE_STYLE_RE.match(style)
+        if not match:
+            return url
+        style = f"nd_{scene}_{match.group(2)}_{match.group(3)}_{match.group(4)}"
+        return urlunsplit((parts.scheme, parts.netloc, f"{path}!{style}", parts.query, ''))
+    
+    # 不带样式的图片用 imageView2 缩放，已带处理参数的不再改写
+    if XHS_IMAGE_VIEW_HOST_RE.match(host) and not parts.query:
+        return urlunsplit((parts.scheme, parts.netloc, parts.path,
+                           f"imageView2/2/w/{max_width}/format/webp", ''))
+    return url
+
+def _image_scale_tag(url):
+    """URL本身表示的图片规格：样式场景或 imageView2 宽度，页面原图返回None"""
+    parts = urlsplit(url)
+    if '!' in parts.path:
+        match = XHS_IMAGE_STYLE_RE.match(parts.path.split('!', 1)[1])
+        if match and match.group(1) != XHS_ORIGINAL_SCENE:
+            return match.group(1)
+    match = XHS_IMAGE_VIEW_WIDTH_RE.search(parts.query)
+    return f"w{match.group(1)}" if match else None
+
+def image_variant_tag(url):
+    """实际识别的图片规格（改写后的图片不存在、已改用原链接时按原链接计算），用于区分识别结果缓存"""
+    original = original_image_url(url)
+    if original is not None and _variant_exists(url) is False:
+        url = original
+    return _image_scale_tag(url)
+
+def apply_image_tier(img_urls, tier=DEFAULT_IMAGE_TIER):
+    """把一组图片URL改写为指定规格，并记下原链接供回退使用"""
+    if not IMAGE_TIERS.get(tier):
+        return list(img_urls)
+    variants = []
+    for img_url in img_urls:
+        variant = image_variant_url(img_url, tier)
+        if variant != img_url:
+            with _image_variant_lock:
+                _image_variant_originals[variant] = img_url
+                _image_variant_originals.move_to_end(variant)
+                while len(_image_variant_originals) > IMAGE_VARIANT_MEMO_SIZE:
+                    _image_variant_originals.popitem(last=False)
+        variants.append(variant)
+    return variants
+
+def original_image_url(url):
+    """改写过规格的URL返回页面中的原链接，否则返回None"""
+    with _image_variant_lock:
+        return _image_variant_originals.get(url)
+
+def _variant_probe_key(url):
+    return canonical_image_key(url), _image_scale_tag(url)
+
+def _variant_exists(url):
+    """改写后的图片是否存在：True/False，还没有确认过时返回None"""
+    with _image_variant_lock:
+        return _image_variant_probes.get(_variant_probe_key(url))
+
+def _remember_variant(url, exists):
+    key = _variant_probe_key(url)
+    with _image_variant_lock:
+        if _image_variant_probes.get(key) == exists:
+            return
+        _image_variant_probes[key] = exists
+        _image_variant_probes.move_to_end(key)
+        while len(_image_variant_probes) > IMAGE_VARIANT_MEMO_SIZE:
+            _image_variant_probes.popitem(last=False)
+    if not exists:
+        METRICS.inc("xhs_image_variant_fallback_total", help_text="改写规格后图片不存在、改用原链接的次数")
+
+# 提交给模型的图片URL
+def resolve_image_url(img_url, deadline=None):
+    """改写过规格的URL先用HEAD请求确认存在，不存在时返回原链接（模型下载失败会导致整次请求报错）
+
+    探测结果按图片标识和规格记住，同一张图片只探测一次。
+    """
+    original = original_image_url(img_url)
+    if original is None:
+        return img_url
+    exists = _variant_exists(img_url)
+    if exists is not None:
+        return img_url if exists else original
+    try:
+        response = _http_request('head', img_url, deadline, headers=IMAGE_REQUEST_HEADERS, allow_redirects=True)
+        response.close()
+    except (requests.RequestException, OCRDeadlineExceeded):
+        return img_url
+    exists = response.status_code not in (403, 404, 410)
+    _remember_variant(img_url, exists)
+    return img_url if exists else original
+
+# OCR提示词
+OCR_PROMPT = "请识别并提取这张图片中的所有文字内容，包括中文、英文、数字等。请按照图片中文字的布局顺序，逐行返回识别的文字，保持原有的换行结构。如果没有文字就返回'无文字'。"
+
+# 多图合并识别的提示词：按图片序号用标签分隔每张图片的识别结果
+BATCH_OCR_PROMPT = (
+    "上面依次给出了{count}张图片。请分别识别并提取每张图片中的所有文字内容，包括中文、英文、数字等，"
+    "按照图片中文字的布局顺序逐行返回，保持原有的换行结构。"
+    "严格按以下格式输出，每张图片的结果放在对应序号的标签内，不要输出其他内容：\n"
+    "<image_1>\n第1张图片的文字\n</image_1>\n<image_2>\n第2张图片的文字\n</image_2>\n……\n"
+    "某张图片没有文字时，该标签内只写'无文字'。"
+)
+BATCH_RESULT_RE = re.compile(r'<image_(\d+)>(.*?)</image_\1>', re.S)
+
+# 每次合并识别的默认图片数
+OCR_BATCH_SIZE = 4
+
+# 创建豆包客户端
+def create_doubao_client(api_key, base_url=DOUBAO_BASE_URL):
+    """创建豆包视觉大模型客户端（OpenAI兼容接口）
+
+    关闭SDK自带的重试，由 create_chat_completion 统一处理限流和临时错误，限速器才能感知到限流。
+    """
+    return OpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=0,
+    )
+
+# 判断是否为限流错误
+def is_rate_limit_error(error):
+    """HTTP 429 或错误信息中带有限流错误码"""
+    if isinstance(error, openai.RateLimitError) or getattr(error, 'status_code', None) == 429:
+        return True
+    message = str(error)
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+# 读取服务器要求的等待时间
+def _retry_after_seconds(error):
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return min(float(value), 60.0) if value else None
+    except ValueError:
+        return None
+
+# 经过限速器调用豆包API
+def create_chat_completion(client, timings=None, deadline=None, **kwargs):
+    """所有识别请求都经过进程内共享的限速器；被限流或遇到临时错误时等待后重试，而不是直接返回失败
+
+    提供 timings 字典时把重试次数累加到 retries。提供 deadline（截止时刻，见 make_deadline）时
+    每次调用的超时取剩余时间，等待和重试都不超过截止时刻，到时抛出 OCRDeadlineExceeded。
+    """
+    limiter = get_rate_limiter()
+    for attempt in range(OCR_MAX_RETRIES + 1):
+        remaining = remaining_seconds(deadline)
+        if remaining is not None:
+            if remaining <= 0 or not limiter.acquire(timeout=remaining):
+                raise OCRDeadlineExceeded("超过单篇笔记时间上限")
+            kwargs['timeout'] = max(remaining_seconds(deadline), 0.1)
+        else:
+            limiter.acquire()
+        try:
+            response = client.chat.completions.create(**kwargs)
+        except Exception as e:
+            if deadline is not None and remaining_seconds(deadline) <= 0:
+                raise OCRDeadlineExceeded("超过单篇笔记时间上限") from e
+            throttled = is_rate_limit_error(e)
+            if attempt == OCR_MAX_RETRIES or not (
+                    throttled or isinstance(e, (openai.APIConnectionError, openai.InternalServerError))):
+                METRICS.inc("xhs_ocr_failures_total", help_text="豆包API调用最终失败次数")
+                raise
+            METRICS.inc("xhs_ocr_retries_total", labels={"reason": "throttled" if throttled else "transient"},
+                        help_text="豆包API调用重试次数")
+            if throttled:
+                limiter.on_throttle(_retry_after_seconds(e))
+            else:
+                delay = min(0.5 * 2 ** attempt, 8) * (0.5 + random.random())
+                if deadline is not None:
+                    delay = min(delay, max(remaining_seconds(deadline), 0))
+                time.sleep(delay)
+            if timings is not None:
+                timings['retries'] = timings.get('retries', 0) + 1
+            continue
+        limiter.on_success()
+        return response
+
+# 提取小红书ID的函数
+def extract_note_id(url):
+    """从小红书链接中提取笔记ID"""
+    patterns = [
+        r'explore/([a-f0-9]+)',
+        r'discovery/item/([a-f0-9]+)',
+        r'/([a-f0-9]{24})',
+    ]
+    
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+# 记录调用次数和token用量
+def _record_usage(timings, usage):
+    """把一次API调用的次数和token用量累加到timings中"""
+    if usage is not None:
+        for kind in ('prompt', 'completion'):
+            METRICS.inc("xhs_ocr_tokens_total", getattr(usage, f'{kind}_tokens', 0) or 0, labels={"kind": kind},
+                        help_text="豆包API消耗的token数")
+    if timings is None:
+        return
+    timings['api_calls'] = timings.get('api_calls', 0) + 1
+    if usage is not None:
+        timings['prompt_tokens'] = timings.get('prompt_tokens', 0) + (getattr(usage, 'prompt_tokens', 0) or 0)
+        timings['completion_tokens'] = timings.get('completion_tokens', 0) + (getattr(usage, 'completion_tokens', 0) or 0)
+
+# 使用豆包API识别图片文字
+def extract_text_from_image_doubao(img_url, client, model_id, on_delta=None, timings=None, deadline=None):
+    """使用豆包视觉大模型从图片中提取文字
+
+    提供 on_delta 时以流式方式调用，每收到一段文字就调用 on_delta(新增文字)；
+    提供 timings 字典时写入 ttft_ms（首字耗时）、total_ms（总耗时）、api_calls 和token用量。
+    超过 deadline 时中断请求并返回 OCR_TIMEOUT_TEXT（timings 中 timed_out 为 True）。
+    """
+    if client is None:
+        return "豆包客户端未初始化"
+    
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": img_url
+                    },
+                },
+                {
+                    "type": "text", 
+                    "text": OCR_PROMPT
+                },
+            ],
+        }
+    ]
+    
+    started = time.perf_counter()
+    try:
+        if on_delta is None:
+            response = create_chat_completion(
+                client, timings, deadline,
+                model=model_id,
+                messages=messages,
+            )
+            _record_usage(timings, getattr(response, 'usage', None))
+            if not (response.choices and response.choices[0].message):
+                return "API响应为空"
+            text_content = (response.choices[0].message.content or "").strip()
+            if timings is not None:
+                timings['ttft_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        else:
+            response = create_chat_completion(
+                client, timings, deadline,
+                model=model_id,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            parts = []
+            usage = None
+            for chunk in response:
+                # 读取超时只限制两个数据块之间的间隔，逐块检查截止时刻
+                if deadline is not None and time.monotonic() >= deadline:
+                    response.close()
+                    raise OCRDeadlineExceeded("超过单篇笔记时间上限")
+                # 最后一个数据块只携带token用量
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts and timings is not None:
+                        timings['ttft_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(delta)
+                    on_delta(delta)
+            _record_usage(timings, usage)
+            if not parts:
+                return "API响应为空"
+            text_content = "".join(parts).strip()
+        
+        return text_content if text_content and text_content != "无文字" else "未识别到文字"
+            
+    except Exception as e:
+        if isinstance(e, OCRDeadlineExceeded) or (deadline is not None and time.monotonic() >= deadline):
+            return mark_timed_out(timings)
+        return f"豆包API调用错误: {str(e)}"
+    finally:
+        elapsed = time.perf_counter() - started
+        mode = "stream" if on_delta is not None else "single"
+        METRICS.observe("xhs_ocr_request_seconds", elapsed, labels={"mode": mode},
+                        help_text="单次图片识别请求耗时（含限流等待和重试）")
+        if timings is not None:
+            timings['streamed'] = on_delta is not None
+            timings['total_ms'] = round(elapsed * 1000, 1)
+            if 'ttft_ms' in timings:
+                METRICS.observe("xhs_ocr_ttft_seconds", timings['ttft_ms'] / 1000, labels={"mode": mode},
+                                help_text="图片识别首字耗时")
+
+# 图片下载设置
+IMAGE_MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+IMAGE_REQUEST_HEADERS = {
+    'User-Agent': DEFAULT_USER_AGENT,
+    'Referer': 'https://www.xiaohongshu.com/',
+    'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+}
+
+# 内联提交的默认参数：最长边像素和JPEG质量
+INLINE_IMAGE_MAX_EDGE = 1600
+INLINE_IMAGE_QUALITY = 85
+
+# 下载图片
+def download_image(img_url, deadline=None):
+    """通过共享HTTP会话下载图片，返回图片字节；改写规格后的图片不存在时改为下载原链接
+
+    提供 deadline（截止时刻）时连接和读取超时不超过剩余时间，到时抛出 OCRDeadlineExceeded。
+    """
+    original = original_image_url(img_url)
+    if original is not None:
+        if _variant_exists(img_url) is False:
+            return _download(original, deadline)
+        try:
+            image_bytes = _download(img_url, deadline)
+        except requests.HTTPError as exc:
+            if exc.response is None or exc.response.status_code not in (403, 404, 410):
+                raise
+            _remember_variant(img_url, False)
+            return _download(original, deadline)
+        _remember_variant(img_url, True)
+        return image_bytes
+    return _download(img_url, deadline)
+
+def _download(img_url, deadline=None):
+    response = _http_request('get', img_url, deadline, headers=IMAGE_REQUEST_HEADERS, stream=True)
+    try:
+        response.raise_for_status()
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(64 * 1024):
+            # 读取超时只限制每一段的等待时间，慢速传输时按截止时刻中断
+            if deadline is not None and remaining_seconds(deadline) <= 0:
+                raise OCRDeadlineExceeded("超过单篇笔记时间上限")
+            size += len(chunk)
+            if size > IMAGE_MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"图片超过 {IMAGE_MAX_DOWNLOAD_BYTES // (1024 * 1024)}MB")
+            chunks.append(chunk)
+        return b''.join(chunks)
+    finally:
+        response.close()
+
+# 缩小并重新编码图片
+def encode_inline_image(image_bytes, max_edge=INLINE_IMAGE_MAX_EDGE, quality=INLINE_IMAGE_QUALITY):
+    """把图片缩小到最长边不超过max_edge并编码为JPEG，返回data URL"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('RGB', (max_edge, max_edge))  # JPEG可在解码时直接缩小，减少内存和耗时
+    
+    # 转换为RGB模式（透明背景填充为白色）
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+# 准备内联图片
+def prepare_inline_image(img_url, max_edge=INLINE_IMAGE_MAX_EDGE, quality=INLINE_IMAGE_QUALITY, deadline=None):
+    """下载并压缩图片，返回data URL；Pillow不可用或处理失败（含超过 deadline）时返回原URL，由模型自行下载"""
+    if Image is None:
+        return img_url
+    try:
+        return encode_inline_image(download_image(img_url, deadline), max_edge, quality)
+    except Exception:
+        return img_url
+
+# 相似图片判定：16x16差值哈希(dHash，256位)的汉明距离不超过该值视为同一张图片
+# 8x8哈希对排版相同、文字不同的文字卡片区分度不够，容易把不同图片误合并
+IMAGE_HASH_SIZE = 16
+IMAGE_HASH_MAX_DISTANCE = 12
+
+# 计算图片感知哈希
+def compute_image_hash(image_bytes, hash_size=IMAGE_HASH_SIZE):
+    """在灰度缩略图上计算差值哈希，尺寸、压缩格式不同的同一张图片得到相近的哈希值"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+# 下载图片并计算感知哈希
+def _download_and_hash(img_url, deadline=None):
+    """返回 (图片字节, 感知哈希)，下载失败时均为None，无法解码时哈希为None"""
+    try:
+        image_bytes = download_image(img_url, deadline)
+    except Exception:
+        return None, None
+    try:
+        return image_bytes, compute_image_hash(image_bytes)
+    except Exception:
+        return image_bytes, None
+
+# 合并相似图片
+def dedupe_similar_images(img_urls, max_distance=IMAGE_HASH_MAX_DISTANCE, max_workers=8, deadline=None,
+                          downloads=None, skip=()):
+    """并发下载图片计算感知哈希，合并几乎相同的图片
+
+    返回 (保留的图片URL列表, {被合并的图片URL: 保留的图片URL})；
+    无法下载或解码的图片一律保留，Pillow不可用时不做合并。
+    提供 deadline 时下载不超过剩余时间，已超时则不做合并（剩余时间留给识别前的超时处理）。
+    提供 downloads 字典时把保留图片的字节存入其中 {图片URL: 图片字节}，
+    识别前的预筛选、本地OCR和内联提交可直接使用，不再重复下载。
+    skip 中的图片（如已有缓存识别结果的图片）不下载、不参与比对，原样保留。
+    """
+    candidates = [img_url for img_url in img_urls if img_url not in skip]
+    if Image is None or len(candidates) < 2:
+        return list(img_urls), {}
+    if deadline is not None and remaining_seconds(deadline) <= 0:
+        return list(img_urls), {}
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidates)))) as executor:
+        results = dict(zip(candidates, executor.map(lambda img_url: _download_and_hash(img_url, deadline),
+                                                    candidates)))
+    
+    kept = []
+    kept_hashes = []
+    duplicates = {}
+    for img_url in img_urls:
+        image_bytes, image_hash = results.get(img_url, (None, None))
+        if image_bytes is not None and downloads is not None:
+            downloads[img_url] = image_bytes
+        if image_hash is not None:
+            match = next((kept_url for kept_url, kept_hash in kept_hashes
+                          if bin(image_hash ^ kept_hash).count('1') <= max_distance), None)
+            if match is not None:
+                duplicates[img_url] = match
+                if downloads is not None:
+                    downloads.pop(img_url, None)
+                continue
+            kept_hashes.append((img_url, image_hash))
+        kept.append(img_url)
+    
+    METRICS.observe("xhs_dedupe_seconds", time.perf_counter() - started, help_text="相似图片比对耗时")
+    METRICS.inc("xhs_images_deduped_total", len(duplicates), help_text="合并掉的重复图片数")
+    return kept, duplicates
+
+# 识别结果的缓存键
+def ocr_cache_key(img_url, model_id, inline_max_edge=None):
+    """同一张图片（不论CDN域名和签名）、同一规格、模型和提交方式共用一条缓存
+
+    规格不同的识别结果分开缓存：小图识别不清时换用原图，不会命中小图的结果。
+    规格按实际识别的图片计算（见 image_variant_tag），写入缓存应在提交图片（确认规格是否存在）之后。
+    """
+    return _ocr_cache_key(img_url, image_variant_tag(img_url), model_id, inline_max_edge)
+
+def _ocr_cache_key(img_url, variant, model_id, inline_max_edge=None):
+    image_id = canonical_image_key(clean_image_url(img_url))
+    if variant:
+        image_id = f"{image_id}~{variant}"
+    if inline_max_edge:
+        image_id = f"{image_id}@{inline_max_edge}"
+    return OCRCache.make_key(image_id, model_id, OCR_PROMPT)
+
+# 查找缓存的识别结果
+def ocr_cache_lookup(cache, img_url, model_id, inline_max_edge=None):
+    """读取图片的缓存识别结果，不发网络请求，未命中返回None
+
+    还不知道改写后的图片是否存在时（如进程重启后），先查该规格的结果，再查原图的结果：
+    规格不存在时识别的是原图，结果按原图的键保存。
+    """
+    if cache is None:
+        return None
+    return cache.get_first(_ocr_cache_keys(img_url, model_id, inline_max_edge))
+
+def ocr_cache_contains(cache, img_url, model_id, inline_max_edge=None):
+    """图片是否已有缓存的识别结果（不计入命中统计），用于跳过识别前的下载"""
+    return cache is not None and cache.contains_any(_ocr_cache_keys(img_url, model_id, inline_max_edge))
+
+def _ocr_cache_keys(img_url, model_id, inline_max_edge=None):
+    variants = [image_variant_tag(img_url)]
+    original = original_image_url(img_url)
+    if variants[0] and original is not None and _variant_exists(img_url) is None:
+        variants.append(_image_scale_tag(original))
+    return [_ocr_cache_key(img_url, variant, model_id, inline_max_edge) for variant in variants]
+
+# 本地OCR识别
+def try_local_ocr(img_url, min_confidence, timings=None, image_bytes=None, deadline=None):
+    """下载图片（已提供 image_bytes 时直接使用）先用本地OCR识别，返回 (识别文字, 图片字节)
+
+    置信度低于 min_confidence 或没有识别到文字时识别文字为None，由调用方转交豆包模型；
+    下载的图片字节可用于内联提交，避免重复下载。本地OCR不可用时返回 (None, None)。
+    提供 timings 字典时写入 engine（local/doubao）、local_ms 和 local_confidence。
+    """
+    if not ocr_local.is_available():
+        return None, image_bytes
+    
+    started = time.perf_counter()
+    try:
+        if image_bytes is None:
+            image_bytes = download_image(img_url, deadline)
+        text, confidence = ocr_local.recognize(image_bytes)
+    except Exception:
+        text, confidence = "", 0.0
+    elapsed = time.perf_counter() - started
+    accepted = bool(text) and confidence >= min_confidence
+    
+    METRICS.observe("xhs_local_ocr_seconds", elapsed, help_text="本地OCR识别耗时（含图片下载）")
+    METRICS.inc("xhs_local_ocr_total", labels={"result": "accepted" if accepted else "escalated"},
+                help_text="本地OCR识别结果采用或转交豆包的次数")
+    if timings is not None:
+        timings.update(
+            engine='local' if accepted else 'doubao',
+            local_ms=round(elapsed * 1000, 1),
+            local_confidence=round(confidence, 1),
+        )
+    return (text if accepted else None), image_bytes
+
+# 无文字图片预筛选
+def check_text_presence(img_url, min_score, timings=None, image_bytes=None, decision_log=None, deadline=None):
+    """在缩略图上判断图片是否可能包含文字，返回 (是否可能有文字, 图片字节)
+
+    无法下载或解码时一律判定为可能有文字，交给后续识别。判定为无文字的图片记录到 decision_log；
+    其余图片的特征写入 timings，识别完成后由 record_text_filter_outcome 连同识别结果一起记录。
+    """
+    started = time.perf_counter()
+    try:
+        if image_bytes is None:
+            image_bytes = download_image(img_url, deadline)
+        features = ocr_textfilter.text_presence_score(image_bytes)
+    except Exception:
+        return True, image_bytes
+    has_text = features['score'] >= min_score
+    
+    METRICS.observe("xhs_text_filter_seconds", time.perf_counter() - started, help_text="无文字图片预筛选耗时")
+    METRICS.inc("xhs_text_filter_total", labels={"result": "text" if has_text else "skipped"},
+                help_text="无文字图片预筛选的判定次数")
+    if timings is not None:
+        timings.update(text_score=features['score'], text_edge_density=features['edge_density'])
+        if not has_text:
+            timings.update(skipped=True, ttft_ms=0, total_ms=round((time.perf_counter() - started) * 1000, 1))
+    if not has_text and decision_log is not None:
+        decision_log.record(img_url, features, min_score, False)
+    return has_text, image_bytes
+
+# 记录预筛选判定和识别结果
+def record_text_filter_outcome(img_url, timings, ocr_text, min_score, decision_log=None):
+    """预筛选判定为有文字的图片识别完成后，记录识别是否真的找到了文字，用于统计误判"""
+    if decision_log is None or not timings or 'text_score' not in timings or timings.get('skipped'):
+        return
+    features = {"score": timings['text_score'], "edge_density": timings['text_edge_density']}
+    decision_log.record(img_url, features, min_score, True, is_valid_ocr_text(ocr_text))
+
+# 识别前的本地处理
+def run_local_checks(img_url, timings=None, text_min_score=None, local_min_confidence=None, decision_log=None,
+                     deadline=None, image_bytes=None):
+    """依次进行无文字预筛选和本地OCR，两者共用一次图片下载，返回 (识别结果, 图片字节)
+
+    识别结果不为None时（判定无文字或本地OCR置信度足够）不需要再调用豆包模型。
+    已提供 image_bytes（如合并重复图片时下载的字节）时不再下载。
+    图片下载不超过 deadline 的剩余时间，下载失败或超时时交给豆包模型（由其按截止时刻处理）。
+    """
+    if text_min_score is not None and ocr_textfilter.Image is not None:
+        has_text, image_bytes = check_text_presence(img_url, text_min_score, timings, image_bytes, decision_log,
+                                                    deadline)
+        if not has_text:
+            return "未识别到文字", image_bytes
+    
+    if local_min_confidence is not None:
+        local_text, image_bytes = try_local_ocr(img_url, local_min_confidence, timings, image_bytes, deadline)
+        if local_text is not None:
+            if timings is not None:
+                timings.update(ttft_ms=timings['local_ms'], total_ms=timings['local_ms'])
+            return local_text, image_bytes
+    return None, image_bytes
+
+# 准备提交给模型的图片
+def _submit_url(img_url, inline_max_edge=None, image_bytes=None, deadline=None):
+    """内联提交时优先使用已下载的图片字节"""
+    if not inline_max_edge:
+        return resolve_image_url(img_url, deadline)
+    if image_bytes is not None and Image is not None:
+        try:
+            return encode_inline_image(image_bytes, inline_max_edge)
+        except Exception:
+            pass
+    return prepare_inline_image(img_url, inline_max_edge, deadline=deadline)
+
+# 带缓存的图片文字识别
+def extract_text_with_cache(img_url, client, model_id, cache=None, inline_max_edge=None,
+                            on_delta=None, timings=None, local_min_confidence=None, text_min_score=None,
+                            decision_log=None, deadline=None, image_bytes=None):
+    """先查本地缓存，未命中时调用豆包API并缓存成功的识别结果
+
+    inline_max_edge 不为空时，先在本地下载并缩小图片，再以data URL内联提交给模型。
+    on_delta、timings 传给 extract_text_from_image_doubao；命中缓存时 timings 中 cached 为 True。
+    local_min_confidence 不为空且本地OCR可用时，先用本地OCR识别，置信度足够就不再调用豆包模型
+    （本地识别结果不写入缓存，缓存只保存豆包模型的结果）。
+    text_min_score 不为空时先在缩略图上预筛选，判定为无文字的图片直接返回“未识别到文字”，
+    判定结果写入 decision_log。
+    deadline 为整篇笔记的截止时刻，开始识别时已超时的图片直接返回 OCR_TIMEOUT_TEXT。
+    image_bytes 为已下载的图片字节（见 dedupe_similar_images 的 downloads），预筛选和内联提交直接使用。
+    """
+    if timings is None:
+        timings = {}
+    cached_text = ocr_cache_lookup(cache, img_url, model_id, inline_max_edge)
+    if cached_text is not None:
+        timings.update(cached=True, ttft_ms=0, total_ms=0)
+        return cached_text
+    if deadline is not None and remaining_seconds(deadline) <= 0:
+        return mark_timed_out(timings)
+    
+    local_text, image_bytes = run_local_checks(img_url, timings, text_min_score, local_min_confidence, decision_log,
+                                               deadline, image_bytes)
+    if local_text is not None:
+        return local_text
+    
+    submit_url = _submit_url(img_url, inline_max_edge, image_bytes, deadline)
+    ocr_text = extract_text_from_image_doubao(submit_url, client, model_id, on_delta, timings, deadline)
+    record_text_filter_outcome(img_url, timings, ocr_text, text_min_score, decision_log)
+    if cache is not None and not is_ocr_error(ocr_text):
+        # 提交时已确认改写后的图片是否存在，按实际识别的规格保存
+        cache.set(ocr_cache_key(img_url, model_id, inline_max_edge), ocr_text)
+    return ocr_text
+
+# 解析多图合并识别的结果
+def parse_batch_ocr_response(text, count):
+    """按 <image_N> 标签拆分模型输出，返回长度为count的列表，缺失或格式错误的位置为None"""
+    results = [None] * count
+    for match in BATCH_RESULT_RE.finditer(text or ""):
+        position = int(match.group(1)) - 1
+        if 0 <= position < count and results[position] is None:
+            image_text = match.group(2).strip()
+            results[position] = image_text if image_text and image_text != "无文字" else "未识别到文字"
+    return results
+
+# 一次请求识别多张图片
+def extract_texts_in_one_call(img_urls, client, model_id, timings=None, deadline=None):
+    """把多张图片放进同一条消息识别，返回与img_urls等长的结果列表
+
+    无法从输出中解析出的图片（调用失败时为全部图片）对应位置为None，由调用方改为单张识别。
+    提供 timings 字典时写入 total_ms、api_calls 和token用量。
+    """
+    if client is None or not img_urls:
+        return [None] * len(img_urls)
+    
+    content = []
+    for position, img_url in enumerate(img_urls, 1):
+        content.append({"type": "text", "text": f"图片{position}："})
+        content.append({"type": "image_url", "image_url": {"url": img_url}})
+    content.append({"type": "text", "text": BATCH_OCR_PROMPT.format(count=len(img_urls))})
+    
+    started = time.perf_counter()
+    try:
+        response = create_chat_completion(
+            client, timings, deadline,
+            model=model_id,
+            messages=[{"role": "user", "content": content}],
+        )
+        _record_usage(timings, getattr(response, 'usage', None))
+        if not (response.choices and response.choices[0].message):
+            return [None] * len(img_urls)
+        return parse_batch_ocr_response(response.choices[0].message.content, len(img_urls))
+    except Exception:
+        return [None] * len(img_urls)
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe("xhs_ocr_request_seconds", elapsed, labels={"mode": "batch"},
+                        help_text="单次图片识别请求耗时（含限流等待和重试）")
+        if timings is not None:
+            timings['total_ms'] = round(elapsed * 1000, 1)
+
+# 合并识别一组图片
+def extract_batch_with_fallback(batch, client, model_id, cache=None, inline_max_edge=None, on_done=None,
+                                text_min_score=None, local_min_confidence=None, decision_log=None, deadline=None,
+                                downloads=None):
+    """合并识别 [(序号, 图片URL), ...]，解析失败的图片退回单张识别
+
+    每张图片完成时调用 on_done(序号, 识别结果, 耗时统计)。合并请求的调用次数和token用量
+    只记在该组第一张图片上，逐张汇总时不会重复计算。
+    text_min_score、local_min_confidence 不为空时先逐张预筛选和本地识别（见 run_local_checks），
+    只有仍需豆包模型识别的图片放进合并请求。超过 deadline 时未完成的图片返回 OCR_TIMEOUT_TEXT。
+    downloads 为已下载的图片字节 {图片URL: 图片字节}，用过的图片从中移除。
+    """
+    if deadline is not None and remaining_seconds(deadline) <= 0:
+        for idx, _ in batch:
+            timings = {}
+            ocr_text = mark_timed_out(timings)
+            if on_done is not None:
+                on_done(idx, ocr_text, timings)
+        return
+    
+    local_timings = {}
+    image_bytes = {idx: downloads.pop(img_url, None) for idx, img_url in batch} if downloads is not None else {}
+    if text_min_score is not None or local_min_confidence is not None:
+        remaining = []
+        for idx, img_url in batch:
+            timings = local_timings[idx] = {}
+            local_text, image_bytes[idx] = run_local_checks(img_url, timings, text_min_score,
+                                                            local_min_confidence, decision_log, deadline,
+                                                            image_bytes.get(idx))
+            if local_text is not None:
+                if on_done is not None:
+                    on_done(idx, local_text, timings)
+            else:
+                remaining.append((idx, img_url))
+        batch = remaining
+        if not batch:
+            return
+    
+    # 只剩一张图片时直接单张识别
+    if len(batch) == 1:
+        idx, img_url = batch[0]
+        timings = local_timings.get(idx, {})
+        ocr_text = extract_text_from_image_doubao(
+            _submit_url(img_url, inline_max_edge, image_bytes.get(idx), deadline),
+            client, model_id, timings=timings, deadline=deadline)
+        record_text_filter_outcome(img_url, timings, ocr_text, text_min_score, decision_log)
+        if cache is not None and not is_ocr_error(ocr_text):
+            cache.set(ocr_cache_key(img_url, model_id, inline_max_edge), ocr_text)
+        if on_done is not None:
+            on_done(idx, ocr_text, timings)
+        return
+    
+    submit_urls = [_submit_url(img_url, inline_max_edge, image_bytes.get(idx), deadline) for idx, img_url in batch]
+    batch_timings = {}
+    texts = extract_texts_in_one_call(submit_urls, client, model_id, batch_timings, deadline)
+    batch_ms = batch_timings.get('total_ms', 0)
+    
+    for position, ((idx, img_url), submit_url, ocr_text) in enumerate(zip(batch, submit_urls, texts)):
+        timings = dict(local_timings.get(idx, {}), batched=len(batch), api_calls=0)
+        if position == 0:
+            for field in ('api_calls', 'prompt_tokens', 'completion_tokens'):
+                if field in batch_timings:
+                    timings[field] = batch_timings[field]
+        
+        if ocr_text is None:
+            single_timings = {}
+            ocr_text = extract_text_from_image_doubao(submit_url, client, model_id, timings=single_timings,
+                                                      deadline=deadline)
+            for field in ('api_calls', 'prompt_tokens', 'completion_tokens'):
+                if field in single_timings:
+                    timings[field] = timings.get(field, 0) + single_timings[field]
+            if single_timings.get('timed_out'):
+                timings['timed_out'] = True
+            timings.update(
+                ttft_ms=round(batch_ms + single_timings.get('ttft_ms', single_timings['total_ms']), 1),
+                total_ms=round(batch_ms + single_timings['total_ms'], 1),
+                batch_fallback=True,
+            )
+        else:
+            timings.update(ttft_ms=batch_ms, total_ms=batch_ms)
+        record_text_filter_outcome(img_url, timings, ocr_text, text_min_score, decision_log)
+        
+        if cache is not None and not is_ocr_error(ocr_text):
+            cache.set(ocr_cache_key(img_url, model_id, inline_max_edge), ocr_text)
+        if on_done is not None:
+            on_done(idx, ocr_text, timings)
+
+# 并发识别多张图片
+def extract_texts_concurrently(img_urls, client, model_id, max_workers=4, cache=None, stream=False,
+                               batch_size=1, deadline=None, downloads=None, **ocr_options):
+    """并发识别多张图片的文字，在调用方线程中逐个返回识别事件
+
+    事件为 ("delta", 图片序号, 新增文字)（仅 stream=True 时）或
+    ("done", 图片序号, (识别结果, 耗时统计))，每张图片恰好有一个 done 事件。
+    ocr_options 原样传给 extract_text_with_cache，例如 inline_max_edge。
+    batch_size 大于1时，未命中缓存的图片每 batch_size 张合并为一次请求（此时不使用流式输出）。
+    提供 deadline（截止时刻）时，每次调用的超时取剩余时间；到时取消还在排队的图片，
+    未完成的图片以 OCR_TIMEOUT_TEXT 结束（timings 中 timed_out 为 True）。
+    downloads 为合并重复图片时已下载的图片字节 {图片URL: 图片字节}，识别时直接使用，用过后移除。
+    """
+    if not img_urls:
+        return
+    
+    if batch_size > 1:
+        yield from _extract_texts_batched(img_urls, client, model_id, max_workers, cache, batch_size,
+                                          deadline=deadline, downloads=downloads, **ocr_options)
+        return
+    
+    events = queue.Queue()
+    
+    def run(idx, img_url):
+        timings = {}
+        on_delta = (lambda text: events.put(("delta", idx, text))) if stream else None
+        image_bytes = downloads.pop(img_url, None) if downloads is not None else None
+        try:
+            ocr_text = extract_text_with_cache(img_url, client, model_id, cache, on_delta=on_delta,
+                                               timings=timings, deadline=deadline, image_bytes=image_bytes,
+                                               **ocr_options)
+        except Exception as e:
+            ocr_text = f"豆包API调用错误: {str(e)}"
+        events.put(("done", idx, (ocr_text, timings)))
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(img_urls))))
+    try:
+        for idx, img_url in enumerate(img_urls):
+            executor.submit(run, idx, img_url)
+        yield from _drain_events(events, set(range(len(img_urls))), deadline)
+    finally:
+        # 超时或调用方提前停止时不等待仍在运行的识别线程，它们的请求超时不会晚于截止时刻
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# 按截止时刻收集识别事件
+def _drain_events(events, pending, deadline=None):
+    """转发 pending 中图片的事件直到全部完成；截止时刻（加宽限时间）过后其余图片以超时结束"""
+    while pending:
+        wait_seconds = None
+        if deadline is not None:
+            wait_seconds = max(remaining_seconds(deadline) + DEADLINE_GRACE_SECONDS, 0)
+        try:
+            event = events.get(timeout=wait_seconds)
+        except queue.Empty:
+            break
+        if event[1] not in pending:
+            continue
+        if event[0] == "done":
+            pending.discard(event[1])
+        yield event
+    for idx in sorted(pending):
+        timings = {}
+        yield ("done", idx, (mark_timed_out(timings), timings))
+
+# 分组合并识别多张图片
+def _extract_texts_batched(img_urls, client, model_id, max_workers, cache, batch_size, inline_max_edge=None,
+                           deadline=None, **local_options):
+    """先逐张查缓存，剩余图片按 batch_size 分组，各组并发合并识别"""
+    pending = []
+    for idx, img_url in enumerate(img_urls):
+        cached_text = ocr_cache_lookup(cache, img_url, model_id, inline_max_edge)
+        if cached_text is not None:
+            yield ("done", idx, (cached_text, {'cached': True, 'ttft_ms': 0, 'total_ms': 0}))
+        else:
+            pending.append((idx, img_url))
+    if not pending:
+        return
+    
+    events = queue.Queue()
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    
+    def run(batch):
+        finished = set()
+        
+        def on_done(idx, ocr_text, timings):
+            finished.add(idx)
+            events.put(("done", idx, (ocr_text, timings)))
+        
+        try:
+            extract_batch_with_fallback(batch, client, model_id, cache, inline_max_edge, on_done,
+                                        deadline=deadline, **local_options)
+        except Exception as e:
+            for idx, _ in batch:
+                if idx not in finished:
+                    events.put(("done", idx, (f"豆包API调用错误: {str(e)}", {})))
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches))))
+    try:
+        for batch in batches:
+            executor.submit(run, batch)
+        yield from _drain_events(events, {idx for idx, _ in pending}, deadline)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# 汇总调用次数和token用量
+def summarize_ocr_usage(ocr_timings):
+    """汇总一篇笔记所有图片的模型调用次数和token用量"""
+    usage = {'api_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+    for timings in ocr_timings:
+        for field in usage:
+            usage[field] += (timings or {}).get(field, 0)
+    return usage
+
+# 统计预筛选跳过的图片
+def count_skipped_images(ocr_timings):
+    """预筛选判定为无文字而跳过识别的图片数"""
+    return sum(1 for timings in ocr_timings if timings and timings.get('skipped'))
+
+# 汇总本地OCR的使用情况
+def summarize_local_ocr(ocr_timings):
+    """汇总一篇笔记中本地OCR采用、转交豆包的图片数和本地识别耗时；采用的图片数即节省的模型调用次数"""
+    attempts = [timings for timings in ocr_timings if timings and 'local_ms' in timings]
+    accepted = sum(1 for timings in attempts if timings.get('engine') == 'local')
+    return {
+        'local_attempts': len(attempts),
+        'local_accepted': accepted,
+        'local_escalated': len(attempts) - accepted,
+        'local_ms': round(sum(timings['local_ms'] for timings in attempts), 1),
+    }
+
+# 判断识别结果是否为错误信息
+def is_ocr_error(ocr_text):
+    """检查识别结果是否为调用错误或超时（错误结果不写入缓存）"""
+    return bool(ocr_text and (ocr_text.startswith("豆包API调用错误") or
+                              ocr_text.startswith("API响应为空") or
+                              ocr_text.startswith("豆包客户端未初始化") or
+                              ocr_text == OCR_TIMEOUT_TEXT))
+
+# 单张图片的处理状态
+def image_status(ocr_text, timings=None):
+    """返回 ok、timeout、error、skipped（预筛选跳过）或 empty（识别完成但没有文字）"""
+    timings = timings or {}
+    if timings.get('skipped'):
+        return "skipped"
+    if timings.get('timed_out') or ocr_text == OCR_TIMEOUT_TEXT:
+        return "timeout"
+    if is_valid_ocr_text(ocr_text):
+        return "ok"
+    if ocr_text is None or is_ocr_error(ocr_text):
+        return "error"
+    return "empty"
+
+# 统计超时的图片
+def count_timed_out_images(ocr_timings):
+    """超过单篇笔记时间上限而未完成识别的图片数"""
+    return sum(1 for timings in ocr_timings if timings and timings.get('timed_out'))
+
+# 判断是否为有效的文字识别结果
+def is_valid_ocr_text(ocr_text):
+    """检查识别结果是否为有效文字（而不是错误信息或无文字）"""
+    return bool(ocr_text and
+                ocr_text != "未识别到文字" and
+                not is_ocr_error(ocr_text) and
+                ocr_text != "无文字")
+
+# 页面解析使用的HTML解析器：优先使用lxml，未安装时退回标准库html.parser
+try:
+    from lxml import etree
+    HTML_PARSER = "lxml"
+except ImportError:
+    etree = None
+    HTML_PARSER = "html.parser"
+
+# 预编译的脚本数据匹配规则
+INITIAL_STATE_RE = re.compile(r'window\.__INITIAL_STATE__\s*=\s*')
+NUXT_STATE_RE = re.compile(r'window\.__NUXT__\s*=\s*')
+JS_UNDEFINED_RE = re.compile(r'([:\[,]\s*)undefined(?=\s*[,\]}])')
+URL_DEFAULT_RE = re.compile(r'"urlDefault"\s*:\s*"([^"]+)"')
+XHSCDN_URL_RE = re.compile(r'"url"\s*:\s*"(https://[^"]*xhscdn[^"]*)"')
+
+# 最后的备用方案：直接从页面源码中搜索图片URL
+BACKUP_IMAGE_URL_RES = [
+    re.compile(r'https://[^"\s]*xhscdn[^"\s]*\.(?:jpg|jpeg|png|webp|gif)', re.IGNORECASE),
+    re.compile(r'https://[^"\s]*ci\.xiaohongshu[^"\s]*\.(?:jpg|jpeg|png|webp|gif)', re.IGNORECASE),
+    re.compile(r'"(https://[^"]*xhscdn[^"]*)"', re.IGNORECASE),
+    re.compile(r"'(https://[^']*xhscdn[^']*)'", re.IGNORECASE),
+]
+
+# 图片所在的内容容器class，容器内的图片排在其他图片之前
+IMAGE_CONTAINER_CLASSES = {'note-image', 'image-container', 'photo-item', 'swiper-slide'}
+
+# 非内容图片的URL关键字
+NON_CONTENT_IMAGE_KEYWORDS = ['avatar', 'head', 'icon', 'logo', 'badge']
+
+# 没有结束标签的HTML元素
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+# 每次送入解析器的字符数，每块之后检查是否可以提前结束
+PARSE_CHUNK_SIZE = 64 * 1024
+
+_json_decoder = json.JSONDecoder()
+
+
+# 解析脚本中的JS对象
+def _load_js_object(script_text, start):
+    """从指定位置解析一个JSON对象，兼容小红书页面中的 undefined 值"""
+    text = JS_UNDEFINED_RE.sub(r'\1null', script_text[start:])
+    obj, _ = _json_decoder.raw_decode(text)
+    return obj
+
+
+# 页面初始数据中笔记图片列表的已知路径，* 表示任意笔记ID
+NOTE_IMAGE_LIST_PATHS = [
+    ('note', 'noteDetailMap', '*', 'note', 'imageList'),
+    ('note', 'note', 'imageList'),
+    ('noteData', 'data', 'noteData', 'imageList'),
+]
+
+# JSON中可能是图片URL的字段
+IMAGE_URL_KEYS = {'urlDefault', 'url', 'src'}
+
+# 通用JSON搜索的最大深度
+JSON_WALK_MAX_DEPTH = 12
+
+
+# 按已知路径查找笔记
+def _iter_known_note_paths(state, note_id=None):
+    """按已知路径逐个返回 (笔记字典, 图片列表)，* 处优先匹配当前笔记ID"""
+    for path in NOTE_IMAGE_LIST_PATHS:
+        nodes = [state]
+        for key in path[:-1]:
+            next_nodes = []
+            for node in nodes:
+                if not isinstance(node, dict):
+                    continue
+                if key == '*':
+                    next_nodes.extend([node[note_id]] if note_id in node else node.values())
+                elif key in node:
+                    next_nodes.append(node[key])
+            nodes = next_nodes
+        for note in nodes:
+            if isinstance(note, dict) and isinstance(note.get(path[-1]), list):
+                yield note, note[path[-1]]
+
+
+# 从页面初始数据中读取笔记图片列表
+def _find_note_image_list(state, note_id=None):
+    """按已知路径读取笔记图片列表和笔记信息，未找到时返回 (None, None)"""
+    for note, image_list in _iter_known_note_paths(state, note_id):
+        images = ImageURLSet()
+        for image in image_list:
+            if not isinstance(image, dict):
+                continue
+            img_url = image.get('urlDefault') or image.get('url')
+            if not img_url:
+                for info in image.get('infoList') or []:
+                    if isinstance(info, dict) and info.get('url'):
+                        img_url = info['url']
+                        break
+            if img_url:
+                images.add(clean_image_url(img_url))
+        if images:
+            return images.to_list(), note
+    return None, None
+
+
+# 在JSON中搜索图片URL
+def _find_images_in_json(obj, found, max_depth=JSON_WALK_MAX_DEPTH):
+    """迭代遍历JSON结构（限制深度），把xhscdn图片URL加入found集合"""
+    stack = [(obj, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if isinstance(node, dict):
+            values = node.items()
+        elif isinstance(node, list):
+            values = ((None, item) for item in node)
+        else:
+            continue
+
+        children = []
+        for key, value in values:
+            if isinstance(value, str):
+                if key in IMAGE_URL_KEYS and 'xhscdn' in value:
+                    found.add(clean_image_url(value))
+            elif depth < max_depth and isinstance(value, (dict, list)):
+                children.append((value, depth + 1))
+        # 倒序入栈，保持与文档顺序一致的深度优先遍历
+        stack.extend(reversed(children))
+
+
+class _XhsPageCollector:
+    """HTML解析事件处理器：在一次遍历中收集标题、描述、图片和脚本"""
+
+    def __init__(self, note_id=None):
+        self.note_id = note_id
+        # 按优先级记录候选值：数字越小优先级越高，同一优先级取文档中第一个
+        self.title_candidates = {}
+        self.desc_candidates = {}
+        self.meta_images = []
+        self.container_images = []
+        self.other_images = []
+        # (脚本文字, 已解析的页面初始数据或None)，未找到笔记图片列表时从中搜索图片
+        self.scripts = []
+        self.note_images = None
+        self.note = None
+        self.done = False
+        self.json_seconds = 0.0
+        self._stack = []
+        self._captures = []
+        self._container_depth = 0
+        self._script_buffer = None
+
+    def start(self, tag, attrs):
+        if self.done:
+            return
+        tag = tag.lower()
+
+        if tag == 'meta':
+            key = attrs.get('property') or attrs.get('name')
+            value = (attrs.get('content') or '').strip()
+            if not value:
+                return
+            if key == 'og:title':
+                self.title_candidates.setdefault(0, value)
+            elif key == 'og:description':
+                self.desc_candidates.setdefault(0, value)
+            elif key == 'description':
+                self.desc_candidates.setdefault(1, value)
+            elif key in ('og:image', 'twitter:image') and 'xhs' in value.lower():
+                self.meta_images.append(clean_image_url(value))
+            return
+
+        if tag == 'img':
+            # 尝试多个属性获取图片URL
+            img_url = (attrs.get('src') or
+                       attrs.get('data-src') or
+                       attrs.get('data-original') or
+                       attrs.get('data-lazy') or
+                       attrs.get('data-url') or '')
+            lowered = img_url.lower()
+            # 过滤掉明显不是内容图片的URL
+            if img_url and 'xhs' in lowered and not any(x in lowered for x in NON_CONTENT_IMAGE_KEYWORDS):
+                target = self.container_images if self._container_depth else self.other_images
+                target.append(clean_image_url(img_url))
+            return
+
+        if tag in VOID_ELEMENTS:
+            return
+
+        if tag == 'script':
+            self._script_buffer = []
+
+        classes = set((attrs.get('class') or '').split())
+        captures = []
+        for candidates, priority, matched in (
+            (self.title_candidates, 1, tag == 'title'),
+            (self.title_candidates, 2, 'note-title' in classes),
+            (self.title_candidates, 3, tag == 'h1'),
+            (self.desc_candidates, 2, 'note-content' in classes),
+            (self.desc_candidates, 3, 'desc' in classes),
+        ):
+            if matched and priority not in candidates:
+                # 先占位，保证取到的是文档中第一个匹配的元素
+                candidates[priority] = ''
+                captures.append((candidates, priority, []))
+
+        is_container = bool(classes & IMAGE_CONTAINER_CLASSES)
+        if is_container:
+            self._container_depth += 1
+        self._captures.extend(captures)
+        self._stack.append((tag, is_container, captures))
+
+    def end(self, tag):
+        if self.done:
+            return
+        tag = tag.lower()
+        if tag in VOID_ELEMENTS:
+            return
+
+        # 找到对应的开始标签，其中未闭合的子元素一并结束
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            self._close_element(*self._stack.pop())
+
+    def data(self, text):
+        if self.done:
+            return
+        if self._script_buffer is not None:
+            self._script_buffer.append(text)
+            return
+        for _, _, buffer in self._captures:
+            buffer.append(text)
+
+    def close(self):
+        return self
+
+    def _close_element(self, tag, is_container, captures):
+        if is_container:
+            self._container_depth -= 1
+        for capture in captures:
+            candidates, priority, buffer = capture
+            candidates[priority] = ''.join(buffer).strip()
+            self._captures.remove(capture)
+        if tag == 'script' and self._script_buffer is not None:
+            script_text = ''.join(self._script_buffer)
+            self._script_buffer = None
+            self._handle_script(script_text)
+
+    def _handle_script(self, script_text):
+        if not script_text:
+            return
+        state = None
+        if self.note_images is None:
+            match = INITIAL_STATE_RE.search(script_text)
+            if match:
+                started = time.perf_counter()
+                try:
+                    state = _load_js_object(script_text, match.end())
+                except ValueError:
+                    state = None
+                if isinstance(state, dict):
+                    self.note_images, self.note = _find_note_image_list(state, self.note_id)
+                self.json_seconds += time.perf_counter() - started
+                if self.note_images:
+                    # 找到笔记图片列表后不再需要继续解析页面
+                    self.done = True
+                    return
+        # 保留已解析的数据，未找到笔记图片列表时直接在其中搜索，不再重复解析
+        self.scripts.append((script_text, state))
+
+
+class _StdlibPageParser(HTMLParser):
+    """把标准库HTMLParser的事件转发给页面收集器"""
+
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+# 解析小红书页面
+def parse_xhs_page(html, note_id=None, timings=None):
+    """单次遍历页面提取标题、描述和图片；找到页面初始数据中的笔记图片列表后即停止解析
+
+    提供 timings 字典时写入 html_ms（HTML解析）、json_ms（页面初始数据解析和遍历）和 images_found。
+    """
+    started = time.perf_counter()
+    content_data, json_seconds = _parse_xhs_page(html, note_id)
+    html_seconds = time.perf_counter() - started - json_seconds
+    
+    METRICS.observe("xhs_page_parse_seconds", html_seconds, labels={"phase": "html"}, help_text="笔记页面解析耗时")
+    METRICS.observe("xhs_page_parse_seconds", json_seconds, labels={"phase": "json"}, help_text="笔记页面解析耗时")
+    METRICS.inc("xhs_images_found_total", len(content_data['images']), help_text="页面中找到的图片数")
+    if timings is not None:
+        timings.update(
+            html_ms=round(html_seconds * 1000, 1),
+            json_ms=round(json_seconds * 1000, 1),
+            images_found=len(content_data['images']),
+        )
+    return content_data
+
+def _parse_xhs_page(html, note_id=None):
+    """返回 (解析结果, 其中解析和遍历JSON数据的秒数)"""
+    collector = _XhsPageCollector(note_id)
+    if HTML_PARSER == "lxml" and etree is not None:
+        parser = etree.HTMLParser(target=collector)
+    else:
+        parser = _StdlibPageParser(collector)
+
+    for offset in range(0, len(html), PARSE_CHUNK_SIZE):
+        parser.feed(html[offset:offset + PARSE_CHUNK_SIZE])
+        if collector.done:
+            break
+    if not collector.done:
+        parser.close()
+
+    content_data = {}
+    for candidates, field in ((collector.title_candidates, 'title'), (collector.desc_candidates, 'description')):
+        for priority in sorted(candidates):
+            if candidates[priority]:
+                content_data[field] = candidates[priority]
+                break
+
+    # 页面初始数据中的笔记图片列表最权威，找到时直接使用
+    if collector.note_images:
+        note = collector.note
+        if not content_data.get('title') and note.get('title'):
+            content_data['title'] = note['title'].strip()
+        if not content_data.get('description') and note.get('desc'):
+            content_data['description'] = note['desc'].strip()
+        content_data['images'] = collector.note_images
+        return content_data, collector.json_seconds
+
+    # 未找到笔记图片列表时，合并页面标签中的图片和脚本中的图片URL
+    images = ImageURLSet()
+    for img_url in collector.meta_images + collector.container_images + collector.other_images:
+        if len(images) >= 10:  # 限制最多10张图片
+            break
+        images.add(img_url)
+
+    json_seconds = collector.json_seconds
+    for script_text, state in collector.scripts:
+        # 页面初始数据在收集时已解析过（解析失败时为None），只需解析 __NUXT__ 数据
+        started = time.perf_counter()
+        if state is not None:
+            _find_images_in_json(state, images)
+        match = NUXT_STATE_RE.search(script_text)
+        if match:
+            try:
+                _find_images_in_json(_load_js_object(script_text, match.end()), images)
+            except ValueError:
+                pass
+        json_seconds += time.perf_counter() - started
+        for url_re in (URL_DEFAULT_RE, XHSCDN_URL_RE):
+            for img_url in url_re.findall(script_text):
+                if 'xhscdn' in img_url:
+                    images.add(clean_image_url(img_url))
+
+    if not images:
+        backup_images = ImageURLSet()
+        for url_re in BACKUP_IMAGE_URL_RES:
+            for img_url in url_re.findall(html):
+                if len(backup_images) >= 10:
+                    break
+                backup_images.add(clean_image_url(img_url))
+        for img_url in backup_images.to_list()[:5]:  # 添加前5个备用图片
+            images.add(img_url)
+
+    content_data['images'] = images.to_list()
+    return content_data, json_seconds
+
+
+# 抓取小红书内容的函数
+def fetch_xhs_content(url, user_agent=DEFAULT_USER_AGENT, page_cache=None, timings=None, deadline=None):
+    """抓取小红书内容；提供 page_cache 时优先使用缓存，过期后向服务器做条件请求
+
+    提供 timings 字典时写入 page_cache（hit/revalidated/miss）、fetch_ms、bytes_fetched 以及页面解析耗时。
+    提供 deadline（截止时刻）时连接和读取超时以及重试前的等待都不超过剩余时间。
+    """
+    if timings is None:
+        timings = {}
+    try:
+        headers = {
+            'User-Agent': user_agent,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Cache-Control': 'max-age=0',
+            'sec-ch-ua': '"Google Chrome";v="119", "Chromium";v="119", "Not?A_Brand";v="24"',
+            'sec-ch-ua-mobile': '?0',
+            'sec-ch-ua-platform': '"macOS"'
+        }
+        
+        # 短链接直接使用之前跳转到的真实地址，缓存按笔记ID查找
+        target_url = url
+        cache_key = None
+        cached = None
+        if page_cache is not None:
+            target_url = page_cache.resolve_short_link(url) or url
+            cache_key = extract_note_id(target_url) or target_url
+            cached, fresh = page_cache.get(cache_key)
+            if fresh:
+                timings['page_cache'] = 'hit'
+                METRICS.inc("xhs_page_cache_total", labels={"result": "hit"}, help_text="笔记页面缓存使用情况")
+                return copy.deepcopy(cached['content'])
+            if cached is not None:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+        
+        started = time.perf_counter()
+        response = _http_request('get', target_url, deadline, headers=headers)
+        fetch_seconds = time.perf_counter() - started
+        timings['fetch_ms'] = round(fetch_seconds * 1000, 1)
+        timings['bytes_fetched'] = len(response.content)
+        METRICS.observe("xhs_page_fetch_seconds", fetch_seconds, help_text="笔记页面下载耗时")
+        METRICS.inc("xhs_page_bytes_total", len(response.content), help_text="下载的笔记页面字节数")
+        
+        if cached is not None and response.status_code == 304:
+            timings['page_cache'] = 'revalidated'
+            METRICS.inc("xhs_page_cache_total", labels={"result": "revalidated"}, help_text="笔记页面缓存使用情况")
+            page_cache.revalidate(cache_key)
+            return copy.deepcopy(cached['content'])
+        response.raise_for_status()
+        timings['page_cache'] = 'miss'
+        METRICS.inc("xhs_page_cache_total", labels={"result": "miss"}, help_text="笔记页面缓存使用情况")
+        
+        final_url = response.url or target_url
+        content_data = parse_xhs_page(response.text, extract_note_id(final_url), timings)
+        
+        if page_cache is not None:
+            if final_url != url and 'xhslink.com' in url:
+                page_cache.remember_short_link(url, final_url)
+            page_cache.set(extract_note_id(final_url) or cache_key, copy.deepcopy(content_data),
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+        return content_data
+        
+    except OCRDeadlineExceeded:
+        return {'error': '抓取超时: 超过单篇笔记时间上限'}
+    except requests.RequestException as e:
+        return {'error': f'网络请求错误: {str(e)}'}
+    except Exception as e:
+        return {'error': f'解析错误: {str(e)}'}
+
+# 构建文字汇总
+def build_summary(content, ocr_results, ocr_timings=None):
+    """按图片顺序将标题、笔记内容和有效的图片识别结果汇总为字典
+
+    提供 ocr_timings 时附加每张图片的处理状态（见 image_status），超时的笔记也能看出缺了哪些图片。
+    """
+    summary_data = {
+        "标题": content.get('title', ''),
+        "笔记内容": content.get('description', ''),
+        "图片文字": {}
+    }
+    for idx, ocr_text in enumerate(ocr_results):
+        if is_valid_ocr_text(ocr_text):
+            summary_data["图片文字"][f"图片{idx+1}"] = ocr_text
+    if ocr_timings is not None:
+        summary_data["图片状态"] = {
+            f"图片{idx+1}": image_status(ocr_text, timings)
+            for idx, (ocr_text, timings) in enumerate(zip(ocr_results, ocr_timings))
+        }
+    return summary_data
@@ -0,0 +1,261 @@
+"""已提取笔记的全文索引
+
+把每篇笔记的标题、正文和图片识别文字写入本地SQLite FTS5索引，不联网即可按关键词查找笔记。
+
+导入已有的批量输出和本地保存的提取结果（在仓库根目录运行）:
+    python ocr_index.py results.jsonl
+    python ocr_index.py --jobs .cache/jobs
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# 默认索引文件位置
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "note_index.sqlite3")
+
+# 中文字符（含扩展A区和兼容汉字）
+CJK_RUN_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+
+# 查询中的非中文词（与FTS5 unicode61分词器的切分方式一致）
+WORD_RE = re.compile(r'[^\W_]+')
+
+# 排序时标题、正文、图片文字的权重
+RANK_WEIGHTS = (5.0, 2.0, 1.0)
+
+
+# 中文切分
+def segment(text):
+    """把连续的中文切成重叠的二字词，供unicode61分词器建索引
+
+    每段连续中文 abcd 写成 "ab bc cd d"：查询两个字以上时用二字词短语匹配任意子串，
+    查询单个字时用前缀匹配（以该字开头的二字词，或位于末尾的单字）。
+    """
+    def split_run(match):
+        run = match.group(0)
+        tokens = [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+        return " " + " ".join(tokens) + " "
+    return CJK_RUN_RE.sub(split_run, text or "")
+
+
+def _term_tokens(term):
+    """把一个查询词切成与索引一致的词，返回 (词列表, 最后一个词是否需要前缀匹配)
+
+    以英文、数字或单个汉字结尾时最后一个词按前缀匹配（iphone 匹配 iphone15）。
+    """
+    tokens = []
+    ends_with_bigram = False
+    position = 0
+    for match in CJK_RUN_RE.finditer(term):
+        tokens += [word.lower() for word in WORD_RE.findall(term[position:match.start()])]
+        run = match.group(0)
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens += [run[i:i + 2] for i in range(len(run) - 1)]
+        position = match.end()
+        ends_with_bigram = len(run) > 1
+    words = [word.lower() for word in WORD_RE.findall(term[position:])]
+    tokens += words
+    return tokens, bool(words) or not ends_with_bigram
+
+
+# 构造FTS5查询
+def build_match_query(query):
+    """按空格拆分查询词，每个词作为一个短语，全部词都要出现；没有可查询的词时返回None"""
+    phrases = []
+    for term in query.split():
+        tokens, prefix = _term_tokens(term)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"' + (" *" if prefix else ""))
+    return " AND ".join(phrases) or None
+
+
+# 生成摘要
+def make_snippet(text, terms, width=40):
+    """截取第一个查询词附近的文字，查询词用 ** 标出"""
+    text = re.sub(r'\s+', ' ', text or "")
+    lowered = text.lower()
+    hits = [(lowered.find(term.lower()), term) for term in terms if term and term.lower() in lowered]
+    if not hits:
+        return text[:width * 2] + ("…" if len(text) > width * 2 else "")
+    start, _ = min(hits)
+    begin = max(0, start - width)
+    snippet = text[begin:start + width * 2]
+    for term in sorted({term for _, term in hits}, key=len, reverse=True):
+        snippet = re.sub(re.escape(term), lambda match: f"**{match.group(0)}**", snippet, flags=re.I)
+    return ("…" if begin else "") + snippet + ("…" if start + width * 2 < len(text) else "")
+
+
+class NoteIndex:
+    """基于SQLite FTS5的笔记全文索引，同一篇笔记重复写入时覆盖旧记录"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY,
+                note_key TEXT UNIQUE NOT NULL,
+                note_id TEXT,
+                url TEXT,
+                title TEXT,
+                description TEXT,
+                image_texts TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes (created_at)")
+        # 索引中保存切分后的文字，原文保存在 notes 表中用于显示
+        self._conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                title, description, ocr_text, tokenize='unicode61'
+            )
+        """)
+        self._conn.commit()
+
+    def add(self, note_id, url, title, description, image_texts, created_at=None):
+        """写入一篇笔记；image_texts 为 {"图片1": 识别文字, ...}（只包含有效的识别结果）"""
+        note_key = note_id or url
+        ocr_text = "\n".join(image_texts.values())
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM notes WHERE note_key = ?", (note_key,)).fetchone()
+            values = (note_id, url, title or "", description or "",
+                      json.dumps(image_texts, ensure_ascii=False), created_at or time.time())
+            if row is None:
+                rowid = self._conn.execute(
+                    "INSERT INTO notes (note_key, note_id, url, title, description, image_texts, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", (note_key, *values)
+                ).lastrowid
+            else:
+                rowid = row[0]
+                self._conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (rowid,))
+                self._conn.execute(
+                    "UPDATE notes SET note_id = ?, url = ?, title = ?, description = ?, image_texts = ?, "
+                    "created_at = ? WHERE id = ?", (*values, rowid)
+                )
+            self._conn.execute(
+                "INSERT INTO notes_fts (rowid, title, description, ocr_text) VALUES (?, ?, ?, ?)",
+                (rowid, segment(title), segment(description), segment(ocr_text))
+            )
+            self._conn.commit()
+
+    def add_summary(self, note_id, url, summary, created_at=None):
+        """按 build_summary 的汇总结果写入一篇笔记"""
+        self.add(note_id, url, summary.get("标题", ""), summary.get("笔记内容", ""),
+                 summary.get("图片文字", {}), created_at)
+
+    def search(self, query, limit=20, offset=0):
+        """按相关度返回匹配的笔记列表，每项包含笔记信息、命中的图片和摘要"""
+        match_query = build_match_query(query)
+        if match_query is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT n.note_id, n.url, n.title, n.description, n.image_texts, n.created_at, "
+                "bm25(notes_fts, ?, ?, ?) AS score "
+                "FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid "
+                "WHERE notes_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?",
+                (*RANK_WEIGHTS, match_query, limit, offset)
+            ).fetchall()
+
+        terms = query.split()
+        results = []
+        for note_id, url, title, description, image_texts, created_at, score in rows:
+            image_texts = json.loads(image_texts)
+            matched_images = [label for label, text in image_texts.items()
+                              if all(term.lower() in text.lower() for term in terms)]
+            source = (image_texts[matched_images[0]] if matched_images
+                      else "\n".join([title, description, *image_texts.values()]))
+            results.append({
+                "note_id": note_id,
+                "url": url,
+                "title": title,
+                "created_at": created_at,
+                "score": round(-score, 3),
+                "matched_images": matched_images,
+                "snippet": make_snippet(source, terms),
+            })
+        return results
+
+    def count_matches(self, query):
+        """匹配的笔记总数"""
+        match_query = build_match_query(query)
+        if match_query is None:
+            return 0
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes_fts WHERE notes_fts MATCH ?",
+                                      (match_query,)).fetchone()[0]
+
+    def size(self):
+        """已索引的笔记数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+
+# 导入已有的提取结果
+def import_batch_output(index, path):
+    """导入 ocr_batch 的JSONL输出，返回导入的笔记数"""
+    count = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" in record or "summary" not in record:
+                continue
+            finished_at = record.get("finished_at")
+            created_at = time.mktime(time.strptime(finished_at, "%Y-%m-%dT%H:%M:%S")) if finished_at else None
+            index.add_summary(record.get("note_id"), record["url"], record["summary"], created_at)
+            count += 1
+    return count
+
+
+def import_job_dir(index, directory):
+    """导入界面保存的提取结果（JobStore目录），返回导入的笔记数"""
+    count = 0
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if "summary_data" not in job:
+            continue
+        created_at = job.get("created_at")
+        created_at = time.mktime(time.strptime(created_at, "%Y-%m-%d %H:%M:%S")) if created_at else None
+        index.add_summary(job.get("note_id"), job.get("url"), job["summary_data"], created_at)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把已有的提取结果导入笔记全文索引")
+    parser.add_argument("outputs", nargs="*", help="ocr_batch 输出的JSONL文件")
+    parser.add_argument("--jobs", help="界面保存的提取结果目录，如 .cache/jobs")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="索引文件位置")
+    args = parser.parse_args(argv)
+    if not args.outputs and not args.jobs:
+        parser.error("请提供JSONL输出文件或 --jobs 目录")
+
+    index = NoteIndex(args.index)
+    for path in args.outputs:
+        print(f"{path}: 导入 {import_batch_output(index, path)} 篇笔记")
+    if args.jobs:
+        print(f"{args.jobs}: 导入 {import_job_dir(index, args.jobs)} 篇笔记")
+    print(f"索引中共 {index.size()} 篇笔记")
+
+
+if __name__ == "__main__":
+    main()
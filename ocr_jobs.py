@@ -0,0 +1,44 @@
+import json
+import hashlib
+import os
+import re
+import threading
+
+
+# 默认提取结果保存位置
+DEFAULT_JOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs")
+
+
+class JobStore:
+    """把每篇笔记的提取结果保存为本地JSON文件，导出、页面刷新时直接读取，不再重新抓取和识别"""
+
+    def __init__(self, directory=DEFAULT_JOB_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        """笔记ID直接作为文件名，其他键（如链接）使用哈希值"""
+        if re.fullmatch(r'[0-9A-Za-z_-]{1,64}', key):
+            name = key
+        else:
+            name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def save(self, key, job):
+        """写入提取结果（先写临时文件再替换，避免中断时留下半个文件）"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+    def load(self, key):
+        """读取提取结果，不存在或文件损坏时返回None"""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,84 @@
+import io
+import re
+import threading
+
+# 本地OCR依赖pytesseract和Tesseract程序，未安装时本地识别不可用
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# 默认识别语言：简体中文和英文
+LOCAL_OCR_LANG = "chi_sim+eng"
+
+# 默认置信度阈值（0~100），高于该值的结果直接采用，否则交给豆包模型识别
+LOCAL_OCR_MIN_CONFIDENCE = 80
+
+CJK_RE = re.compile(r'[　-〿㐀-鿿＀-￯]')
+
+_available = None
+_available_lock = threading.Lock()
+
+
+# 检查本地OCR是否可用
+def is_available():
+    """pytesseract、Pillow和Tesseract程序都可用时返回True（只检查一次）"""
+    global _available
+    if _available is None:
+        with _available_lock:
+            if _available is None:
+                if pytesseract is None or Image is None:
+                    _available = False
+                else:
+                    try:
+                        pytesseract.get_tesseract_version()
+                        _available = True
+                    except Exception:
+                        _available = False
+    return _available
+
+
+# 拼接同一行的词
+def _join_words(words):
+    """中文之间不加空格，其他词之间用空格分隔"""
+    line = words[0]
+    for word in words[1:]:
+        if CJK_RE.match(line[-1]) and CJK_RE.match(word[0]):
+            line += word
+        else:
+            line += " " + word
+    return line
+
+
+# 本地识别图片文字
+def recognize(image_bytes, lang=LOCAL_OCR_LANG):
+    """用Tesseract识别图片文字，返回 (按行拼接的文字, 按字符数加权的平均置信度0~100)
+
+    没有识别到任何文字时返回 ("", 0)。
+    """
+    image = Image.open(io.BytesIO(image_bytes)).convert('L')
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+
+    lines = {}
+    weighted_confidence = 0.0
+    char_count = 0
+    for index, word in enumerate(data['text']):
+        word = (word or "").strip()
+        confidence = float(data['conf'][index])
+        if not word or confidence < 0:
+            continue
+        key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+        lines.setdefault(key, []).append(word)
+        weighted_confidence += confidence * len(word)
+        char_count += len(word)
+
+    if not char_count:
+        return "", 0.0
+    text = "\n".join(_join_words(words) for words in lines.values())
+    return text, weighted_confidence / char_count
@@ -0,0 +1,110 @@
+import http.server
+import os
+import threading
+from bisect import bisect_left
+
+
+# 默认指标文件位置（可由node_exporter的textfile collector采集）
+DEFAULT_METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "metrics.prom")
+
+# 耗时直方图的分桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """进程内累计的计数器和直方图，可导出为Prometheus文本格式"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, labels=None, help_text=""):
+        """计数器累加"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, help_text=""):
+        """直方图记录一次观测值"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """导出为Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._help):
+                kind, help_text = self._help[name]
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_label_text(labels)} {value}")
+                    continue
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {round(histogram['sum'], 6)}")
+                    lines.append(f"{name}_count{_label_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=DEFAULT_METRICS_PATH):
+        """写入指标文件（先写临时文件再替换，采集时不会读到半个文件）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """在后台线程中提供 /metrics 接口，返回服务对象"""
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# 进程内共享的指标
+METRICS = MetricsRegistry()
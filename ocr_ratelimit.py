@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """进程内共享的自适应限速器：令牌桶控制请求速率，按AIMD调整速率
+
+    每次请求前调用 acquire() 领取令牌；请求成功后调用 on_success() 缓慢提高速率（加法增加），
+    被限流时调用 on_throttle() 把速率减半（乘法减少）并暂停发送，直到冷却结束。
+    """
+
+    def __init__(self, rate=5.0, min_rate=0.2, max_rate=20.0, burst=4,
+                 increase_step=0.1, decrease_factor=0.5, cooldown_seconds=1.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.successes = 0
+        self.throttled = 0
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, timeout=None):
+        """阻塞直到可以发出下一个请求；提供 timeout（秒）时最多等待这么久，超时返回False"""
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            if give_up_at is not None:
+                if now >= give_up_at:
+                    return False
+                wait = min(wait, give_up_at - now)
+            time.sleep(wait)
+
+    def on_success(self):
+        """请求成功，速率加法增加"""
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after=None):
+        """请求被限流，速率乘法减少并暂停发送
+
+        同时在途的多个请求往往一起被限流，冷却时间内只减速一次，避免速率被连续减到最低。
+        retry_after 为服务器要求的等待秒数，没有时按当前速率退避并加随机抖动。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if now - self._last_decrease >= self.cooldown_seconds:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._last_decrease = now
+            pause = retry_after if retry_after else (1 / self.rate) * (1 + random.random())
+            self._paused_until = max(self._paused_until, now + pause)
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self):
+        """当前速率（次/秒）和累计成功、限流次数"""
+        with self._lock:
+            return {"rate": round(self.rate, 2), "successes": self.successes, "throttled": self.throttled}
@@ -0,0 +1,57 @@
+import streamlit as st
+import time
+from ocr_index import NoteIndex
+
+st.set_page_config(page_title="小红书笔记搜索", page_icon="🔎", layout="wide")
+
+st.title("🔎 小红书笔记搜索")
+st.markdown("在已提取的笔记中按关键词查找，不访问网络也不调用模型")
+
+# 获取全文索引
+@st.cache_resource
+def get_note_index():
+    """获取本地笔记全文索引"""
+    return NoteIndex()
+
+note_index = get_note_index()
+
+with st.sidebar:
+    st.header("⚙️ 设置")
+    page_size = st.number_input("每页结果数", min_value=5, max_value=100, value=20, step=5)
+    st.caption(f"📚 索引中共 {note_index.size()} 篇笔记")
+    st.caption("导入已有结果：`python ocr_index.py results.jsonl --jobs .cache/jobs`")
+
+query = st.text_input(
+    "关键词",
+    placeholder="例如：包邮 iPhone",
+    help="多个关键词用空格分隔，笔记需包含全部关键词；匹配标题、笔记内容和图片文字"
+)
+page = st.number_input("页码", min_value=1, value=1, step=1)
+
+if query.strip():
+    started = time.perf_counter()
+    total = note_index.count_matches(query)
+    results = note_index.search(query, limit=int(page_size), offset=(int(page) - 1) * int(page_size))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    st.caption(f"找到 {total} 篇笔记 ｜ 耗时 {elapsed_ms:.1f} ms")
+    if not results:
+        st.info("没有匹配的笔记" if total == 0 else "已超出最后一页")
+
+    for result in results:
+        with st.container():
+            st.markdown(f"#### [{result['title'] or '（无标题）'}]({result['url']})")
+            details = [f"笔记ID: {result['note_id'] or '-'}",
+                       f"提取时间: {time.strftime('%Y-%m-%d %H:%M', time.localtime(result['created_at']))}"]
+            if result['matched_images']:
+                details.append(f"命中: {'、'.join(result['matched_images'])}")
+            st.caption(" ｜ ".join(details))
+            st.markdown(result['snippet'])
+            st.markdown("---")
+else:
+    st.markdown("""
+    ### 使用说明
+    - 在 `ocr.py` 页面或 `ocr_batch.py` 批量模式中完成的提取会自动加入索引
+    - 中文按字匹配，可以搜索任意长度的词语片段；英文和数字以输入的词开头即可匹配
+    - 结果按相关度排序，标题中的命中权重最高
+    """)
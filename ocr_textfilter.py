@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import threading
+import time
+
+try:
+    from PIL import Image, ImageChops, ImageFilter, ImageStat
+except ImportError:
+    Image = None
+
+
+# 默认判定记录位置
+DEFAULT_DECISION_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "text_filter.jsonl")
+
+# 在最长边为该值的灰度缩略图上判定
+TEXT_FILTER_THUMB_EDGE = 320
+
+# 边缘强度阈值（0~255）和“文字行”的最少黑白跳变数（约4个笔画）
+EDGE_THRESHOLD = 48
+MIN_ROW_TRANSITIONS = 8
+
+# 文字行占比低于该值判定为无文字图片；默认值偏保守，只跳过几乎没有笔画的图片
+TEXT_FILTER_MIN_SCORE = 0.02
+
+
+# 文字存在程度评分
+def text_presence_score(image_bytes, thumb_edge=TEXT_FILTER_THUMB_EDGE):
+    """在缩略图上估计图片包含文字的可能性，返回特征字典
+
+    文字由密集的细笔画组成，边缘图中同一行会出现大量黑白跳变；商品图、风景照等
+    大面积平滑区域的行跳变很少。score 为跳变足够密集的行所占比例（0~1）。
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('L', (thumb_edge * 2, thumb_edge * 2))
+    image = image.convert('L')
+    image.thumbnail((thumb_edge, thumb_edge))
+    width, height = image.size
+
+    edges = image.filter(ImageFilter.FIND_EDGES).point(lambda value: 255 if value > EDGE_THRESHOLD else 0)
+    # 与右移一像素的边缘图做差，得到水平方向的跳变；按行求平均再乘以宽度即每行的跳变数
+    transitions = ImageChops.difference(edges, ImageChops.offset(edges, 1, 0))
+    row_counts = [value / 255 * width for value in transitions.resize((1, height), Image.BOX).getdata()]
+    text_rows = sum(1 for count in row_counts if count >= MIN_ROW_TRANSITIONS)
+
+    return {
+        "score": round(text_rows / height, 4),
+        "edge_density": round(ImageStat.Stat(edges).mean[0] / 255, 4),
+        "size": [width, height],
+    }
+
+
+class DecisionLog:
+    """把预筛选的判定结果追加到JSONL文件，用于对照人工标注调整阈值
+
+    每行记录图片URL、特征、阈值、判定，以及未跳过的图片最终是否识别出文字。
+    """
+
+    def __init__(self, path=DEFAULT_DECISION_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, img_url, features, min_score, has_text, ocr_found_text=None):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "url": img_url,
+            **features,
+            "min_score": min_score,
+            "has_text": has_text,
+            "ocr_found_text": ocr_found_text,
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
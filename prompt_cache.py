@@ -0,0 +1,204 @@
+"""提示词前缀缓存和用量记录
+
+各应用的提示词由固定的说明和示例（前缀）加上用户输入组成。固定部分放在 system 中，
+用户输入单独放在用户消息中；前缀足够长时标记为可缓存，重复调用时服务端直接读取缓存的前缀。
+
+- Anthropic：前缀不短于 MIN_CACHEABLE_TOKENS 时 system 块带 cache_control，
+  用量中的 cache_read_input_tokens 为缓存读取的token数
+- Gemini：前缀不短于 GEMINI_MIN_CACHEABLE_TOKENS 时用 caches.create 创建显式上下文缓存，
+  同一前缀在有效期内复用；否则直接发送 system_instruction
+
+服务端不缓存短于最小长度的前缀，按估计的token数判断，不足时不标记、不创建缓存，用量说明中注明未缓存。
+目前各应用的固定说明只有约300~600 tokens，都达不到最小长度，实际不会使用服务端缓存；
+这里的拆分只在说明加长（如加入更多示例）后才会生效。
+"""
+import hashlib
+import re
+import threading
+import time
+
+
+# Anthropic 缓存标记，缓存有效期5分钟，每次命中后重新计时
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Anthropic 可缓存前缀的最小token数（Claude 3.5 Sonnet 为1024）
+MIN_CACHEABLE_TOKENS = 1024
+
+# 按约1个token计算的中日韩字符和全角标点
+CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# Gemini 显式缓存的最小token数（Gemini 2.5 Pro 为4096）
+GEMINI_MIN_CACHEABLE_TOKENS = 4096
+
+# Gemini 显式缓存的有效期
+GEMINI_CACHE_TTL_SECONDS = 3600
+
+# 缓存过期前多久停止复用，避免请求到达时缓存刚好过期
+GEMINI_CACHE_MARGIN_SECONDS = 60
+
+_gemini_caches = {}
+# 全局锁只保护上面的字典；创建缓存的网络请求只在同一前缀的锁内进行，不阻塞其他前缀的调用
+_gemini_lock = threading.Lock()
+_gemini_key_locks = {}
+
+
+def estimate_tokens(text):
+    """粗略估计token数：中文字符约1个token，其余约4个字符1个token"""
+    cjk = len(CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+
+def cached_system(text, timings=None):
+    """把固定的说明和示例包装成 system 块，前缀达到 MIN_CACHEABLE_TOKENS 时加缓存标记
+
+    前缀太短时不加标记，并在timings中把 uncached_prefix_calls 加1，用量说明中注明未缓存。
+    """
+    if estimate_tokens(text) < MIN_CACHEABLE_TOKENS:
+        _record_uncached_prefix(timings)
+        return [{"type": "text", "text": text}]
+    return [{"type": "text", "text": text, "cache_control": CACHE_CONTROL}]
+
+
+def _record_uncached_prefix(timings):
+    if timings is not None:
+        timings['uncached_prefix_calls'] = timings.get('uncached_prefix_calls', 0) + 1
+
+
+# 记录耗时和token用量
+def record_usage(timings, started, input_tokens=0, output_tokens=0, cache_read_tokens=0, cache_write_tokens=0,
+                 first_token_at=None):
+    """把一次调用的耗时和token用量累加到timings中，input_tokens 为未命中缓存的输入token数
+
+    流式调用时提供 first_token_at（收到第一段文字的 perf_counter 时间），记录首字耗时 ttft_ms。
+    """
+    if timings is None:
+        return
+    timings['api_calls'] = timings.get('api_calls', 0) + 1
+    timings['latency_ms'] = timings.get('latency_ms', 0) + int((time.perf_counter() - started) * 1000)
+    if first_token_at is not None:
+        timings['ttft_ms'] = timings.get('ttft_ms', 0) + int((first_token_at - started) * 1000)
+    for field, value in (('input_tokens', input_tokens), ('output_tokens', output_tokens),
+                         ('cache_read_tokens', cache_read_tokens), ('cache_write_tokens', cache_write_tokens)):
+        timings[field] = timings.get(field, 0) + (value or 0)
+
+
+def record_anthropic_usage(timings, started, usage, first_token_at=None):
+    """按 Anthropic 响应中的 usage 记录用量"""
+    record_usage(
+        timings, started,
+        input_tokens=getattr(usage, 'input_tokens', 0),
+        output_tokens=getattr(usage, 'output_tokens', 0),
+        cache_read_tokens=getattr(usage, 'cache_read_input_tokens', 0),
+        cache_write_tokens=getattr(usage, 'cache_creation_input_tokens', 0),
+        first_token_at=first_token_at,
+    )
+
+
+def record_gemini_usage(timings, started, usage_metadata, first_token_at=None):
+    """按 Gemini 响应中的 usage_metadata 记录用量（prompt_token_count 包含缓存部分）"""
+    cached = getattr(usage_metadata, 'cached_content_token_count', 0) or 0
+    record_usage(
+        timings, started,
+        input_tokens=(getattr(usage_metadata, 'prompt_token_count', 0) or 0) - cached,
+        output_tokens=getattr(usage_metadata, 'candidates_token_count', 0),
+        cache_read_tokens=cached,
+        first_token_at=first_token_at,
+    )
+
+
+def format_usage(timings, min_cacheable_tokens=MIN_CACHEABLE_TOKENS):
+    """生成界面上显示的一行用量说明；多次调用时显示调用次数和平均耗时
+
+    min_cacheable_tokens 为所用模型的最小缓存长度，前缀未缓存时写在说明中。
+    """
+    calls = timings.get('api_calls', 0)
+    latency = timings.get('latency_ms', 0) / max(calls, 1) / 1000
+    text = f"⏱️ 调用 {calls} 次，平均耗时 {latency:.1f} 秒" if calls > 1 else f"⏱️ 耗时 {latency:.1f} 秒"
+    if 'ttft_ms' in timings:
+        text += f" ｜ 首字 {timings['ttft_ms'] / max(calls, 1) / 1000:.1f} 秒"
+    text += (f" ｜ 输入 {timings.get('input_tokens', 0)} tokens ｜ "
+             f"缓存读取 {timings.get('cache_read_tokens', 0)} tokens")
+    if timings.get('cache_write_tokens'):
+        text += f" ｜ 缓存写入 {timings['cache_write_tokens']} tokens"
+    text += f" ｜ 输出 {timings.get('output_tokens', 0)} tokens"
+    if timings.get('uncached_prefix_calls'):
+        text += f" ｜ 提示词前缀不足 {min_cacheable_tokens} tokens，未使用缓存"
+    return text
+
+
+def merge_usage(timings, other):
+    """把另一组用量累加到timings中（并发调用时每个请求单独记录，再在调用方线程中合并）"""
+    if timings is None:
+        return
+    for field, value in other.items():
+        timings[field] = timings.get(field, 0) + value
+
+
+# 调用 Anthropic
+def create_message(client, system, content, timings=None, **kwargs):
+    """以 system 为缓存前缀、content 为用户消息调用 messages.create，用量累加到timings中"""
+    started = time.perf_counter()
+    response = client.messages.create(
+        system=cached_system(system, timings),
+        messages=[{"role": "user", "content": content}],
+        **kwargs
+    )
+    record_anthropic_usage(timings, started, getattr(response, 'usage', None))
+    return response
+
+
+def stream_message(client, system, content, timings=None, **kwargs):
+    """与 create_message 相同，但以流式方式调用，逐段返回输出的文字；输出结束后记录用量和首字耗时"""
+    started = time.perf_counter()
+    first_token_at = None
+    with client.messages.stream(
+        system=cached_system(system, timings),
+        messages=[{"role": "user", "content": content}],
+        **kwargs
+    ) as stream:
+        for text in stream.text_stream:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield text
+        message = stream.get_final_message()
+    record_anthropic_usage(timings, started, getattr(message, 'usage', None), first_token_at)
+
+
+# Gemini 上下文缓存
+def gemini_cached_content(client, api_key, model, system, timings=None):
+    """返回 system 对应的 Gemini 缓存名称，有效期内复用；前缀太短或无法创建缓存时返回None
+
+    前缀短于 GEMINI_MIN_CACHEABLE_TOKENS 时不请求创建（在timings中记录 uncached_prefix_calls）。
+    同一个API Key、模型和前缀只创建一次；创建失败时在有效期内不再重试。
+    """
+    if estimate_tokens(system) < GEMINI_MIN_CACHEABLE_TOKENS:
+        _record_uncached_prefix(timings)
+        return None
+
+    from google.genai import types
+
+    key = hashlib.sha1("\x00".join([api_key, model, system]).encode("utf-8")).hexdigest()
+    with _gemini_lock:
+        key_lock = _gemini_key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        now = time.time()
+        with _gemini_lock:
+            cached = _gemini_caches.get(key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        try:
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system,
+                    ttl=f"{GEMINI_CACHE_TTL_SECONDS}s",
+                ),
+            )
+            name = cache.name
+        except Exception:
+            name = None
+        with _gemini_lock:
+            _gemini_caches[key] = (name, now + GEMINI_CACHE_TTL_SECONDS - GEMINI_CACHE_MARGIN_SECONDS)
+        return name
@@ -4,6 +4,7 @@ import io
 import base64
 import anthropic
 import mimetypes
+from prompt_cache import create_message, format_usage
 
 # 设置固定的 API key
 def process_image(uploaded_file):
@@ -106,12 +107,12 @@ if uploaded_file:
                 # 处理图片
                 image_content = process_image(uploaded_file)
                 
-                # 创建消息内容
+                # 固定的说明放在 system 中（短于最小缓存长度，目前不会缓存），用户消息中只有截图
                 message_content = [
                     image_content,
-                    {
-                        "type": "text",
-                        "text": """你正在帮助某人在与暗恋对象的对话中构思回复。你将获得聊天记录截图，生成三个简短的一句话回复。以下是你的任务：
+                    {"type": "text", "text": "这是聊天记录截图，请给出三个回复建议。"}
+                ]
+                system_prompt = """你正在帮助某人在与暗恋对象的对话中构思回复。你将获得聊天记录截图，生成三个简短的一句话回复。以下是你的任务：
 
 1. 分析对话，你需要关注：
 - 对话的语气和风格；
@@ -127,22 +128,22 @@ if uploaded_file:
 3 在三个 <suggestion>  </suggestion> 标签内提供您的回复建议。
 
 请在三个<suggestion></suggestion>标签内提供回复建议。不要包含任何解释或评论。"""
-                    }
-                ]
                 # 调用 API
                 if not anthropic_api_key:
                     st.error("请先输入你的Anthropic API密钥")
                     st.stop()
                 client = anthropic.Anthropic(api_key=anthropic_api_key)
-                message = client.messages.create(
+                call_timings = {}
+                message = create_message(
+                    client,
+                    system_prompt,
+                    message_content,
+                    timings=call_timings,
                     model="claude-3-5-sonnet-20241022",
                     max_tokens=1024,
-                    temperature=0.5,
-                    messages=[{
-                        "role": "user",
-                        "content": message_content
-                    }]
+                    temperature=0.5
                 )
+                st.session_state.last_usage = format_usage(call_timings)
                 
                 # 处理结果
                 suggestions = message.content[0].text.split("</suggestion>")
@@ -161,5 +162,7 @@ if uploaded_file:
     # 显示所有生成的建议
     if st.session_state.all_suggestions:
         st.write("### 所有建议的回复")
+        if st.session_state.get("last_usage"):
+            st.caption(st.session_state.last_usage)
         for i, suggestion in enumerate(st.session_state.all_suggestions, 1):
             st.text_area(f"建议 {i}", value=suggestion, height=100)
@@ -1,5 +1,7 @@
 import streamlit as st
 import anthropic
+from prompt_cache import format_usage, stream_message
+from tag_stream import TagStreamParser
 
 with st.sidebar:
     anthropic_api_key = st.text_input("Anthropic API Key", key="translator_api_key", type="password")
@@ -22,18 +24,10 @@ if formal_text and not anthropic_api_key:
     st.info("请先输入您的 Anthropic API Key 以继续使用")
 
 if st.button("开始润色") and formal_text and anthropic_api_key:
-    prompt = f"""你的任务是将一段书面化的中文文本转换成3个口语化的中文逐字口语转录文本，作为候选。这个过程需要你将正式的书面语言转化为更自然、更随意的口头表达方式。
+    # 固定的说明和示例放在 system 中（短于最小缓存长度，目前不会缓存），客户的问题和书面化回答放在用户消息中
+    system_prompt = """你的任务是将一段书面化的中文文本转换成3个口语化的中文逐字口语转录文本，作为候选。这个过程需要你将正式的书面语言转化为更自然、更随意的口头表达方式。
 
-客户的问题是：
-<question>
-{question}
-</question>
-
-以下是需要你转换的书面化中文文本作为问题的回答：
-
-<formal_text>
-{formal_text}
-</formal_text>
+用户会在<question>标签中给出客户的问题，在<formal_text>标签中给出需要你转换的书面化中文文本，作为问题的回答。
 
 请按照以下步骤进行转换：
 
@@ -73,36 +67,48 @@ if st.button("开始润色") and formal_text and anthropic_api_key:
 
 现在，请开始转换工作，将给定的书面化文本转换为口语化的表达。"""
 
+    user_prompt = f"""客户的问题是：
+<question>
+{question}
+</question>
+
+以下是需要你转换的书面化中文文本作为问题的回答：
+
+<formal_text>
+{formal_text}
+</formal_text>"""
+
     try:
         client = anthropic.Client(api_key=anthropic_api_key)
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ]
-        )
-        
+        call_timings = {}
+
         st.write("### 口语化润色结果")
-        text = response.content[0].text
-        
-        import re
-        versions = []
-        for i in range(1, 4):
-            pattern = f"<colloquial_text_{i}>(.*?)</colloquial_text_{i}>"
-            match = re.search(pattern, text, re.DOTALL)
-            if match:
-                versions.append(match.group(1).strip())
-        
-        if not versions:
+
+        # 流式输出时先以文字显示，某个版本输出完后换成可编辑的文本框
+        tags = [f"colloquial_text_{i}" for i in range(1, 4)]
+        slots = {}
+        parser = TagStreamParser(tags)
+        for chunk in stream_message(
+            client,
+            system_prompt,
+            user_prompt,
+            timings=call_timings,
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=1000
+        ):
+            for kind, tag, _ in parser.feed(chunk):
+                if kind == "open" and tag not in slots:
+                    st.write(f"**版本 {len(slots) + 1}:**")
+                    slots[tag] = st.empty()
+                    st.divider()
+                elif kind == "text":
+                    slots[tag].text(parser.sections[tag].strip())
+                elif kind == "close":
+                    slots[tag].text_area(f"版本 {list(slots).index(tag) + 1}", value=parser.result(tag), height=200)
+        parser.close()
+        st.caption(format_usage(call_timings))
+
+        if not parser.closed:
             st.error("未能正确解析AI返回的结果,请重试")
-        else:
-            for i, version in enumerate(versions, 1):
-                st.write(f"**版本 {i}:**")
-                st.text_area(f"版本 {i}", value=version, height=200)
-                st.divider()
     except Exception as e:
         st.error(f"发生错误: {str(e)}")
@@ -0,0 +1,86 @@
+"""流式输出中的标签解析
+
+模型按 <translation1>…</translation1>、<analysis>…</analysis> 这样的标签分段输出。
+TagStreamParser 逐段接收流式返回的文字，标签被切在两段之间时也能正确识别，
+每收到一段就返回新产生的事件，界面可以在第一个分段开始输出时就显示出来：
+
+    ("open", 标签名, "")       分段开始
+    ("text", 标签名, 新增文字)  分段内新增的文字
+    ("close", 标签名, "")      分段结束
+
+标签之外的文字（如模型的开场白）不产生事件。
+"""
+import re
+
+
+def _partial_start(text, tags):
+    """text 末尾可能是某个标签的开头（如 "<transla"）时返回该位置，否则返回 len(text)"""
+    longest = max(len(tag) for tag in tags)
+    for position in range(max(0, len(text) - longest + 1), len(text)):
+        if text[position] == "<" and any(tag.startswith(text[position:]) for tag in tags):
+            return position
+    return len(text)
+
+
+class TagStreamParser:
+    """增量解析指定名称的标签
+
+    sections 为 {标签名: 目前收到的文字}，closed 为已经结束的标签名。
+    同名标签再次出现时重新开始记录。
+    """
+
+    def __init__(self, tags):
+        self.tags = list(tags)
+        self.sections = {}
+        self.closed = set()
+        self.current = None
+        self._buffer = ""
+        self._open_re = re.compile("<(" + "|".join(re.escape(tag) for tag in self.tags) + ")>")
+        self._open_tags = [f"<{tag}>" for tag in self.tags]
+
+    def _text(self, events, text):
+        if text:
+            self.sections[self.current] += text
+            events.append(("text", self.current, text))
+
+    def feed(self, chunk):
+        """接收一段输出，返回新产生的事件列表"""
+        self._buffer += chunk or ""
+        events = []
+        while True:
+            if self.current is None:
+                match = self._open_re.search(self._buffer)
+                if match is None:
+                    # 标签外的文字丢弃，只保留可能是标签开头的部分
+                    self._buffer = self._buffer[_partial_start(self._buffer, self._open_tags):]
+                    return events
+                self.current = match.group(1)
+                self.sections[self.current] = ""
+                self.closed.discard(self.current)
+                events.append(("open", self.current, ""))
+                self._buffer = self._buffer[match.end():]
+            else:
+                closing = f"</{self.current}>"
+                end = self._buffer.find(closing)
+                if end < 0:
+                    keep = _partial_start(self._buffer, [closing])
+                    self._text(events, self._buffer[:keep])
+                    self._buffer = self._buffer[keep:]
+                    return events
+                self._text(events, self._buffer[:end])
+                self.closed.add(self.current)
+                events.append(("close", self.current, ""))
+                self.current = None
+                self._buffer = self._buffer[end + len(closing):]
+
+    def close(self):
+        """输出结束：没有结束标签的分段把剩余文字作为最后一段返回（不产生 close 事件）"""
+        events = []
+        if self.current is not None:
+            self._text(events, self._buffer)
+        self._buffer = ""
+        return events
+
+    def result(self, tag):
+        """已结束分段的文字（去掉首尾空白），没有结束时返回None"""
+        return self.sections[tag].strip() if tag in self.closed else None
@@ -0,0 +1,83 @@
+import json
+
+from fanyi_formats import dump_entries, load_entries
+
+
+def candidates_for(entries, suffix=""):
+    return {entry["text"]: [f"{entry['text']} A{suffix}", "B", "C"] for entry in entries}
+
+
+def test_strings_value_with_url_and_comment_markers():
+    data = '''/* 帮助 */
+"help" = "查看 https://example.com/help"; // 行尾注释
+"note" = "保留 /* 这一段 */ 文字";
+// "ignored" = "注释中的条目";
+"title" = "标题";
+'''.encode("utf-8")
+    entries = load_entries("Localizable.strings", data)
+    assert [(entry["key"], entry["text"]) for entry in entries] == [
+        ("help", "查看 https://example.com/help"),
+        ("note", "保留 /* 这一段 */ 文字"),
+        ("title", "标题"),
+    ]
+
+    output = dump_entries("Localizable.strings", entries, candidates_for(entries)).decode("utf-8")
+    reloaded = load_entries("Localizable.strings", output.encode("utf-8"))
+    assert [entry["key"] for entry in reloaded] == ["help", "note", "title"]
+    assert reloaded[0]["text"] == "查看 https://example.com/help A"
+
+
+def test_json_dotted_key_and_nested_key_do_not_collide():
+    data = json.dumps({"a.b": "点号键", "a": {"b": "嵌套键"}}, ensure_ascii=False).encode("utf-8")
+    entries = load_entries("zh.json", data)
+    assert len(entries) == 2
+
+    output = json.loads(dump_entries("zh.json", entries, candidates_for(entries)))
+    assert output["a.b"][0] == "点号键 A"
+    assert output["a"]["b"][0] == "嵌套键 A"
+
+
+def test_json_string_lists_are_translated():
+    data = json.dumps({"tips": ["第一条", "第二条"], "count": 3, "menu": {"items": [{"label": "设置"}]}},
+                      ensure_ascii=False).encode("utf-8")
+    entries = load_entries("zh.json", data)
+    assert sorted(entry["text"] for entry in entries) == ["第一条", "第二条", "设置"]
+
+    output = json.loads(dump_entries("zh.json", entries, candidates_for(entries)))
+    assert [item[0] for item in output["tips"]] == ["第一条 A", "第二条 A"]
+    assert output["menu"]["items"][0]["label"][0] == "设置 A"
+    assert output["count"] == 3
+
+
+PO_SOURCE = '''# 原文件注释
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+"Language: zh_CN\\n"
+"Plural-Forms: nplurals=1; plural=0;\\n"
+
+#: main.c:10
+msgid "打开"
+msgstr ""
+
+#, c-format
+msgid "%d 个文件"
+msgid_plural "%d 个文件"
+msgstr[0] ""
+'''
+
+
+def test_po_header_round_trips_and_plurals_are_flagged():
+    entries = load_entries("zh.po", PO_SOURCE.encode("utf-8"))
+    assert [entry["text"] for entry in entries] == ["打开", "%d 个文件"]
+
+    output = dump_entries("zh.po", entries, {"打开": ["Open", "Open File", "Launch"],
+                                              "%d 个文件": ["%d file", "%d files", "%d items"]}).decode("utf-8")
+    header = PO_SOURCE.split("\n\n")[0]
+    assert output.startswith(header + "\n\n")
+    assert 'msgstr "Open"' in output
+
+    plural_block = output.split("\n\n")[2]
+    assert "#, c-format, fuzzy" in plural_block
+    assert 'msgstr[0] "%d file"' in plural_block
+    assert 'msgstr[1] ""' in plural_block
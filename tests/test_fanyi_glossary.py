@@ -0,0 +1,20 @@
+from fanyi_glossary import Glossary, follows_glossary
+
+
+def test_memory_candidates_must_follow_glossary():
+    glossary = Glossary([("会员", "Member"), ("注册", "Sign Up|Register")])
+    terms = glossary.find("注册会员")
+
+    assert follows_glossary(["Register as a member", "Sign up for membership", "Sign up as a member"], terms)
+    assert not follows_glossary(["Join now", "Register as a member", "Become a member"], terms)
+    assert follows_glossary(["Anything"], glossary.find("你好"))
+
+
+def test_overlapping_terms_take_leftmost_longest():
+    glossary = Glossary([("注册", "Sign Up"), ("注册账号", "Create Account"), ("账号", "Account"),
+                         ("号码", "Number")])
+
+    assert [match["zh"] for match in glossary.find("注册账号")] == ["注册账号"]
+    # "账号码" 中 "账号" 从更左边开始，"号码" 与它重叠被跳过
+    assert [match["zh"] for match in glossary.find("先注册再填账号码")] == ["注册", "账号"]
+    assert [match["zh"] for match in glossary.find("注册账号后绑定账号")] == ["注册账号", "账号"]
@@ -0,0 +1,51 @@
+import random
+
+from fanyi_memory import TranslationMemory, ngrams, normalize
+
+
+def test_placeholders_are_part_of_the_key():
+    memory = TranslationMemory(":memory:")
+    memory.store("欢迎", ["Welcome", "Hi", "Hello"])
+
+    assert memory.lookup("欢迎%@") is None
+    assert memory.lookup("欢迎，{name}！") is None
+    assert memory.lookup("<b>欢迎</b>") is None
+    # 标点和空白不同仍是同一条原文
+    assert memory.lookup("欢迎！") == ["Welcome", "Hi", "Hello"]
+
+    memory.store("欢迎%@", ["Welcome %@", "Hi %@", "Hello %@"])
+    assert memory.lookup("欢迎，%@！") == ["Welcome %@", "Hi %@", "Hello %@"]
+    assert memory.lookup("欢迎%d") is None
+
+
+def test_entry_saved_under_old_key_needs_same_placeholders():
+    memory = TranslationMemory(":memory:")
+    # 旧版本的键去掉了占位符
+    memory._conn.execute(
+        "INSERT INTO memory (normalized, source, translations, gram_count, updated_at) VALUES (?, ?, ?, 1, 0)",
+        (normalize("欢迎"), "欢迎%@", '["Welcome %@", "Hi %@", "Hello %@"]'))
+    assert memory.lookup("欢迎") is None
+
+
+def test_fuzzy_matches_brute_force_dice():
+    rng = random.Random(7)
+    alphabet = "注册账号登录会员欢迎使用设置密码"
+    memory = TranslationMemory(":memory:")
+    corpus = {}
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 10)))
+        corpus[normalize(text)] = text
+    memory.store_many({text: [text] for text in corpus.values()})
+
+    for _ in range(50):
+        query = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 10)))
+        for threshold in (0.3, 0.5, 0.8):
+            query_grams = ngrams(normalize(query))
+            expected = set()
+            for normalized, text in corpus.items():
+                grams = ngrams(normalized)
+                similarity = 2 * len(query_grams & grams) / (len(query_grams) + len(grams))
+                if normalized != normalize(query) and similarity >= threshold:
+                    expected.add((text, round(similarity, 3)))
+            found = memory.fuzzy(query, threshold, limit=len(corpus))
+            assert {(match["source"], match["similarity"]) for match in found} == expected
@@ -0,0 +1,61 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import ocr_batch
+from ocr_batch import load_checkpoint
+
+
+def write_records(path, records, tail=""):
+    path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records) + tail,
+                    encoding="utf-8")
+
+
+def test_checkpoint_skips_only_successful_notes(tmp_path):
+    output = tmp_path / "results.jsonl"
+    write_records(output, [
+        {"url": "https://xhslink.com/ok", "images": [{"status": "ok"}, {"status": "timeout"}]},
+        {"url": "https://xhslink.com/no-images", "images": []},
+        {"url": "https://xhslink.com/fetch-error", "error": "抓取失败"},
+        {"url": "https://xhslink.com/all-failed", "images": [{"status": "error"}, {"status": "timeout"}]},
+    ], tail='{"url": "https://xhslink.com/partial"')
+
+    assert load_checkpoint(str(output)) == {"https://xhslink.com/ok", "https://xhslink.com/no-images"}
+    # 末尾不完整的记录被截断
+    assert output.read_text(encoding="utf-8").endswith("\n")
+
+
+def test_failed_notes_are_retried(tmp_path, monkeypatch):
+    output = tmp_path / "results.jsonl"
+    write_records(output, [
+        {"url": "https://xhslink.com/ok", "images": [{"status": "ok"}]},
+        {"url": "https://xhslink.com/failed", "error": "抓取失败"},
+    ])
+    processed = []
+
+    def fake_process_note(url, *args):
+        processed.append(url)
+        return {"url": url, "note_id": None, "images": [{"status": "ok"}], "summary": ""}
+
+    monkeypatch.setattr(ocr_batch, "process_note", fake_process_note)
+    ocr_batch.run_batch(["https://xhslink.com/ok", "https://xhslink.com/failed"], str(output), None, "model",
+                        log=lambda message: None)
+
+    assert processed == ["https://xhslink.com/failed"]
+    # 重试成功后追加的记录使该链接在下次运行时跳过
+    assert load_checkpoint(str(output)) == {"https://xhslink.com/ok", "https://xhslink.com/failed"}
+
+
+def test_records_keep_page_image_urls(monkeypatch):
+    page_url = "https://sns-webpic-qc.xhscdn.com/202401/abc/1040g2sg30batchtier!nd_dft_wlteh_webp_3"
+    submitted = []
+    monkeypatch.setattr(ocr_batch, "fetch_xhs_content",
+                        lambda *args: {"title": "标题", "description": "", "images": [page_url]})
+    monkeypatch.setattr(ocr_batch, "extract_text_with_cache",
+                        lambda img_url, *args, **kwargs: submitted.append(img_url) or "识别出的文字")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        record = ocr_batch.process_note("https://www.xiaohongshu.com/explore/abc", None, "model", pool, None,
+                                        "agent", image_tier="small")
+    # 识别使用较小的规格，记录中仍是页面中的链接
+    assert submitted[0] != page_url
+    assert record["images"][0]["url"] == page_url
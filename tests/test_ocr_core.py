@@ -0,0 +1,203 @@
+import io
+
+import pytest
+from PIL import Image
+
+import ocr_core
+from ocr_core import apply_image_tier, ocr_cache_key, resolve_image_url
+
+
+SIGNED_URL = "https://sns-webpic-qc.xhscdn.com/202401/abc/1040g2sg30tiertest!nd_dft_wlteh_webp_3"
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.heads = []
+        self.gets = []
+
+    def head(self, url, **kwargs):
+        self.heads.append(url)
+        return FakeResponse(self.status_code)
+
+    def get(self, url, **kwargs):
+        self.gets.append(url)
+        return FakeResponse(self.status_code)
+
+
+def test_cache_key_depends_on_image_tier():
+    variant = apply_image_tier([SIGNED_URL], "small")[0]
+    assert "!nd_prv_wlteh_webp_3" in variant
+    assert ocr_cache_key(variant, "model") != ocr_cache_key(SIGNED_URL, "model")
+    # 换了CDN节点的同一张原图仍共用缓存
+    other_host = SIGNED_URL.replace("sns-webpic-qc", "sns-webpic-bd")
+    assert ocr_cache_key(other_host, "model") == ocr_cache_key(SIGNED_URL, "model")
+
+
+def test_head_probe_runs_once_per_image(monkeypatch):
+    session = FakeSession(404)
+    monkeypatch.setattr(ocr_core, "get_http_session", lambda: session)
+    url = SIGNED_URL.replace("tiertest", "probetest")
+    variant = apply_image_tier([url], "small")[0]
+    other_host = apply_image_tier([url.replace("sns-webpic-qc", "sns-webpic-bd")], "small")[0]
+
+    assert resolve_image_url(variant) == url
+    assert resolve_image_url(variant) == url
+    assert resolve_image_url(other_host) != other_host
+    assert len(session.heads) == 1
+    # 规格不存在时实际识别的是原图，与原图共用缓存
+    assert ocr_cache_key(variant, "model") == ocr_cache_key(url, "model")
+
+
+def test_downloads_stop_at_deadline(monkeypatch):
+    session = FakeSession(200)
+    monkeypatch.setattr(ocr_core, "get_http_session", lambda: session)
+    expired = ocr_core.make_deadline(60) - 120
+
+    with pytest.raises(ocr_core.OCRDeadlineExceeded):
+        ocr_core.download_image(SIGNED_URL, deadline=expired)
+    urls = [SIGNED_URL, SIGNED_URL.replace("tiertest", "other")]
+    assert ocr_core.dedupe_similar_images(urls, deadline=expired) == (urls, {})
+    assert ocr_core.prepare_inline_image(SIGNED_URL, deadline=expired) == SIGNED_URL
+    assert session.gets == []
+
+
+def test_page_state_is_decoded_once_with_spaced_undefined(monkeypatch):
+    state = ('{"user": {"avatar": undefined}, "feed": [ undefined , {"cover": {"urlDefault": '
+             '"https://sns-webpic-qc.xhscdn.com/202401/abc/1040g2sg30pagetest!nd_dft_wlteh_webp_3"}}],'
+             ' "extra":\n  undefined}')
+    html = f"<html><head><title>标题</title></head><body><script>window.__INITIAL_STATE__={state}</script></body></html>"
+    calls = []
+    load_js_object = ocr_core._load_js_object
+    monkeypatch.setattr(ocr_core, "_load_js_object", lambda *args: calls.append(args) or load_js_object(*args))
+
+    content = ocr_core.parse_xhs_page(html)
+    assert len(calls) == 1
+    assert any("pagetest" in img_url for img_url in content["images"])
+
+
+def test_cached_result_is_keyed_by_the_image_actually_recognized(monkeypatch):
+    monkeypatch.setattr(ocr_core, "get_http_session", lambda: FakeSession(404))
+    submitted = []
+    monkeypatch.setattr(ocr_core, "extract_text_from_image_doubao",
+                        lambda submit_url, *args, **kwargs: submitted.append(submit_url) or "识别出的文字")
+    cache = ocr_core.OCRCache(":memory:")
+    url = SIGNED_URL.replace("tiertest", "keytest")
+    variant = apply_image_tier([url], "small")[0]
+
+    for _ in range(3):
+        assert ocr_core.extract_text_with_cache(variant, None, "model", cache) == "识别出的文字"
+    assert submitted == [url]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # 进程重启后不知道规格是否存在，仍能命中原图的结果且不发请求
+    monkeypatch.setattr(ocr_core, "_image_variant_probes", ocr_core.OrderedDict())
+    monkeypatch.setattr(ocr_core, "get_http_session", lambda: pytest.fail("命中缓存时不应发请求"))
+    assert ocr_core.extract_text_with_cache(variant, None, "model", cache) == "识别出的文字"
+    assert submitted == [url]
+
+
+def png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageSession:
+    """a.png 与 b.png 的渐变方向相反，两张图片不会被合并"""
+
+    def __init__(self):
+        self.gets = []
+        self.images = {
+            "https://example.com/a.png": png_bytes(Image.linear_gradient("L").rotate(90)),
+            "https://example.com/b.png": png_bytes(Image.linear_gradient("L").rotate(-90)),
+        }
+
+    def get(self, url, **kwargs):
+        self.gets.append(url)
+        return FakeResponse(200, self.images[url])
+
+
+def test_dedupe_downloads_are_reused_by_text_filter(monkeypatch):
+    session = ImageSession()
+    monkeypatch.setattr(ocr_core, "get_http_session", lambda: session)
+    urls = ["https://example.com/a.png", "https://example.com/b.png"]
+
+    downloads = {}
+    kept, duplicates = ocr_core.dedupe_similar_images(urls, downloads=downloads)
+    assert kept == urls and set(downloads) == set(urls)
+
+    events = list(ocr_core.extract_texts_concurrently(kept, None, "model", downloads=downloads,
+                                                      text_min_score=2.0))
+    assert sorted(idx for event, idx, _ in events if event == "done") == [0, 1]
+    assert all(data[1].get("skipped") for _, _, data in events)
+    assert sorted(session.gets) == urls
+    assert downloads == {}
+
+
+def test_dedupe_skips_images_with_cached_results(monkeypatch):
+    session = ImageSession()
+    monkeypatch.setattr(ocr_core, "get_http_session", lambda: session)
+    cache = ocr_core.OCRCache(":memory:")
+    urls = ["https://example.com/a.png", "https://example.com/b.png"]
+    for img_url in urls:
+        cache.set(ocr_core.ocr_cache_key(img_url, "model"), "识别出的文字")
+
+    cached = {img_url for img_url in urls if ocr_core.ocr_cache_contains(cache, img_url, "model")}
+    assert cached == set(urls)
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert ocr_core.dedupe_similar_images(urls, skip=cached) == (urls, {})
+    assert session.gets == []
+
+
+def test_retry_after_is_capped_and_bounded_by_deadline():
+    import http.server
+    import threading
+    import time
+
+    class Throttled(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(429)
+            self.send_header("Retry-After", "3600")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Throttled)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        retry = ocr_core.get_http_session().get_adapter("http://").max_retries
+        response = type("Response", (), {"headers": {"Retry-After": "3600"}})()
+        assert retry.get_retry_after(response) == ocr_core.HTTP_MAX_RETRY_AFTER
+
+        started = time.monotonic()
+        content = ocr_core.fetch_xhs_content(f"http://127.0.0.1:{server.server_port}/explore/abc",
+                                             deadline=ocr_core.make_deadline(2))
+        assert "超时" in content["error"]
+        assert time.monotonic() - started < 2
+    finally:
+        server.shutdown()
+
+
+def test_batch_response_is_split_by_image_tags():
+    text = ("前言<image_2>第二张</image_2>\n<image_1> 无文字 </image_1>"
+            "<image_3></image_3><image_5>越界</image_5><image_2>重复</image_2><image_4>未闭合")
+    assert ocr_core.parse_batch_ocr_response(text, 4) == ["未识别到文字", "第二张", "未识别到文字", None]
+    assert ocr_core.parse_batch_ocr_response(None, 2) == [None, None]
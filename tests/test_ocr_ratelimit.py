@@ -0,0 +1,60 @@
+import types
+
+import ocr_ratelimit
+from ocr_ratelimit import AdaptiveRateLimiter
+
+
+def fake_clock(monkeypatch, start=100.0):
+    clock = {"now": start}
+
+    def sleep(seconds):
+        clock["now"] += seconds
+
+    monkeypatch.setattr(ocr_ratelimit, "time", types.SimpleNamespace(monotonic=lambda: clock["now"], sleep=sleep))
+    return clock
+
+
+def test_throttles_within_cooldown_decrease_once(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    limiter = AdaptiveRateLimiter(rate=8.0, min_rate=0.5, decrease_factor=0.5, cooldown_seconds=1.0)
+
+    # 同时在途的请求一起被限流
+    for _ in range(5):
+        limiter.on_throttle(retry_after=0.1)
+    assert limiter.rate == 4.0
+    assert limiter.stats()["throttled"] == 5
+
+    clock["now"] += 0.5
+    limiter.on_throttle(retry_after=0.1)
+    assert limiter.rate == 4.0
+
+    clock["now"] += 0.5
+    limiter.on_throttle(retry_after=0.1)
+    assert limiter.rate == 2.0
+
+    for _ in range(4):
+        clock["now"] += 1.0
+        limiter.on_throttle(retry_after=0.1)
+    assert limiter.rate == 0.5
+
+
+def test_success_increases_rate_additively_up_to_max(monkeypatch):
+    fake_clock(monkeypatch)
+    limiter = AdaptiveRateLimiter(rate=1.0, max_rate=1.25, increase_step=0.1)
+    limiter.on_success()
+    assert round(limiter.rate, 2) == 1.1
+    for _ in range(5):
+        limiter.on_success()
+    assert limiter.rate == 1.25
+    assert limiter.stats() == {"rate": 1.25, "successes": 6, "throttled": 0}
+
+
+def test_acquire_waits_for_pause(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    limiter = AdaptiveRateLimiter(rate=10.0, burst=2)
+    assert limiter.acquire() and limiter.acquire()
+
+    limiter.on_throttle(retry_after=3.0)
+    assert not limiter.acquire(timeout=1.0)
+    assert limiter.acquire()
+    assert clock["now"] >= 103.0
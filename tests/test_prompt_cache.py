@@ -0,0 +1,53 @@
+import sys
+import types
+
+import prompt_cache
+from prompt_cache import CACHE_CONTROL, MIN_CACHEABLE_TOKENS, cached_system, estimate_tokens, format_usage
+
+
+def test_short_prefix_is_not_marked_and_report_says_so():
+    timings = {}
+    blocks = cached_system("你是一位专业的翻译。", timings)
+    assert "cache_control" not in blocks[0]
+    assert f"不足 {MIN_CACHEABLE_TOKENS} tokens" in format_usage(timings)
+
+
+def test_long_prefix_is_marked():
+    prefix = "示例：" * MIN_CACHEABLE_TOKENS
+    assert estimate_tokens(prefix) >= MIN_CACHEABLE_TOKENS
+    timings = {}
+    assert cached_system(prefix, timings)[0]["cache_control"] == CACHE_CONTROL
+    assert "未使用缓存" not in format_usage(timings)
+
+
+def test_short_gemini_prefix_does_not_create_cache():
+    class Caches:
+        def create(self, **kwargs):
+            raise AssertionError("前缀太短时不应请求创建缓存")
+
+    client = type("Client", (), {"caches": Caches()})()
+    timings = {}
+    assert prompt_cache.gemini_cached_content(client, "key", "model", "你是一位简历顾问。", timings) is None
+    assert "不足 4096 tokens" in format_usage(timings, prompt_cache.GEMINI_MIN_CACHEABLE_TOKENS)
+
+
+def test_gemini_cache_creation_does_not_hold_global_lock(monkeypatch):
+    genai_types = types.SimpleNamespace(CreateCachedContentConfig=lambda **kwargs: kwargs)
+    monkeypatch.setitem(sys.modules, "google.genai", types.SimpleNamespace(types=genai_types))
+    monkeypatch.setattr(prompt_cache, "_gemini_caches", {})
+    lock_free = []
+
+    class Caches:
+        def create(self, **kwargs):
+            # 创建请求进行时，其他前缀的调用仍能取得全局锁
+            acquired = prompt_cache._gemini_lock.acquire(blocking=False)
+            lock_free.append(acquired)
+            if acquired:
+                prompt_cache._gemini_lock.release()
+            return type("Cache", (), {"name": "cachedContents/1"})()
+
+    client = type("Client", (), {"caches": Caches()})()
+    prefix = "示例：" * prompt_cache.GEMINI_MIN_CACHEABLE_TOKENS
+    assert prompt_cache.gemini_cached_content(client, "key", "model", prefix) == "cachedContents/1"
+    assert prompt_cache.gemini_cached_content(client, "key", "model", prefix) == "cachedContents/1"
+    assert lock_free == [True]
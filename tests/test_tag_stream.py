@@ -0,0 +1,49 @@
+from tag_stream import TagStreamParser
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_tags_split_across_chunks():
+    parser = TagStreamParser(["translation1", "analysis"])
+    text = "好的，以下是译文：<translation1>Sign up</translation1>\n<analysis>简洁</analysis>"
+    # 逐字输入，每个标签都被切开
+    events = feed_all(parser, list(text)) + parser.close()
+
+    assert [event for event in events if event[0] != "text"] == [
+        ("open", "translation1", ""), ("close", "translation1", ""),
+        ("open", "analysis", ""), ("close", "analysis", ""),
+    ]
+    assert "".join(chunk for event, tag, chunk in events if tag == "translation1") == "Sign up"
+    assert parser.result("translation1") == "Sign up"
+    assert parser.result("analysis") == "简洁"
+
+
+def test_text_outside_tags_and_unknown_tags_are_ignored():
+    parser = TagStreamParser(["translation1"])
+    events = feed_all(parser, ["<b>前言</b> <transl", "ation2>x</translation2> <translation1>", "Hi</translation1>尾声"])
+
+    assert events == [("open", "translation1", ""), ("text", "translation1", "Hi"), ("close", "translation1", "")]
+    assert parser.close() == []
+
+
+def test_unclosed_section_is_flushed_on_close():
+    parser = TagStreamParser(["analysis"])
+    events = feed_all(parser, ["<analysis>未完", "的分析</anal"])
+    # 可能是结束标签开头的部分先保留
+    assert "".join(chunk for event, _, chunk in events if event == "text") == "未完的分析"
+
+    assert parser.close() == [("text", "analysis", "</anal")]
+    assert parser.sections["analysis"] == "未完的分析</anal"
+    assert parser.result("analysis") is None
+
+
+def test_repeated_tag_starts_over():
+    parser = TagStreamParser(["translation1"])
+    feed_all(parser, ["<translation1>旧</translation1>", "<translation1>新"])
+    assert parser.result("translation1") is None
+    assert parser.sections["translation1"] == "新"